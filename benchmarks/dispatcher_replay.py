@@ -0,0 +1,278 @@
+"""
+Replays synthetic update streams through the real dispatcher.
+
+Usage: python benchmarks/dispatcher_replay.py [--users 1000] [--orders 5000]
+       [--concurrency 50] [--scenario all|orders|manager]
+
+main.dp runs with every router from handlers.setup_handlers, UserMiddleware
+and the background services, on a throwaway SQLite database. The bot talks
+to a fake session that records API calls instead of calling Telegram.
+
+Scenarios:
+    orders   every user walks through the exchange flow and creates an order
+    manager  a manager opens the active order list and pages through it
+             while --orders orders are active
+
+For each scenario the harness reports throughput, p50/p95/p99 latency of
+dp.feed_update and the number of SQL statements per update.
+"""
+import argparse
+import asyncio
+import itertools
+import logging
+import os
+import sys
+import tempfile
+import time
+from datetime import datetime, timedelta
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+BENCH_DIR = tempfile.mkdtemp(prefix="changify-bench-")
+os.environ.setdefault('BOT_TOKEN', '0:benchmark')
+os.environ['DB_NAME'] = os.path.join(BENCH_DIR, 'bench.db')
+os.environ['MANAGER_IDS'] = '900'
+os.environ['BOT_MODE'] = 'polling'
+
+from aiogram import methods, types
+from aiogram.client.session.base import BaseSession
+from sqlalchemy import event
+
+import main
+from database.db_operations import get_session
+from database.models import Bank, Currency, Order, OrderStatus, User
+from handlers import setup_handlers
+
+MANAGER_ID = 900
+FIRST_USER_ID = 100000
+
+ORDER_FLOW = [
+    ('message', "/start"),
+    ('message', "🔄 Обмін валют"),
+    ('callback', "currency:from:USDT"),
+    ('callback', "currency:to:UAH"),
+    ('message', "100"),
+    ('callback', "bank:1"),
+    ('message', "4111 1111 1111 1111"),
+]
+
+
+class FakeSession(BaseSession):
+    """Answers every Bot API call locally and keeps the sent requests"""
+
+    def __init__(self):
+        super().__init__()
+        self.calls = []
+        self._message_ids = itertools.count(1)
+
+    async def make_request(self, bot, method, timeout=None):
+        self.calls.append(method)
+        if isinstance(method, methods.SendMessage):
+            return types.Message(
+                message_id=next(self._message_ids),
+                date=datetime.now(),
+                chat=types.Chat(id=method.chat_id, type='private'),
+                text=method.text
+            )
+        if isinstance(method, methods.GetMe):
+            return types.User(id=1, is_bot=True, first_name="bench", username="bench_bot")
+        return True
+
+    async def stream_content(self, url, headers=None, timeout=30, chunk_size=65536, raise_for_status=True):
+        yield b""
+
+    async def close(self):
+        pass
+
+
+class UpdateFactory:
+    def __init__(self):
+        self._ids = itertools.count(1)
+
+    def _user(self, user_id):
+        return {"id": user_id, "is_bot": False, "first_name": f"Bench{user_id}", "username": f"bench{user_id}"}
+
+    def message(self, user_id, text):
+        update_id = next(self._ids)
+        return types.Update.model_validate({
+            "update_id": update_id,
+            "message": {
+                "message_id": update_id,
+                "date": int(time.time()),
+                "chat": {"id": user_id, "type": "private"},
+                "from": self._user(user_id),
+                "text": text,
+            },
+        }, context={"bot": main.bot})
+
+    def callback(self, user_id, data):
+        update_id = next(self._ids)
+        return types.Update.model_validate({
+            "update_id": update_id,
+            "callback_query": {
+                "id": str(update_id),
+                "chat_instance": "bench",
+                "from": self._user(user_id),
+                "data": data,
+                "message": {
+                    "message_id": update_id,
+                    "date": int(time.time()),
+                    "chat": {"id": user_id, "type": "private"},
+                    "text": "bench",
+                },
+            },
+        }, context={"bot": main.bot})
+
+    def build(self, user_id, kind, value):
+        return self.message(user_id, value) if kind == 'message' else self.callback(user_id, value)
+
+
+class Recorder:
+    def __init__(self, engine):
+        self.latencies = []
+        self.statements = 0
+        event.listen(engine, "before_cursor_execute", self._count)
+
+    def _count(self, conn, cursor, statement, parameters, context, executemany):
+        self.statements += 1
+
+    async def feed(self, update):
+        started = time.perf_counter()
+        await main.dp.feed_update(main.bot, update)
+        self.latencies.append(time.perf_counter() - started)
+
+
+def percentile(values, fraction):
+    return values[min(len(values) - 1, int(len(values) * fraction))]
+
+
+def report(name, recorder, elapsed, api_calls):
+    latencies = sorted(recorder.latencies)
+    count = len(latencies)
+    print(
+        f"{name:<28} updates={count:<6} {count / elapsed:>8.1f} upd/s  "
+        f"p50={percentile(latencies, 0.50) * 1000:7.2f}ms "
+        f"p95={percentile(latencies, 0.95) * 1000:7.2f}ms "
+        f"p99={percentile(latencies, 0.99) * 1000:7.2f}ms  "
+        f"sql/update={recorder.statements / count:5.2f}  api calls={api_calls}"
+    )
+
+
+async def run_order_flows(users, concurrency, fake):
+    factory = UpdateFactory()
+    recorder = Recorder(main.engine)
+    semaphore = asyncio.Semaphore(concurrency)
+    calls_before = len(fake.calls)
+
+    async def user_flow(user_id):
+        # Steps of one user are sequential, like updates of one chat
+        async with semaphore:
+            for kind, value in ORDER_FLOW:
+                await recorder.feed(factory.build(user_id, kind, value))
+
+    started = time.perf_counter()
+    await asyncio.gather(*(user_flow(FIRST_USER_ID + i) for i in range(users)))
+    elapsed = time.perf_counter() - started
+    report(f"orders: {users} users", recorder, elapsed, len(fake.calls) - calls_before)
+
+
+def top_up_active_orders(target):
+    """Insert active orders directly until `target` of them exist"""
+    session = get_session(main.engine)
+    try:
+        active = session.query(Order).filter(Order.status == OrderStatus.CREATED).count()
+        missing = target - active
+        if missing <= 0:
+            return
+        usdt = session.query(Currency).filter_by(code="USDT").one()
+        uah = session.query(Currency).filter_by(code="UAH").one()
+        bank = session.query(Bank).filter_by(currency_id=uah.id).first()
+        users = [
+            User(telegram_id=FIRST_USER_ID * 10 + i, first_name=f"Seed{i}")
+            for i in range(max(1, missing // 5))
+        ]
+        session.add_all(users)
+        start = datetime(2025, 1, 1)
+        session.add_all([
+            Order(
+                user_id=users[i % len(users)].telegram_id,
+                from_currency_id=usdt.id,
+                to_currency_id=uah.id,
+                amount_from=100,
+                amount_to=4170,
+                rate=41.7,
+                status=OrderStatus.CREATED,
+                bank_id=bank.id,
+                details="4111111111111111",
+                created_at=start + timedelta(seconds=i),
+            )
+            for i in range(missing)
+        ])
+        session.commit()
+    finally:
+        session.close()
+
+
+def next_page_callback(fake, since):
+    for method in reversed(fake.calls[since:]):
+        markup = getattr(method, 'reply_markup', None)
+        for row in getattr(markup, 'inline_keyboard', None) or []:
+            for button in row:
+                data = button.callback_data or ""
+                if data.startswith("mgr_orders:") and button.text == "➡️":
+                    return data
+    return None
+
+
+async def run_manager_listing(orders, rounds, pages, fake):
+    top_up_active_orders(orders)
+    factory = UpdateFactory()
+    recorder = Recorder(main.engine)
+    calls_before = len(fake.calls)
+
+    started = time.perf_counter()
+    for _ in range(rounds):
+        since = len(fake.calls)
+        await recorder.feed(factory.message(MANAGER_ID, "📝 Заявки"))
+        for _ in range(pages):
+            data = next_page_callback(fake, since)
+            if data is None:
+                break
+            since = len(fake.calls)
+            await recorder.feed(factory.callback(MANAGER_ID, data))
+    elapsed = time.perf_counter() - started
+    report(f"manager: {orders} active", recorder, elapsed, len(fake.calls) - calls_before)
+
+
+async def run(args):
+    fake = FakeSession()
+    main.bot.session = fake
+    await main.on_startup()
+    setup_handlers(main.dp)
+    try:
+        if args.scenario in ('all', 'orders'):
+            await run_order_flows(args.users, args.concurrency, fake)
+        if args.scenario in ('all', 'manager'):
+            await run_manager_listing(args.orders, args.rounds, args.pages, fake)
+    finally:
+        await main.on_shutdown()
+
+
+def main_cli():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--scenario', choices=('all', 'orders', 'manager'), default='all')
+    parser.add_argument('--users', type=int, default=1000)
+    parser.add_argument('--orders', type=int, default=5000)
+    parser.add_argument('--concurrency', type=int, default=50)
+    parser.add_argument('--rounds', type=int, default=50, help="order list openings in the manager scenario")
+    parser.add_argument('--pages', type=int, default=5, help="pages flipped after each opening")
+    args = parser.parse_args()
+
+    # Per-update INFO logging would dominate the measurements
+    logging.disable(logging.INFO)
+    print(f"database: {os.environ['DB_NAME']}")
+    asyncio.run(run(args))
+
+
+if __name__ == "__main__":
+    main_cli()
@@ -0,0 +1,107 @@
+"""
+Time and peak memory of the /export reports.
+
+Usage: python benchmarks/order_export.py [N ...]
+
+Seeds a temporary SQLite database with N orders, a quarter of them in
+orders_archive, and runs every export in CSV. Peak memory (tracemalloc,
+in a second run) must stay flat while N grows: it depends on
+EXPORT_CHUNK_SIZE and on the number of turnover groups, not on N.
+"""
+import os
+import sys
+import tempfile
+import time
+import tracemalloc
+from datetime import datetime, timedelta
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+os.environ.setdefault('BOT_TOKEN', '0:benchmark')
+
+from sqlalchemy import create_engine, insert
+
+from database.models import ArchivedOrder, Base, Bank, Currency, CurrencyType, Order, OrderStatus, User, UserRole
+from services.order_export import EXPORTS
+from services.reference_data import reference_data
+
+STATUSES = [OrderStatus.COMPLETED, OrderStatus.COMPLETED, OrderStatus.COMPLETED, OrderStatus.CANCELLED]
+MANAGERS = [900, 901, 902]
+
+
+def seed(engine, n_orders):
+    with engine.begin() as conn:
+        conn.execute(insert(Currency), [
+            {'id': 1, 'code': "USDT", 'name': "Tether", 'type': CurrencyType.CRYPTO},
+            {'id': 2, 'code': "UAH", 'name': "Ukrainian Hryvnia", 'type': CurrencyType.FIAT},
+        ])
+        conn.execute(insert(Bank), [
+            {'id': i, 'name': name, 'currency_id': 2} for i, name in enumerate(("ПриватБанк", "Монобанк", "ПУМБ"), 1)
+        ])
+        conn.execute(insert(User), [
+            {'telegram_id': manager_id, 'first_name': f"Manager{manager_id}", 'role': UserRole.MANAGER}
+            for manager_id in MANAGERS
+        ])
+
+        start = datetime.now() - timedelta(days=365)
+        archived = n_orders // 4
+        for model, ids in ((ArchivedOrder, range(1, archived + 1)), (Order, range(archived + 1, n_orders + 1))):
+            batch = []
+            for i in ids:
+                created_at = start + timedelta(minutes=i * 525600 // n_orders)
+                batch.append({
+                    'id': i,
+                    'user_id': 100000 + i % 5000,
+                    'manager_id': MANAGERS[i % len(MANAGERS)],
+                    'from_currency_id': 1 + i % 2,
+                    'to_currency_id': 2 - i % 2,
+                    'amount_from': 100 + i % 1000,
+                    'amount_to': 4170 + i % 1000,
+                    'rate': "41.7",
+                    'status': STATUSES[i % len(STATUSES)],
+                    'bank_id': 1 + i % 3,
+                    'created_at': created_at,
+                    'updated_at': created_at + timedelta(minutes=30),
+                    'completed_at': created_at + timedelta(minutes=30) if i % 4 != 3 else None,
+                    'version': 1,
+                })
+                if len(batch) == 10000:
+                    conn.execute(insert(model), batch)
+                    batch = []
+            if batch:
+                conn.execute(insert(model), batch)
+
+
+def run(n_orders):
+    with tempfile.TemporaryDirectory() as directory:
+        engine = create_engine(f"sqlite:///{directory}/export.db")
+        Base.metadata.create_all(engine)
+        seed(engine, n_orders)
+        reference_data.load(engine)
+
+        results = []
+        for kind, export in EXPORTS.items():
+            path = Path(directory) / f"{kind}.csv"
+            started = time.perf_counter()
+            rows = export(engine, path, 'csv')
+            elapsed = time.perf_counter() - started
+
+            tracemalloc.start()
+            export(engine, path, 'csv')
+            peak = tracemalloc.get_traced_memory()[1]
+            tracemalloc.stop()
+            results.append((kind, rows, elapsed, peak))
+        engine.dispose()
+    return results
+
+
+def main():
+    sizes = [int(arg) for arg in sys.argv[1:]] or [10000, 100000, 500000]
+    print(f"{'orders':>8} {'export':>9} {'rows':>8} {'seconds':>8} {'peak MB':>8}")
+    for n in sizes:
+        for kind, rows, elapsed, peak in run(n):
+            print(f"{n:>8} {kind:>9} {rows:>8} {elapsed:>8.2f} {peak / 1024 ** 2:>8.1f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,96 @@
+"""
+Counts SQL statements issued to build the manager order list.
+
+Usage: python benchmarks/order_list_queries.py [N ...]
+
+Seeds an in-memory SQLite database with N active orders, loads them the
+way cmd_orders does and stores a message_id for each one. The statement
+count must stay flat while N grows.
+"""
+import os
+import sys
+from datetime import datetime, timedelta
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+os.environ.setdefault('BOT_TOKEN', '0:benchmark')
+
+from sqlalchemy import create_engine, event
+from sqlalchemy.orm import sessionmaker
+
+from database.models import Base, User, Currency, CurrencyType, Bank, Order, OrderStatus
+from utils.db_utils import load_orders_with_relations, save_order_message_ids
+
+ACTIVE_STATUSES = [OrderStatus.CREATED, OrderStatus.AWAITING_PAYMENT, OrderStatus.PAYMENT_CONFIRMED]
+
+
+def seed(session, n_orders):
+    usdt = Currency(code="USDT", name="Tether", type=CurrencyType.CRYPTO)
+    uah = Currency(code="UAH", name="Ukrainian Hryvnia", type=CurrencyType.FIAT)
+    session.add_all([usdt, uah])
+    session.flush()
+    banks = [Bank(name=name, currency_id=uah.id) for name in ("ПриватБанк", "Монобанк", "ПУМБ")]
+    session.add_all(banks)
+    users = [User(telegram_id=100000 + i, first_name=f"User{i}") for i in range(max(1, n_orders // 3))]
+    session.add_all(users)
+    session.flush()
+
+    start = datetime(2025, 1, 1)
+    session.add_all([
+        Order(
+            user_id=users[i % len(users)].telegram_id,
+            from_currency_id=usdt.id,
+            to_currency_id=uah.id,
+            amount_from=100,
+            amount_to=4170,
+            rate=41.7,
+            status=ACTIVE_STATUSES[i % len(ACTIVE_STATUSES)],
+            bank_id=banks[i % len(banks)].id,
+            details="4111111111111111",
+            created_at=start + timedelta(minutes=i),
+        )
+        for i in range(n_orders)
+    ])
+    session.commit()
+
+
+def count_queries(n_orders):
+    engine = create_engine("sqlite://")
+    Base.metadata.create_all(engine)
+    Session = sessionmaker(bind=engine, expire_on_commit=False)
+
+    with Session() as session:
+        seed(session, n_orders)
+
+    statements = []
+
+    @event.listens_for(engine, "before_cursor_execute")
+    def _count(conn, cursor, statement, parameters, context, executemany):
+        statements.append(statement)
+
+    with Session() as session:
+        orders = load_orders_with_relations(
+            session,
+            Order.status.in_(ACTIVE_STATUSES),
+            order_by=(Order.created_at,)
+        )
+        cards = [
+            (o.customer.first_name, o.from_currency.code, o.to_currency.code, o.bank.name)
+            for o in orders
+        ]
+        save_order_message_ids(session, {o.id: 1000 + o.id for o in orders})
+
+    assert len(cards) == n_orders
+    engine.dispose()
+    return len(statements)
+
+
+def main():
+    sizes = [int(arg) for arg in sys.argv[1:]] or [10, 100, 1000, 5000]
+    print(f"{'orders':>8} {'statements':>11}")
+    for n in sizes:
+        print(f"{n:>8} {count_queries(n):>11}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,123 @@
+"""
+Outbox drain and prune.
+
+Usage: python benchmarks/outbox_drain.py [N]
+
+Queues N (default 1000) notifications on a temporary SQLite database, one
+in ten of them to a chat that blocked the bot, next to rows given up on
+before and after the OUTBOX_RETENTION_DAYS cutoff and rows marked as sent
+by older versions. Drains the outbox through a notifier that sends
+nothing, then prunes it. Afterwards no delivered row may be left, only
+the recent rows given up on may remain. Exits with status 1 otherwise.
+"""
+import asyncio
+import logging
+import os
+import sys
+import tempfile
+import time
+from datetime import datetime, timedelta
+from pathlib import Path
+from zoneinfo import ZoneInfo
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+os.environ.setdefault('BOT_TOKEN', '0:benchmark')
+
+from aiogram.exceptions import TelegramForbiddenError
+from sqlalchemy import func, insert, select
+
+import config
+from database.db_operations import get_engine
+from database.models import Base, OutboxMessage
+from services.outbox import OutboxWorker
+
+BLOCKED = 13
+OLD = 5
+RECENT = 7
+LEGACY_SENT = 11
+
+
+class FakeNotifier:
+    def __init__(self):
+        self.sent = 0
+
+    async def deliver(self, chat_id, text, parse_mode=None, reply_markup=None):
+        if chat_id == BLOCKED:
+            raise TelegramForbiddenError(None, "Forbidden: bot was blocked by the user")
+        self.sent += 1
+
+
+def seed(engine, n_messages):
+    now = datetime.now(ZoneInfo("Europe/Kyiv")).replace(tzinfo=None)
+    retention = timedelta(days=config.OUTBOX_RETENTION_DAYS)
+    given_up = {'chat_id': BLOCKED, 'text': "given up", 'attempts': config.OUTBOX_MAX_ATTEMPTS}
+    with engine.begin() as conn:
+        conn.execute(insert(OutboxMessage), [
+            {'chat_id': BLOCKED if i % 10 == 0 else 100000 + i, 'text': f"Заявку #{i} прийнято", 'attempts': 0,
+             'next_attempt_at': now - timedelta(seconds=1)}
+            for i in range(n_messages)
+        ])
+        conn.execute(insert(OutboxMessage), [
+            {**given_up, 'next_attempt_at': now - retention - timedelta(hours=1)} for _ in range(OLD)
+        ] + [
+            {**given_up, 'next_attempt_at': now - retention + timedelta(hours=1)} for _ in range(RECENT)
+        ])
+        conn.execute(insert(OutboxMessage), [
+            {'chat_id': 1, 'text': "sent", 'attempts': 0, 'next_attempt_at': now - retention, 'sent_at': now - retention}
+            for _ in range(LEGACY_SENT)
+        ])
+
+
+def count(engine, *criteria):
+    with engine.connect() as conn:
+        return conn.scalar(select(func.count()).select_from(OutboxMessage).where(*criteria))
+
+
+async def drain(worker):
+    # The same rounds _run() does, without waiting between them
+    rounds = 0
+    while await worker.drain_once():
+        rounds += 1
+    return rounds
+
+
+def main():
+    n_messages = int(sys.argv[1]) if len(sys.argv) > 1 else 1000
+    # One "giving up" line per blocked message is expected here
+    logging.getLogger('services.outbox').setLevel(logging.CRITICAL)
+    blocked = len(range(0, n_messages, 10))
+    with tempfile.TemporaryDirectory() as directory:
+        engine = get_engine(f"sqlite:///{directory}/outbox.db")
+        Base.metadata.create_all(engine)
+        seed(engine, n_messages)
+
+        worker = OutboxWorker()
+        worker.engine = engine
+        worker.notifier = FakeNotifier()
+        started = time.perf_counter()
+        rounds = asyncio.run(drain(worker))
+        elapsed = time.perf_counter() - started
+        pruned = worker.prune()
+
+        left = count(engine)
+        sent_left = count(engine, OutboxMessage.sent_at.is_not(None))
+        pending = count(engine, OutboxMessage.attempts < config.OUTBOX_MAX_ATTEMPTS)
+        engine.dispose()
+
+    expected_left = blocked + RECENT
+    print(f"{n_messages} messages, OUTBOX_BATCH_SIZE={config.OUTBOX_BATCH_SIZE}, "
+          f"OUTBOX_RETENTION_DAYS={config.OUTBOX_RETENTION_DAYS:g}")
+    print(f"{'sent':>6} {'rounds':>7} {'seconds':>8} {'pruned':>7} {'left':>5} {'expected':>9} {'sent left':>10} {'pending':>8}")
+    print(f"{worker.notifier.sent:>6} {rounds:>7} {elapsed:>8.2f} {pruned:>7} {left:>5} {expected_left:>9} {sent_left:>10} {pending:>8}")
+    ok = (
+        worker.notifier.sent == n_messages - blocked
+        and pruned == OLD + LEGACY_SENT
+        and left == expected_left
+        and sent_left == 0
+        and pending == 0
+    )
+    sys.exit(0 if ok else 1)
+
+
+if __name__ == "__main__":
+    main()
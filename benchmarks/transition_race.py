@@ -0,0 +1,103 @@
+"""
+Concurrent order transitions beyond the DB thread pool.
+
+Usage: python benchmarks/transition_race.py [CALLERS]
+
+Runs CALLERS (default 2 * DB_EXECUTOR_WORKERS + 1) concurrent ACCEPTs with
+a customer notice on a temporary SQLite database, first all on one order,
+then each on its own order. Every caller must get True or False without
+an error, exactly one must win the shared order, every winner must have
+queued its notice, and nobody may wait for SQLITE_BUSY_TIMEOUT. Exits
+with status 1 otherwise.
+"""
+import asyncio
+import os
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+os.environ.setdefault('BOT_TOKEN', '0:benchmark')
+
+from sqlalchemy import func, insert, select
+
+import config
+from database.db_operations import get_async_session, get_engine
+from database.models import Base, Currency, CurrencyType, Order, OrderStatus, OutboxMessage
+from services.order_state import ACCEPT, transition
+
+
+def seed(engine, n_orders):
+    with engine.begin() as conn:
+        conn.execute(insert(Currency), [
+            {'id': 1, 'code': "USDT", 'name': "Tether", 'type': CurrencyType.CRYPTO},
+            {'id': 2, 'code': "UAH", 'name': "Ukrainian Hryvnia", 'type': CurrencyType.FIAT},
+        ])
+        conn.execute(insert(Order), [
+            {
+                'id': i, 'user_id': 100000 + i, 'from_currency_id': 1, 'to_currency_id': 2,
+                'amount_from': 100, 'amount_to': 4170, 'rate': "41.7",
+                'status': OrderStatus.CREATED, 'details': "4111111111111111",
+            }
+            for i in range(1, n_orders + 1)
+        ])
+
+
+async def accept(engine, order_id, manager_id):
+    async with get_async_session(engine) as session:
+        order = await session.get(Order, order_id)
+        # Let every caller load the order before anyone writes
+        await asyncio.sleep(0.05)
+        try:
+            return await transition(
+                session, order, ACCEPT,
+                notices=[(order.user_id, f"Заявку #{order.id} прийнято")],
+                manager_id=manager_id
+            )
+        except Exception as e:
+            return e
+
+
+async def race(engine, callers):
+    """Both cases in one event loop; returns False if any check failed"""
+    ok = True
+    for case, order_ids, expected in (
+        ('same', [1] * callers, 1),
+        # Order 1 was taken in the first case, so it is lost here
+        ('distinct', list(range(1, callers + 1)), callers - 1),
+    ):
+        with engine.begin() as conn:
+            conn.execute(OutboxMessage.__table__.delete())
+        started = time.perf_counter()
+        results = await asyncio.gather(*(accept(engine, order_id, 900 + i) for i, order_id in enumerate(order_ids)))
+        elapsed = time.perf_counter() - started
+        errors = [r for r in results if isinstance(r, Exception)]
+        won = sum(r is True for r in results)
+        lost = sum(r is False for r in results)
+        with engine.connect() as conn:
+            notices = conn.scalar(select(func.count()).select_from(OutboxMessage))
+        print(f"{case:>9} {won:>4} {lost:>5} {len(errors):>7} {notices:>8} {elapsed:>8.2f}")
+        for error in errors[:3]:
+            print(f"    {error!r}")
+        if errors or won != expected or notices != won or elapsed >= config.SQLITE_BUSY_TIMEOUT / 1000:
+            ok = False
+    return ok
+
+
+def main():
+    callers = int(sys.argv[1]) if len(sys.argv) > 1 else 2 * config.DB_EXECUTOR_WORKERS + 1
+    with tempfile.TemporaryDirectory() as directory:
+        engine = get_engine(f"sqlite:///{directory}/race.db")
+        Base.metadata.create_all(engine)
+        seed(engine, callers)
+
+        print(f"{callers} callers, DB_EXECUTOR_WORKERS={config.DB_EXECUTOR_WORKERS}")
+        print(f"{'case':>9} {'won':>4} {'lost':>5} {'errors':>7} {'notices':>8} {'seconds':>8}")
+        ok = asyncio.run(race(engine, callers))
+        engine.dispose()
+    sys.exit(0 if ok else 1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,126 @@
+"""
+Local stand-in for Telegram to exercise webhook mode.
+
+Usage:
+    python benchmarks/webhook_sender.py api [--port 8081]
+    python benchmarks/webhook_sender.py send [--url URL] [--secret S] [-n 500] [-c 50]
+
+`api` runs a fake Bot API that accepts every method and answers with a
+minimal valid result; start the bot with
+
+    BOT_MODE=webhook WEBHOOK_SECRET=S TELEGRAM_API_SERVER=http://127.0.0.1:8081
+
+`send` posts synthetic message updates from distinct users to the webhook
+endpoint the way Telegram does, with the secret token header, and reports
+status codes and response latency.
+"""
+import argparse
+import asyncio
+import itertools
+import statistics
+import time
+from collections import Counter
+
+from aiohttp import ClientSession, web
+
+TEXTS = ["/start", "📊 Курси валют", "👤 Профіль", "📋 Історія", "/help"]
+
+
+def fake_api_app():
+    message_ids = itertools.count(1)
+    calls = Counter()
+
+    async def handle(request):
+        method = request.match_info['method']
+        calls[method] += 1
+        form = await request.post()
+
+        if method == 'getMe':
+            result = {"id": 1, "is_bot": True, "first_name": "fake", "username": "fake_bot"}
+        elif method in ('sendMessage', 'sendPhoto', 'sendDocument'):
+            result = {
+                "message_id": next(message_ids),
+                "date": int(time.time()),
+                "chat": {"id": int(form.get('chat_id', 0)), "type": "private"},
+                "text": form.get('text', ''),
+            }
+        else:
+            result = True
+        return web.json_response({"ok": True, "result": result})
+
+    async def stats(request):
+        return web.json_response(dict(calls))
+
+    app = web.Application()
+    app.router.add_post('/bot{token}/{method}', handle)
+    app.router.add_get('/stats', stats)
+    return app
+
+
+def make_update(update_id, user_id, text):
+    user = {"id": user_id, "is_bot": False, "first_name": f"Load{user_id}"}
+    return {
+        "update_id": update_id,
+        "message": {
+            "message_id": update_id,
+            "date": int(time.time()),
+            "chat": {"id": user_id, "type": "private"},
+            "from": user,
+            "text": text,
+        },
+    }
+
+
+async def send_updates(url, secret, count, concurrency, users):
+    semaphore = asyncio.Semaphore(concurrency)
+    statuses = Counter()
+    latencies = []
+
+    async def post(http, update_id):
+        update = make_update(update_id, 10_000 + update_id % users, TEXTS[update_id % len(TEXTS)])
+        async with semaphore:
+            started = time.perf_counter()
+            async with http.post(url, json=update, headers={"X-Telegram-Bot-Api-Secret-Token": secret}) as response:
+                await response.read()
+                latencies.append(time.perf_counter() - started)
+                statuses[response.status] += 1
+
+    started = time.perf_counter()
+    async with ClientSession() as http:
+        await asyncio.gather(*(post(http, i) for i in range(1, count + 1)))
+    elapsed = time.perf_counter() - started
+
+    latencies.sort()
+    print(f"updates: {count}, concurrency: {concurrency}, elapsed: {elapsed:.2f}s, {count / elapsed:.0f} updates/s")
+    print(f"status codes: {dict(statuses)}")
+    print(
+        f"latency ms: p50={latencies[len(latencies) // 2] * 1000:.1f} "
+        f"p95={latencies[int(len(latencies) * 0.95) - 1] * 1000:.1f} "
+        f"mean={statistics.mean(latencies) * 1000:.1f}"
+    )
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    commands = parser.add_subparsers(dest='command', required=True)
+
+    api = commands.add_parser('api', help="run a fake Bot API server")
+    api.add_argument('--host', default='127.0.0.1')
+    api.add_argument('--port', type=int, default=8081)
+
+    send = commands.add_parser('send', help="post synthetic updates to the webhook")
+    send.add_argument('--url', default='http://127.0.0.1:8080/webhook')
+    send.add_argument('--secret', default='')
+    send.add_argument('-n', '--count', type=int, default=500)
+    send.add_argument('-c', '--concurrency', type=int, default=50)
+    send.add_argument('-u', '--users', type=int, default=100)
+
+    args = parser.parse_args()
+    if args.command == 'api':
+        web.run_app(fake_api_app(), host=args.host, port=args.port)
+    else:
+        asyncio.run(send_updates(args.url, args.secret, args.count, args.concurrency, args.users))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,239 @@
+"""
+Multi-process runtime.
+
+Usage: python cluster.py
+
+The front process receives updates (long polling, or a webhook server with
+BOT_MODE=webhook) and passes them as raw JSON to BOT_WORKERS worker
+processes, each running the regular dispatcher. An update always goes to
+worker chat_id % BOT_WORKERS and a worker handles the updates of one chat
+one at a time, so per-chat ordering is kept and the per-process caches
+(FSM records, user profiles) stay coherent. Everything else is shared
+through the database.
+
+Background loops that must run once (outbox, order expiry, archive) only
+run in worker 0, and every worker's notifier sends at 1/BOT_WORKERS of
+NOTIFY_GLOBAL_RATE, so the bot as a whole stays under Telegram's limit.
+
+Workers do not write log files themselves: their records go through a
+shared queue to the front process, which owns the log file and rotates it.
+SIGINT and SIGTERM stop the front, which stops and joins the workers; a
+worker whose front process died without doing so exits on its own.
+"""
+import asyncio
+import multiprocessing
+import secrets
+import signal
+from queue import Empty
+
+from aiohttp import web
+
+import config
+import main
+from handlers import setup_handlers
+from utils.logger import forward_logs, listen, setup_logger
+
+logger = setup_logger(__name__)
+
+POLL_TIMEOUT = 30
+SUPERVISE_INTERVAL = 5
+
+
+def shard_key(update):
+    """Chat id of a raw update, or the user id for updates without a chat"""
+    for name, payload in update.items():
+        if name == 'update_id' or not isinstance(payload, dict):
+            continue
+        chat = payload.get('chat') or (payload.get('message') or {}).get('chat')
+        if chat:
+            return chat['id']
+        user = payload.get('from') or payload.get('user')
+        if user:
+            return user['id']
+    return 0
+
+
+def run_worker(index, queue, log_queue):
+    # Ctrl+C reaches the whole process group; workers are stopped by the front
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+    forward_logs(log_queue)
+    asyncio.run(worker_main(index, queue))
+
+
+def next_update(queue):
+    """queue.get(), or None once the front process is gone, so workers never outlive it"""
+    front = multiprocessing.parent_process()
+    while True:
+        try:
+            return queue.get(timeout=SUPERVISE_INTERVAL)
+        except Empty:
+            if front is not None and not front.is_alive():
+                logger.warning("Front process is gone, stopping worker")
+                return None
+
+
+async def worker_main(index, queue):
+    await main.on_startup(
+        metrics_port=config.METRICS_PORT + 1 + index if config.METRICS_PORT else 0,
+        worker=index
+    )
+    setup_handlers(main.dp)
+    loop = asyncio.get_running_loop()
+    locks = {}
+    pending = {}
+    tasks = set()
+
+    async def handle(key, update):
+        lock = locks.setdefault(key, asyncio.Lock())
+        pending[key] = pending.get(key, 0) + 1
+        try:
+            async with lock:
+                await main.dp.feed_raw_update(main.bot, update)
+        except Exception as e:
+            logger.error(f"Worker {index} failed to handle update {update.get('update_id')}: {e}")
+        finally:
+            pending[key] -= 1
+            if not pending[key]:
+                del pending[key]
+                del locks[key]
+
+    logger.info(f"Worker {index} started")
+    try:
+        while True:
+            update = await loop.run_in_executor(None, next_update, queue)
+            if update is None:
+                break
+            task = asyncio.create_task(handle(shard_key(update), update))
+            tasks.add(task)
+            task.add_done_callback(tasks.discard)
+        if tasks:
+            await asyncio.gather(*tasks)
+    finally:
+        await main.on_shutdown()
+        await main.bot.session.close()
+
+
+class WorkerPool:
+    def __init__(self, size):
+        self.context = multiprocessing.get_context('spawn')
+        self.queues = [self.context.Queue() for _ in range(size)]
+        self.processes = [None] * size
+        self.log_queue = self.context.Queue(config.LOG_QUEUE_SIZE)
+
+    def start(self):
+        # Stopped with the other listeners at exit, after the workers are joined
+        listen(self.log_queue)
+        for index in range(len(self.queues)):
+            self._start_worker(index)
+
+    def _start_worker(self, index):
+        process = self.context.Process(
+            target=run_worker,
+            args=(index, self.queues[index], self.log_queue),
+            name=f"bot-worker-{index}"
+        )
+        process.start()
+        self.processes[index] = process
+
+    def dispatch(self, update):
+        self.queues[shard_key(update) % len(self.queues)].put(update)
+
+    async def supervise(self):
+        """Restart crashed workers; their queued updates are still waiting"""
+        while True:
+            await asyncio.sleep(SUPERVISE_INTERVAL)
+            for index, process in enumerate(self.processes):
+                if not process.is_alive():
+                    logger.error(f"Worker {index} exited with code {process.exitcode}, restarting")
+                    self._start_worker(index)
+
+    def stop(self, timeout=30):
+        for queue in self.queues:
+            queue.put(None)
+        for process in self.processes:
+            process.join(timeout)
+            if process.is_alive():
+                logger.warning(f"Worker {process.name} did not stop in {timeout}s, terminating")
+                process.terminate()
+
+
+async def poll(pool, allowed_updates):
+    await main.bot.delete_webhook()
+    offset = None
+    while True:
+        try:
+            updates = await main.bot.get_updates(
+                offset=offset,
+                timeout=POLL_TIMEOUT,
+                allowed_updates=allowed_updates,
+                request_timeout=POLL_TIMEOUT + 10
+            )
+        except Exception as e:
+            logger.error(f"getUpdates failed: {e}")
+            await asyncio.sleep(1)
+            continue
+        for update in updates:
+            pool.dispatch(update.model_dump(mode='json', exclude_none=True, by_alias=True))
+            offset = update.update_id + 1
+
+
+async def serve_webhook(pool, allowed_updates):
+    async def receive(request):
+        token = request.headers.get("X-Telegram-Bot-Api-Secret-Token", "")
+        if not secrets.compare_digest(token, config.WEBHOOK_SECRET):
+            return web.Response(status=401)
+        pool.dispatch(await request.json())
+        return web.Response()
+
+    app = web.Application()
+    app.router.add_post(config.WEBHOOK_PATH, receive)
+    runner = web.AppRunner(app)
+    await runner.setup()
+    site = web.TCPSite(runner, config.WEBHOOK_HOST, config.WEBHOOK_PORT)
+    await site.start()
+    logger.info(f"Webhook server listening on {config.WEBHOOK_HOST}:{config.WEBHOOK_PORT}{config.WEBHOOK_PATH}")
+
+    if config.WEBHOOK_URL:
+        await main.bot.set_webhook(
+            f"{config.WEBHOOK_URL.rstrip('/')}{config.WEBHOOK_PATH}",
+            secret_token=config.WEBHOOK_SECRET,
+            allowed_updates=allowed_updates
+        )
+    else:
+        logger.warning("WEBHOOK_URL is not set, the webhook has to be registered manually")
+
+    try:
+        await asyncio.Event().wait()
+    finally:
+        await runner.cleanup()
+
+
+async def run_front():
+    # Handlers are only registered to resolve the update types to request
+    setup_handlers(main.dp)
+    allowed_updates = main.dp.resolve_used_update_types()
+
+    pool = WorkerPool(config.BOT_WORKERS)
+    pool.start()
+    logger.info(f"Started {config.BOT_WORKERS} workers in {config.BOT_MODE} mode")
+    supervisor = asyncio.create_task(pool.supervise())
+    # Cancelling the serving task runs the finally block below, which stops the workers
+    loop = asyncio.get_running_loop()
+    for signum in (signal.SIGINT, signal.SIGTERM):
+        loop.add_signal_handler(signum, asyncio.current_task().cancel)
+    try:
+        if config.BOT_MODE == 'webhook':
+            await serve_webhook(pool, allowed_updates)
+        else:
+            await poll(pool, allowed_updates)
+    finally:
+        supervisor.cancel()
+        pool.stop()
+        await main.bot.session.close()
+
+
+if __name__ == "__main__":
+    try:
+        asyncio.run(run_front())
+    except (KeyboardInterrupt, SystemExit, asyncio.CancelledError):
+        logger.info("Cluster stopped")
@@ -25,8 +25,27 @@ elif DB_ENGINE == 'postgresql':
 else:
     DATABASE_URL = f"sqlite:///{BASE_DIR / DB_NAME}"
 
+# Connection pool, used for both SQLite and PostgreSQL
+DB_POOL_SIZE = int(os.getenv('DB_POOL_SIZE', 10))
+DB_MAX_OVERFLOW = int(os.getenv('DB_MAX_OVERFLOW', 10))
+DB_POOL_TIMEOUT = int(os.getenv('DB_POOL_TIMEOUT', 30))
+DB_POOL_RECYCLE = int(os.getenv('DB_POOL_RECYCLE', 1800))
+# PostgreSQL only, milliseconds
+DB_STATEMENT_TIMEOUT = int(os.getenv('DB_STATEMENT_TIMEOUT', 15000))
+# SQLite only
+SQLITE_JOURNAL_MODE = os.getenv('SQLITE_JOURNAL_MODE', 'WAL')
+SQLITE_SYNCHRONOUS = os.getenv('SQLITE_SYNCHRONOUS', 'NORMAL')
+SQLITE_BUSY_TIMEOUT = int(os.getenv('SQLITE_BUSY_TIMEOUT', 5000))
+
 LOG_LEVEL = os.getenv('LOG_LEVEL', 'INFO')
 LOG_FILE = os.getenv('LOG_FILE', 'bot.log')
+# 'json' or 'text', separately for the log file and the console
+LOG_FORMAT = os.getenv('LOG_FORMAT', 'json')
+LOG_CONSOLE_FORMAT = os.getenv('LOG_CONSOLE_FORMAT', 'text')
+# Records waiting for the writer thread; above that new records are dropped
+LOG_QUEUE_SIZE = int(os.getenv('LOG_QUEUE_SIZE', 10000))
+# Share of per-update lines (user lookups, "Update is handled") that is kept
+LOG_SAMPLE_RATE = float(os.getenv('LOG_SAMPLE_RATE', 0.01))
 
 LOG_LEVELS = {
     'DEBUG': logging.DEBUG,
@@ -38,5 +57,78 @@ LOG_LEVELS = {
 
 CACHE_TTL = int(os.getenv('CACHE_TTL', 300))
 
+DB_EXECUTOR_WORKERS = int(os.getenv('DB_EXECUTOR_WORKERS', 8))
+# Must stay below the connection pool size, see database/async_session.py;
+# the rest of the pool is left to the background services
+DB_MAX_SESSIONS = int(os.getenv('DB_MAX_SESSIONS', max(1, DB_POOL_SIZE + DB_MAX_OVERFLOW - 5)))
+
+USER_ACTIVITY_FLUSH_INTERVAL = int(os.getenv('USER_ACTIVITY_FLUSH_INTERVAL', 30))
+
+ORDERS_PAGE_SIZE = int(os.getenv('ORDERS_PAGE_SIZE', 10))
+# Seconds an order may wait for a manager / for the customer's payment
+# before it is cancelled, see services.order_expiry; 0 disables
+ORDER_CREATED_TTL = int(os.getenv('ORDER_CREATED_TTL', 24 * 3600))
+ORDER_AWAITING_PAYMENT_TTL = int(os.getenv('ORDER_AWAITING_PAYMENT_TTL', 6 * 3600))
+ORDER_EXPIRY_RESCAN_INTERVAL = float(os.getenv('ORDER_EXPIRY_RESCAN_INTERVAL', 300))
+ORDER_EXPIRY_BATCH_SIZE = int(os.getenv('ORDER_EXPIRY_BATCH_SIZE', 500))
+# Completed/cancelled orders untouched for this many days move to orders_archive; 0 disables
+ORDER_ARCHIVE_AFTER_DAYS = int(os.getenv('ORDER_ARCHIVE_AFTER_DAYS', 90))
+ORDER_ARCHIVE_INTERVAL = float(os.getenv('ORDER_ARCHIVE_INTERVAL', 3600))
+ORDER_ARCHIVE_BATCH_SIZE = int(os.getenv('ORDER_ARCHIVE_BATCH_SIZE', 1000))
+# Seconds between re-reads of currencies, banks and settings; 0 disables
+REFERENCE_REFRESH_INTERVAL = float(os.getenv('REFERENCE_REFRESH_INTERVAL', 60))
+# Rendered order cards kept in memory, see utils.order_cards
+ORDER_CARD_CACHE_SIZE = int(os.getenv('ORDER_CARD_CACHE_SIZE', 5000))
+# Rows per chunk read by /export, see services.order_export
+EXPORT_CHUNK_SIZE = int(os.getenv('EXPORT_CHUNK_SIZE', 20000))
+# Largest file /export sends; the public Bot API accepts 50 MB, a local server up to 2000 MB
+EXPORT_MAX_FILE_SIZE = int(os.getenv('EXPORT_MAX_FILE_SIZE', 50 * 1024 * 1024))
+
+# Rate feed: a JSON file path or an http(s) URL returning {"USDT/UAH": 41.29, ...}
+# mid rates; empty disables it and the rates stay as stored
+RATE_FEED_SOURCE = os.getenv('RATE_FEED_SOURCE', '')
+RATE_FEED_INTERVAL = float(os.getenv('RATE_FEED_INTERVAL', 60))
+RATE_FEED_TIMEOUT = float(os.getenv('RATE_FEED_TIMEOUT', 10))
+# Percent added to the mid rate, per pair and '*' for the rest: "USDT/UAH:1.5,*:1"
+RATE_SPREADS = os.getenv('RATE_SPREADS', '*:1')
+
+NOTIFY_CONCURRENCY = int(os.getenv('NOTIFY_CONCURRENCY', 8))
+NOTIFY_GLOBAL_RATE = float(os.getenv('NOTIFY_GLOBAL_RATE', 25))
+NOTIFY_PER_CHAT_INTERVAL = float(os.getenv('NOTIFY_PER_CHAT_INTERVAL', 1.0))
+NOTIFY_MAX_RETRIES = int(os.getenv('NOTIFY_MAX_RETRIES', 3))
+
+OUTBOX_POLL_INTERVAL = float(os.getenv('OUTBOX_POLL_INTERVAL', 5))
+OUTBOX_BATCH_SIZE = int(os.getenv('OUTBOX_BATCH_SIZE', 50))
+OUTBOX_MAX_ATTEMPTS = int(os.getenv('OUTBOX_MAX_ATTEMPTS', 8))
+OUTBOX_RETRY_BASE = float(os.getenv('OUTBOX_RETRY_BASE', 5))
+OUTBOX_LEASE = int(os.getenv('OUTBOX_LEASE', 60))
+# Delivered rows are deleted at once; rows given up on are kept this many days
+OUTBOX_RETENTION_DAYS = float(os.getenv('OUTBOX_RETENTION_DAYS', 7))
+OUTBOX_PRUNE_INTERVAL = float(os.getenv('OUTBOX_PRUNE_INTERVAL', 3600))
+
+# memory, sqlalchemy or redis
+FSM_STORAGE = os.getenv('FSM_STORAGE', 'sqlalchemy')
+FSM_FLUSH_INTERVAL = float(os.getenv('FSM_FLUSH_INTERVAL', 1.0))
+FSM_CACHE_SIZE = int(os.getenv('FSM_CACHE_SIZE', 10000))
+REDIS_URL = os.getenv('REDIS_URL', 'redis://localhost:6379/0')
+
+# polling or webhook
+BOT_MODE = os.getenv('BOT_MODE', 'polling')
+WEBHOOK_URL = os.getenv('WEBHOOK_URL', '')
+WEBHOOK_PATH = os.getenv('WEBHOOK_PATH', '/webhook')
+WEBHOOK_SECRET = os.getenv('WEBHOOK_SECRET', '')
+WEBHOOK_HOST = os.getenv('WEBHOOK_HOST', '0.0.0.0')
+WEBHOOK_PORT = int(os.getenv('WEBHOOK_PORT', 8080))
+# Prometheus text format on http://METRICS_HOST:METRICS_PORT/metrics, 0 disables it;
+# cluster.py workers listen on METRICS_PORT + 1 + worker index
+METRICS_HOST = os.getenv('METRICS_HOST', '127.0.0.1')
+METRICS_PORT = int(os.getenv('METRICS_PORT', 0))
+# Worker processes started by cluster.py; updates are sharded by chat id
+BOT_WORKERS = int(os.getenv('BOT_WORKERS', os.cpu_count() or 1))
+# Base URL of a local Bot API server, e.g. the fake one in benchmarks/webhook_sender.py
+TELEGRAM_API_SERVER = os.getenv('TELEGRAM_API_SERVER', '')
+
 if not BOT_TOKEN:
-    raise ValueError("BOT_TOKEN is not set in environment variables")
\ No newline at end of file
+    raise ValueError("BOT_TOKEN is not set in environment variables")
+if BOT_MODE == 'webhook' and not WEBHOOK_SECRET:
+    raise ValueError("WEBHOOK_SECRET is required when BOT_MODE=webhook")
\ No newline at end of file
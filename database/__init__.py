@@ -1,8 +1,11 @@
 from .models import (
     Base, User, UserRole, Currency, CurrencyType, 
-    Bank, ExchangeRate, Order, OrderStatus, Setting
+    Bank, ExchangeRate, Order, OrderStatus, Setting, ACTIVE_ORDER_STATUSES,
+    ArchivedOrder, ORDER_MODELS, TERMINAL_ORDER_STATUSES, OrderStatsDaily,
+    OutboxMessage, FSMRecord
 )
+from .async_session import AsyncDBSession, run_in_db_thread
 from .db_operations import (
-    get_engine, init_db, get_session, 
+    get_engine, init_db, get_session, get_async_session,
     setup_initial_data, create_admin_user, get_or_create_user
 )
\ No newline at end of file
@@ -0,0 +1,105 @@
+import asyncio
+import contextvars
+from concurrent.futures import ThreadPoolExecutor
+from functools import partial
+
+from config import DB_EXECUTOR_WORKERS, DB_MAX_SESSIONS
+
+_executor = ThreadPoolExecutor(max_workers=DB_EXECUTOR_WORKERS, thread_name_prefix="db")
+
+# A session keeps its pooled connection between awaits. With more open
+# sessions than the pool can serve, every DB thread ends up blocked on
+# checkout while the sessions holding connections wait for a free thread,
+# so sessions queue for a slot on the event loop instead.
+_session_slots = asyncio.Semaphore(DB_MAX_SESSIONS)
+
+
+async def run_in_db_thread(fn, *args, **kwargs):
+    """Run blocking database code on the DB thread pool and await the result"""
+    loop = asyncio.get_running_loop()
+    ctx = contextvars.copy_context()
+    return await loop.run_in_executor(_executor, partial(ctx.run, fn, *args, **kwargs))
+
+
+class AsyncDBSession:
+    """
+    Awaitable facade over a synchronous SQLAlchemy Session.
+
+    Every call that may touch the database is executed on the DB thread pool,
+    so handlers never block the event loop while a query is running. Calls on
+    one instance must be awaited sequentially, like a regular Session.
+    """
+
+    def __init__(self, sync_session):
+        self.sync_session = sync_session
+        self._has_slot = False
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, exc_type, exc, tb):
+        await self.close()
+
+    async def _run(self, fn, *args, **kwargs):
+        if not self._has_slot:
+            await _session_slots.acquire()
+            self._has_slot = True
+        return await run_in_db_thread(fn, *args, **kwargs)
+
+    async def run_sync(self, fn, *args, **kwargs):
+        """Call fn(sync_session, *args, **kwargs) in a DB thread"""
+        return await self._run(fn, self.sync_session, *args, **kwargs)
+
+    async def get(self, model, ident, **kwargs):
+        return await self._run(self.sync_session.get, model, ident, **kwargs)
+
+    async def scalar(self, statement, params=None):
+        return await self._run(self.sync_session.scalar, statement, params)
+
+    async def scalars(self, statement, params=None):
+        """Execute a select and return all scalar results as a list"""
+        def _scalars(session):
+            return session.scalars(statement, params).all()
+        return await self.run_sync(_scalars)
+
+    async def rows(self, statement, params=None):
+        """Execute a select and return all rows as a list"""
+        def _rows(session):
+            return session.execute(statement, params).all()
+        return await self.run_sync(_rows)
+
+    async def execute(self, statement, params=None):
+        """Execute a DML statement; the returned result should not be iterated"""
+        return await self._run(self.sync_session.execute, statement, params)
+
+    def add(self, instance):
+        self.sync_session.add(instance)
+
+    def add_all(self, instances):
+        self.sync_session.add_all(instances)
+
+    async def delete(self, instance):
+        await self._run(self.sync_session.delete, instance)
+
+    async def flush(self):
+        await self._run(self.sync_session.flush)
+
+    async def refresh(self, instance):
+        await self._run(self.sync_session.refresh, instance)
+
+    async def commit(self):
+        await self._run(self.sync_session.commit)
+
+    async def rollback(self):
+        await self._run(self.sync_session.rollback)
+
+    async def close(self):
+        if not self._has_slot:
+            # Nothing was executed, so no connection is checked out
+            self.sync_session.close()
+            return
+        try:
+            await run_in_db_thread(self.sync_session.close)
+        finally:
+            self._has_slot = False
+            _session_slots.release()
@@ -0,0 +1,107 @@
+"""
+Проверка планов горячих запросов.
+
+Usage: python -m database.check_query_plans
+
+Runs EXPLAIN for every query the handlers execute on each update and
+fails if one of them scans a table instead of using an index.
+"""
+import sys
+import logging
+from datetime import datetime
+
+from sqlalchemy import func, select, text, tuple_, literal
+
+import config
+from database.db_operations import get_engine, init_db
+from database.models import (
+    ACTIVE_ORDER_STATUSES, Bank, Currency, ExchangeRate, Order, OrderStatus, User
+)
+
+logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
+logger = logging.getLogger(__name__)
+
+SQLITE_INDEX_MARKERS = ('USING INDEX', 'USING COVERING INDEX', 'USING INTEGER PRIMARY KEY', 'USING PRIMARY KEY')
+POSTGRES_INDEX_MARKERS = ('Index Scan', 'Index Only Scan', 'Bitmap Index Scan')
+
+def hot_queries():
+    now = datetime.now()
+    return {
+        "active orders page": (
+            select(Order.id)
+            .where(
+                Order.status.in_(ACTIVE_ORDER_STATUSES),
+                tuple_(Order.status, Order.created_at, Order.id) > tuple_(
+                    literal(OrderStatus.CREATED, Order.status.type),
+                    literal(now, Order.created_at.type),
+                    literal(0)
+                )
+            )
+            .order_by(Order.status, Order.created_at, Order.id)
+            .limit(config.ORDERS_PAGE_SIZE)
+        ),
+        "active orders count": (
+            select(func.count()).select_from(Order).where(Order.status.in_(ACTIVE_ORDER_STATUSES))
+        ),
+        "completed orders page": (
+            select(Order.id)
+            .where(Order.status == OrderStatus.COMPLETED)
+            .order_by(Order.completed_at.desc(), Order.id.desc())
+            .limit(config.ORDERS_PAGE_SIZE)
+        ),
+        "user history": (
+            select(Order.id)
+            .where(Order.user_id == 1)
+            .order_by(Order.created_at.desc())
+            .limit(5)
+        ),
+        "exchange rate by pair": (
+            select(ExchangeRate.rate).where(
+                ExchangeRate.from_currency_id == 1,
+                ExchangeRate.to_currency_id == 2
+            )
+        ),
+        "currency by code": select(Currency.id).where(Currency.code == "USDT"),
+        "banks for currency": select(Bank.id).where(Bank.currency_id == 1, Bank.enabled.is_(True)),
+        "user by telegram id": select(User.id).where(User.telegram_id == 1),
+    }
+
+def explain(connection, statement):
+    sql = str(statement.compile(connection, compile_kwargs={"literal_binds": True}))
+    if connection.dialect.name == 'sqlite':
+        rows = connection.execute(text(f"EXPLAIN QUERY PLAN {sql}")).all()
+        return [row[-1] for row in rows]
+    rows = connection.execute(text(f"EXPLAIN {sql}")).all()
+    return [row[0] for row in rows]
+
+def uses_index(dialect_name, plan):
+    if dialect_name == 'sqlite':
+        # Every table access has to be an index search, not a full SCAN
+        scans = [line for line in plan if line.startswith('SCAN') and 'INDEX' not in line]
+        return not scans and any(marker in line for line in plan for marker in SQLITE_INDEX_MARKERS)
+    return any(marker in line for line in plan for marker in POSTGRES_INDEX_MARKERS)
+
+def main():
+    engine = get_engine(config.DATABASE_URL)
+    init_db(engine)
+
+    failed = []
+    with engine.connect() as connection:
+        if connection.dialect.name == 'postgresql':
+            # Small tables make a sequential scan cheaper; check that an index is usable at all
+            connection.execute(text("SET enable_seqscan = off"))
+
+        for name, statement in hot_queries().items():
+            plan = explain(connection, statement)
+            ok = uses_index(connection.dialect.name, plan)
+            logger.info(f"{'OK  ' if ok else 'FAIL'} {name}: {' | '.join(plan)}")
+            if not ok:
+                failed.append(name)
+
+    if failed:
+        logger.error(f"Queries without index: {', '.join(failed)}")
+        sys.exit(1)
+    logger.info("All hot queries use indexes")
+
+if __name__ == "__main__":
+    main()
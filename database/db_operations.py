@@ -1,24 +1,103 @@
-from sqlalchemy import create_engine
+from alembic import command
+from alembic.config import Config as AlembicConfig
+from sqlalchemy import create_engine, event, inspect
+from sqlalchemy.engine import make_url
 from sqlalchemy.orm import sessionmaker
-from sqlalchemy.exc import SQLAlchemyError
+from sqlalchemy.exc import IntegrityError, SQLAlchemyError
+from decimal import Decimal
 import logging
+from pathlib import Path
+
+import config
 
 from utils.db_utils import set_exchange_rate
+from utils.money import invert_rate, quantize_rate
+from utils.metrics import instrument_engine
 
-from .models import Base, Currency, CurrencyType, Bank, User, UserRole, Setting
+from .async_session import AsyncDBSession
+from .models import Currency, CurrencyType, Bank, ExchangeRate, User, UserRole, Setting
 
-logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
 logger = logging.getLogger(__name__)
 
+ALEMBIC_INI = Path(__file__).resolve().parent.parent / 'alembic.ini'
+BASELINE_REVISION = '0001'
+
+# Objects stay usable after commit without a refresh query on the event loop thread
+SessionFactory = sessionmaker(expire_on_commit=False)
+
 def get_engine(db_url="sqlite:///changify.db"):
-    return create_engine(db_url, echo=False)
+    url = make_url(db_url)
+    if url.get_backend_name() == 'sqlite':
+        engine = _create_sqlite_engine(url)
+    else:
+        engine = _create_server_engine(url)
+    return instrument_engine(engine)
+
+def _pool_options():
+    return {
+        'pool_size': config.DB_POOL_SIZE,
+        'max_overflow': config.DB_MAX_OVERFLOW,
+        'pool_timeout': config.DB_POOL_TIMEOUT,
+    }
+
+def _create_sqlite_engine(url):
+    if url.database in (None, '', ':memory:'):
+        # In-memory databases live in a single connection, pooling does not apply
+        return create_engine(url, echo=False)
+
+    engine = create_engine(
+        url,
+        echo=False,
+        connect_args={'timeout': config.SQLITE_BUSY_TIMEOUT / 1000, 'check_same_thread': False},
+        **_pool_options()
+    )
+
+    @event.listens_for(engine, "connect")
+    def _set_sqlite_pragmas(dbapi_connection, connection_record):
+        # WAL lets readers run next to the single writer; NORMAL only syncs at checkpoints
+        cursor = dbapi_connection.cursor()
+        cursor.execute(f"PRAGMA journal_mode={config.SQLITE_JOURNAL_MODE}")
+        cursor.execute(f"PRAGMA synchronous={config.SQLITE_SYNCHRONOUS}")
+        cursor.execute(f"PRAGMA busy_timeout={config.SQLITE_BUSY_TIMEOUT}")
+        cursor.close()
+
+    return engine
+
+def _create_server_engine(url):
+    connect_args = {}
+    if url.get_backend_name() == 'postgresql':
+        connect_args['options'] = f"-c statement_timeout={config.DB_STATEMENT_TIMEOUT}"
+    return create_engine(
+        url,
+        echo=False,
+        pool_pre_ping=True,
+        pool_recycle=config.DB_POOL_RECYCLE,
+        connect_args=connect_args,
+        **_pool_options()
+    )
 
 def get_session(engine):
-    Session = sessionmaker(bind=engine)
-    return Session()
+    return SessionFactory(bind=engine)
+
+def get_async_session(engine):
+    return AsyncDBSession(get_session(engine))
+
+def get_alembic_config(connection=None):
+    alembic_config = AlembicConfig(str(ALEMBIC_INI))
+    if connection is not None:
+        alembic_config.attributes['connection'] = connection
+    return alembic_config
 
 def init_db(engine):
-    Base.metadata.create_all(engine)
+    """Bring the schema up to date with the Alembic migrations"""
+    with engine.begin() as connection:
+        alembic_config = get_alembic_config(connection)
+        tables = inspect(connection).get_table_names()
+        if 'orders' in tables and 'alembic_version' not in tables:
+            # Database created by create_all before migrations existed
+            command.stamp(alembic_config, BASELINE_REVISION)
+            logger.info(f"Существующая база помечена ревизией {BASELINE_REVISION}")
+        command.upgrade(alembic_config, 'head')
     logger.info("База данных инициализирована")
 
 
@@ -36,11 +115,14 @@ def setup_initial_data(session):
         
         uah = session.query(Currency).filter_by(code="UAH").first()
         
-        usdt_to_uah_rate = 41.29 + (0.01 * 41.29)
-        set_exchange_rate(session, "USDT", "UAH", usdt_to_uah_rate)
-    
-        uah_to_usdt_rate = 1 / usdt_to_uah_rate
-        set_exchange_rate(session, "UAH", "USDT", uah_to_usdt_rate)
+        # Starting rates only; afterwards they come from the rate feed
+        # (services.rate_feed) and must not be reset on every start
+        if session.query(ExchangeRate).count() == 0:
+            usdt_to_uah_rate = quantize_rate(Decimal("41.29") * Decimal("1.01"))
+            set_exchange_rate(session, "USDT", "UAH", usdt_to_uah_rate)
+        
+            uah_to_usdt_rate = invert_rate(usdt_to_uah_rate)
+            set_exchange_rate(session, "UAH", "USDT", uah_to_usdt_rate)
         
         if uah and session.query(Bank).count() == 0:
             banks = [
@@ -103,14 +185,21 @@ def get_or_create_user(session, user_data):
                 last_name=user_data.get('last_name')
             )
             session.add(user)
-            session.commit()
+            try:
+                session.commit()
+            except IntegrityError:
+                # A concurrent update from the same new user inserted the row first
+                session.rollback()
+                return get_or_create_user(session, user_data)
             logger.info(f"Created new user {user_data['telegram_id']}")
         else:
-            user.username = user_data.get('username', user.username)
-            user.first_name = user_data.get('first_name', user.first_name)
-            user.last_name = user_data.get('last_name', user.last_name)
-            user.last_active = user_data.get('last_active', user.last_active)
-            session.commit()
+            changed = False
+            for field in ('username', 'first_name', 'last_name', 'last_active'):
+                if field in user_data and getattr(user, field) != user_data[field]:
+                    setattr(user, field, user_data[field])
+                    changed = True
+            if changed:
+                session.commit()
             
         return user
     except SQLAlchemyError as e:
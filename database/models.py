@@ -1,10 +1,12 @@
 from datetime import datetime
 from zoneinfo import ZoneInfo
-from sqlalchemy import Column, Integer, String, Float, DateTime, Boolean, ForeignKey, Text, Enum
+from sqlalchemy import Column, Integer, BigInteger, String, Date, DateTime, Boolean, ForeignKey, Text, Enum, Index
 from sqlalchemy.orm import relationship, declarative_base
 from sqlalchemy.sql import func
 import enum
 
+from utils.money import AMOUNT_SCALE, RATE_SCALE, FixedPoint
+
 Base = declarative_base()
 
 class UserRole(enum.Enum):
@@ -20,6 +22,18 @@ class OrderStatus(enum.Enum):
     COMPLETED = "completed"
     CANCELLED = "cancelled"
 
+ACTIVE_ORDER_STATUSES = (
+    OrderStatus.CREATED,
+    OrderStatus.AWAITING_PAYMENT,
+    OrderStatus.PAYMENT_CONFIRMED
+)
+
+# Orders in these statuses never change again and may be archived
+TERMINAL_ORDER_STATUSES = (
+    OrderStatus.COMPLETED,
+    OrderStatus.CANCELLED
+)
+
 ORDER_STATUS_LABELS = {
     OrderStatus.CREATED: "Створено",
     OrderStatus.AWAITING_PAYMENT: "Очікує оплати",
@@ -65,6 +79,9 @@ class Currency(Base):
 
 class Bank(Base):
     __tablename__ = 'banks'
+    __table_args__ = (
+        Index('ix_banks_currency_id', 'currency_id'),
+    )
     
     id = Column(Integer, primary_key=True)
     name = Column(String(50), nullable=False)
@@ -77,11 +94,14 @@ class Bank(Base):
 
 class ExchangeRate(Base):
     __tablename__ = 'exchange_rates'
+    __table_args__ = (
+        Index('uq_exchange_rates_pair', 'from_currency_id', 'to_currency_id', unique=True),
+    )
     
     id = Column(Integer, primary_key=True)
     from_currency_id = Column(Integer, ForeignKey('currencies.id'), nullable=False)
     to_currency_id = Column(Integer, ForeignKey('currencies.id'), nullable=False)
-    rate = Column(Float, nullable=False)
+    rate = Column(FixedPoint(RATE_SCALE), nullable=False)
     updated_at = Column(DateTime, default=lambda: datetime.now(ZoneInfo("Europe/Kyiv")))
     
     from_currency = relationship("Currency", foreign_keys=[from_currency_id])
@@ -92,15 +112,21 @@ class ExchangeRate(Base):
 
 class Order(Base):
     __tablename__ = 'orders'
+    __table_args__ = (
+        # Keyset pagination of the manager order lists
+        Index('ix_orders_status_created_at_id', 'status', 'created_at', 'id'),
+        Index('ix_orders_status_completed_at_id', 'status', 'completed_at', 'id'),
+        Index('ix_orders_user_id_created_at', 'user_id', 'created_at'),
+    )
     
     id = Column(Integer, primary_key=True)
     user_id = Column(Integer, ForeignKey('users.id'), nullable=False)
     manager_id = Column(Integer, ForeignKey('users.id'), nullable=True)
     from_currency_id = Column(Integer, ForeignKey('currencies.id'), nullable=False)
     to_currency_id = Column(Integer, ForeignKey('currencies.id'), nullable=False)
-    amount_from = Column(Float, nullable=False)
-    amount_to = Column(Float, nullable=False)
-    rate = Column(Float, nullable=False)
+    amount_from = Column(FixedPoint(AMOUNT_SCALE), nullable=False)
+    amount_to = Column(FixedPoint(AMOUNT_SCALE), nullable=False)
+    rate = Column(FixedPoint(RATE_SCALE), nullable=False)
     status = Column(Enum(OrderStatus), default=OrderStatus.CREATED)
     bank_id = Column(Integer, ForeignKey('banks.id'), nullable=True)
     details = Column(Text)
@@ -110,8 +136,16 @@ class Order(Base):
     created_at = Column(DateTime, default=lambda: datetime.now(ZoneInfo("Europe/Kyiv")))
     updated_at = Column(DateTime, default=lambda: datetime.now(ZoneInfo("Europe/Kyiv")))
     completed_at = Column(DateTime)
+    # Bumped by every status transition, see services.order_state
+    version = Column(Integer, nullable=False, default=1, server_default='1')
     
     user = relationship("User", back_populates="orders", foreign_keys=[user_id])
+    # user_id holds the customer's Telegram ID, so join on users.telegram_id
+    customer = relationship(
+        "User",
+        primaryjoin="foreign(Order.user_id) == User.telegram_id",
+        viewonly=True
+    )
     manager = relationship("User", back_populates="managed_orders", foreign_keys=[manager_id])
     from_currency = relationship("Currency", foreign_keys=[from_currency_id])
     to_currency = relationship("Currency", foreign_keys=[to_currency_id])
@@ -120,6 +154,85 @@ class Order(Base):
     def __repr__(self):
         return f"<Order(id={self.id}, user_id={self.user_id}, status={self.status})>"
 
+class ArchivedOrder(Base):
+    """
+    Completed and cancelled orders moved out of `orders` by
+    services.order_archive. Same columns and ids; no foreign keys, so
+    archived rows never hold back changes of the referenced tables.
+    """
+    __tablename__ = 'orders_archive'
+    __table_args__ = (
+        Index('ix_orders_archive_status_completed_at_id', 'status', 'completed_at', 'id'),
+        Index('ix_orders_archive_user_id_created_at', 'user_id', 'created_at'),
+    )
+    
+    id = Column(Integer, primary_key=True, autoincrement=False)
+    user_id = Column(Integer, nullable=False)
+    manager_id = Column(Integer, nullable=True)
+    from_currency_id = Column(Integer, nullable=False)
+    to_currency_id = Column(Integer, nullable=False)
+    amount_from = Column(FixedPoint(AMOUNT_SCALE), nullable=False)
+    amount_to = Column(FixedPoint(AMOUNT_SCALE), nullable=False)
+    rate = Column(FixedPoint(RATE_SCALE), nullable=False)
+    status = Column(Enum(OrderStatus))
+    bank_id = Column(Integer, nullable=True)
+    details = Column(Text)
+    manager_payment_details = Column(Text, nullable=True)
+    rejection_reason = Column(String, nullable=True)
+    message_id = Column(Integer, nullable=True)
+    created_at = Column(DateTime)
+    updated_at = Column(DateTime)
+    completed_at = Column(DateTime)
+    version = Column(Integer, nullable=False)
+    
+    # Read-only counterparts of the Order relationships used by order cards
+    customer = relationship(
+        "User",
+        primaryjoin="foreign(ArchivedOrder.user_id) == User.telegram_id",
+        viewonly=True
+    )
+    from_currency = relationship(
+        "Currency", primaryjoin="foreign(ArchivedOrder.from_currency_id) == Currency.id", viewonly=True
+    )
+    to_currency = relationship(
+        "Currency", primaryjoin="foreign(ArchivedOrder.to_currency_id) == Currency.id", viewonly=True
+    )
+    bank = relationship("Bank", primaryjoin="foreign(ArchivedOrder.bank_id) == Bank.id", viewonly=True)
+    
+    def __repr__(self):
+        return f"<ArchivedOrder(id={self.id}, user_id={self.user_id}, status={self.status})>"
+
+# Order history lives in both tables
+ORDER_MODELS = (Order, ArchivedOrder)
+
+class OrderStatsDaily(Base):
+    """
+    Per-day order counters of one currency pair and manager, kept up to
+    date by services.order_stats on every transition. An order counts as
+    created on its creation day, completed or cancelled on the day that
+    happened; manager_id is 0 while no manager took the order.
+    """
+    __tablename__ = 'order_stats_daily'
+    
+    day = Column(Date, primary_key=True)
+    from_currency_id = Column(Integer, primary_key=True)
+    to_currency_id = Column(Integer, primary_key=True)
+    manager_id = Column(BigInteger, primary_key=True)
+    created = Column(Integer, nullable=False, default=0)
+    completed = Column(Integer, nullable=False, default=0)
+    cancelled = Column(Integer, nullable=False, default=0)
+    # Sums over completed orders
+    volume_from = Column(FixedPoint(AMOUNT_SCALE), nullable=False, default=0)
+    volume_to = Column(FixedPoint(AMOUNT_SCALE), nullable=False, default=0)
+    rate_sum = Column(FixedPoint(RATE_SCALE), nullable=False, default=0)
+    complete_seconds = Column(BigInteger, nullable=False, default=0)
+    
+    def __repr__(self):
+        return (
+            f"<OrderStatsDaily(day={self.day}, pair={self.from_currency_id}->{self.to_currency_id}, "
+            f"manager={self.manager_id})>"
+        )
+
 class Setting(Base):
     __tablename__ = 'settings'
     
@@ -129,4 +242,37 @@ class Setting(Base):
     updated_at = Column(DateTime, default=lambda: datetime.now(ZoneInfo("Europe/Kyiv")))
     
     def __repr__(self):
-        return f"<Setting(key={self.key}, value={self.value})>"
\ No newline at end of file
+        return f"<Setting(key={self.key}, value={self.value})>"
+
+class OutboxMessage(Base):
+    """Telegram message waiting to be delivered by the outbox worker"""
+    __tablename__ = 'outbox'
+    __table_args__ = (
+        Index('ix_outbox_pending', 'sent_at', 'next_attempt_at'),
+    )
+    
+    id = Column(Integer, primary_key=True)
+    chat_id = Column(BigInteger, nullable=False)
+    text = Column(Text, nullable=False)
+    parse_mode = Column(String(20), nullable=True)
+    reply_markup = Column(Text, nullable=True)
+    attempts = Column(Integer, nullable=False, default=0)
+    last_error = Column(Text, nullable=True)
+    created_at = Column(DateTime, default=lambda: datetime.now(ZoneInfo("Europe/Kyiv")))
+    next_attempt_at = Column(DateTime, default=lambda: datetime.now(ZoneInfo("Europe/Kyiv")))
+    sent_at = Column(DateTime, nullable=True)
+    
+    def __repr__(self):
+        return f"<OutboxMessage(id={self.id}, chat_id={self.chat_id}, attempts={self.attempts})>"
+
+class FSMRecord(Base):
+    """FSM state and data of one chat/user, written by SQLAlchemyStorage"""
+    __tablename__ = 'fsm_states'
+    
+    key = Column(String(255), primary_key=True)
+    state = Column(String(255), nullable=True)
+    data = Column(Text, nullable=True)
+    updated_at = Column(DateTime, default=lambda: datetime.now(ZoneInfo("Europe/Kyiv")))
+    
+    def __repr__(self):
+        return f"<FSMRecord(key={self.key}, state={self.state})>"
@@ -2,14 +2,19 @@ from aiogram import Router, F, types
 from aiogram.filters import Command
 from aiogram.fsm.context import FSMContext
 
-from config import MANAGER_IDS
 from keyboards.reply import get_main_keyboard
 from keyboards.inline import get_currencies_selection, get_bank_selection, get_order_actions
 from states.exchange import ExchangeStates
-from utils import logger
 from utils.error_handler import handle_errors
-from utils.db_utils import get_exchange_rate, get_banks_for_currency
-from database.models import Order, OrderStatus, Currency, Bank, User
+from utils.logger import bind_log_context
+from utils.money import convert, parse_amount, to_decimal
+from utils.order_cards import CREATED_CONFIRMATION, NEW_ORDER_NOTICE, order_card
+from utils.db_utils import get_exchange_rate
+from database.models import Order, OrderStatus
+from services.notifier import notifier
+from services import order_stats
+from services.order_expiry import order_expiry
+from services.reference_data import reference_data
 
 router = Router()
 
@@ -51,7 +56,8 @@ async def process_currency_selection(callback: types.CallbackQuery, state: FSMCo
         rate = await get_exchange_rate(session, from_currency, currency_code)
         
         if rate:
-            await state.update_data(rate=rate)
+            # FSM data is stored as JSON: money goes in as strings
+            await state.update_data(rate=str(rate))
             await state.set_state(ExchangeStates.ENTER_AMOUNT)
             
             await callback.message.edit_text(
@@ -75,34 +81,30 @@ async def process_currency_selection(callback: types.CallbackQuery, state: FSMCo
 @handle_errors
 async def process_amount(message: types.Message, state: FSMContext, session):
     """Process amount input"""
+    data = await state.get_data()
+    from_currency = data.get("from_currency")
+    to_currency = data.get("to_currency")
+    rate = to_decimal(data.get("rate"))
+    
     try:
-        amount = float(message.text.replace(',', '.'))
-        if amount <= 0:
-            raise ValueError("Amount must be positive")
+        amount = parse_amount(message.text, from_currency)
     except ValueError:
         await message.answer("Будь ласка, введіть коректну суму у вигляді числа (наприклад, 100 або 100.50).")
         return
     
-    data = await state.get_data()
-    from_currency = data.get("from_currency")
-    to_currency = data.get("to_currency")
-    rate = data.get("rate")
+    amount_to = convert(amount, rate, to_currency)
     
-    amount_to = amount * rate
+    await state.update_data(amount_from=str(amount), amount_to=str(amount_to))
     
-    await state.update_data(amount_from=amount, amount_to=amount_to)
-    
-    # Check if we need to select a bank (for fiat currencies)
-    if to_currency == "UAH":
-        banks = await get_banks_for_currency(session, to_currency)
-        if banks:
-            await state.set_state(ExchangeStates.SELECT_BANK)
-            await message.answer(
-                f"Ви хочете обміняти {amount} {from_currency} на {amount_to:.2f} {to_currency}.\n\n"
-                f"Оберіть банк для отримання коштів:",
-                reply_markup=get_bank_selection()
-            )
-            return
+    # Currencies with banks in the reference data are paid out to a bank
+    if reference_data.snapshot.banks_for(to_currency):
+        await state.set_state(ExchangeStates.SELECT_BANK)
+        await message.answer(
+            f"Ви хочете обміняти {amount} {from_currency} на {amount_to:.2f} {to_currency}.\n\n"
+            f"Оберіть банк для отримання коштів:",
+            reply_markup=get_bank_selection(to_currency)
+        )
+        return
     
     # If no bank selection needed, go to payment details
     await state.set_state(ExchangeStates.ENTER_PAYMENT_DETAILS)
@@ -124,7 +126,7 @@ async def process_bank_selection(callback: types.CallbackQuery, state: FSMContex
         data = await state.get_data()
         from_currency = data.get("from_currency")
         to_currency = data.get("to_currency")
-        rate = data.get("rate")
+        rate = to_decimal(data.get("rate"))
         
         await callback.message.edit_text(
             f"Обмін {from_currency} → {to_currency}\n"
@@ -138,13 +140,13 @@ async def process_bank_selection(callback: types.CallbackQuery, state: FSMContex
     bank_id = int(parts[1])
     await state.update_data(bank_id=bank_id)
     
-    bank = session.query(Bank).filter(Bank.id == bank_id).first()
+    bank = reference_data.snapshot.bank(bank_id)
     if bank:
         await state.update_data(bank_name=bank.name)
     
     data = await state.get_data()
-    amount_from = data.get("amount_from")
-    amount_to = data.get("amount_to")
+    amount_from = to_decimal(data.get("amount_from"))
+    amount_to = to_decimal(data.get("amount_to"))
     from_currency = data.get("from_currency")
     to_currency = data.get("to_currency")
     
@@ -158,6 +160,13 @@ async def process_bank_selection(callback: types.CallbackQuery, state: FSMContex
     await callback.answer()
 
 
+def save_new_order(sync_session, order):
+    """Insert the order with its statistics rollup and commit in one DB-thread call, so no write lock outlives it"""
+    sync_session.add(order)
+    order_stats.record_created(sync_session, order)
+    sync_session.commit()
+
+
 @router.message(ExchangeStates.ENTER_PAYMENT_DETAILS)
 @handle_errors
 async def process_payment_details(message: types.Message, state: FSMContext, db_user: dict, session):
@@ -171,14 +180,15 @@ async def process_payment_details(message: types.Message, state: FSMContext, db_
     data = await state.get_data()
     from_currency = data.get("from_currency")
     to_currency = data.get("to_currency")
-    amount_from = data.get("amount_from")
-    amount_to = data.get("amount_to")
-    rate = data.get("rate")
+    amount_from = to_decimal(data.get("amount_from"))
+    amount_to = to_decimal(data.get("amount_to"))
+    rate = to_decimal(data.get("rate"))
     bank_id = data.get("bank_id")
     
     # Get currency objects
-    from_curr = session.query(Currency).filter(Currency.code == from_currency).first()
-    to_curr = session.query(Currency).filter(Currency.code == to_currency).first()
+    snapshot = reference_data.snapshot
+    from_curr = snapshot.currency(from_currency)
+    to_curr = snapshot.currency(to_currency)
     
     if not from_curr or not to_curr:
         await message.answer("Помилка при створенні заявки. Спробуйте пізніше.")
@@ -198,62 +208,22 @@ async def process_payment_details(message: types.Message, state: FSMContext, db_
         details=payment_details
     )
     
-    session.add(new_order)
-    session.commit()
+    await session.run_sync(save_new_order, new_order)
+    order_expiry.schedule(new_order)
     order_id = new_order.id
+    bind_log_context(order_id=order_id)
 
-    # Получаем объекты для уведомления менеджера
-    user = session.query(User).filter(User.telegram_id == db_user['telegram_id']).first()
-    bank = session.query(Bank).filter(Bank.id == bank_id).first() if bank_id else None
+    # Customer comes from the profile cache, codes and bank name from the reference map
+    manager_text = await order_card(session, new_order, NEW_ORDER_NOTICE)
 
-    # Формируем текст для менеджера
-    manager_text = (
-        f"🆕 <b>Нова заявка #{order_id}</b>\n\n"
-        f"👤 Користувач: {user.first_name or ''} {user.last_name or ''} "
-        f"(@{user.username or 'немає'}, ID: {user.telegram_id})\n"
-        f"💱 Обмін: {amount_from} {from_currency} → {amount_to:.2f} {to_currency}\n"
-        f"📊 Курс: 1 {from_currency} = {rate:.2f} {to_currency}\n"
-    )
-    if bank:
-        manager_text += f"🏦 Банк: {bank.name}\n"
-
-    manager_text += (
-        f"📝 Реквізити: <code>{payment_details}</code>\n"
-        f"📅 Дата: {new_order.created_at.strftime('%d.%m.%Y %H:%M')}\n"
-        f"⏳ Статус: {new_order.status.value}"
-    )
+    notifier.notify_managers(manager_text, parse_mode="HTML")
 
-    for manager_id in MANAGER_IDS:
-        try:
-            await message.bot.send_message(
-                chat_id=manager_id,
-                text=manager_text,
-                parse_mode="HTML"
-            )
-        except Exception as e:
-            logger.error(f"Не вдалося надіслати заявку менеджеру {manager_id}: {e}")
-
-        
     # Clear state and send confirmation
     await state.clear()
     
     # Send confirmation to user
-    confirmation_text = (
-        f"✅ <b>Заявка #{order_id} створена!</b>\n\n"
-        f"💱 Обмін: {amount_from} {from_currency} → {amount_to:.2f} {to_currency}\n"
-        f"📊 Курс: 1 {from_currency} = {rate:.2f} {to_currency}\n"
-    )
-    
-    if bank_id:
-        confirmation_text += f"🏦 Банк: {data.get('bank_name')}\n"
-    
-    confirmation_text += (
-        f"📝 Реквізити: {payment_details}\n\n"
-        f"Для завершення обміну вам потрібно буде відправити {amount_from} {from_currency} "
-        f"на вказані реквізити після підтвердження заявки менеджером.\n\n"
-        f"Статус заявки ви можете перевірити в розділі '📋 Історія'."
-    )
-    
+    confirmation_text = await order_card(session, new_order, CREATED_CONFIRMATION)
+
     await message.answer(
         confirmation_text,
         parse_mode="HTML",
@@ -3,78 +3,133 @@ from aiogram.filters import Command
 from aiogram.fsm.context import FSMContext
 from aiogram.utils.keyboard import InlineKeyboardBuilder
 from datetime import datetime
-from zoneinfo import ZoneInfo
-from typing import Optional, Tuple
+from sqlalchemy import select
 
-from config import MANAGER_IDS
-from keyboards.inline import get_order_actions
+from config import ORDERS_PAGE_SIZE
+from keyboards.inline import get_order_actions, get_pagination_keyboard
 from keyboards.reply import get_main_keyboard, get_manager_keyboard
 from states.manager import ManagerStates
 from utils.error_handler import handle_errors
-from database.models import ORDER_STATUS_LABELS, Order, OrderStatus, User, UserRole, Currency, Bank, ExchangeRate
+from utils.logger import bind_log_context
+from utils.order_cards import (
+    COMPLETED_ROW, MANAGER_CARD, MANAGER_ROW, ORDER_STATUS_EMOJI, invalidate_order_card, load_card_refs, loaded_order_card,
+    order_card
+)
+from utils.db_utils import (
+    load_orders_with_relations, load_orders_page, save_order_message_ids,
+    encode_cursor, decode_cursor
+)
+from services import order_stats
+from services.notifier import notifier
+from services.order_expiry import order_expiry
+from services.order_state import (
+    ACCEPT, COMPLETE, CONFIRM_PAYMENT, REJECT, RELEASE, SET_PAYMENT_DETAILS, transition
+)
+from services.outbox import outbox_worker
+from services.reference_data import reference_data
+from database.models import ACTIVE_ORDER_STATUSES, ORDER_MODELS, Order, OrderStatus, User, UserRole
 import logging
 
 router = Router()
 logger = logging.getLogger(__name__)
 
+ORDER_CHANGED_TEXT = "Заявку вже змінено іншим менеджером або клієнтом. Оновіть список заявок."
+
 # Helper function to check if user is manager or admin
 def is_authorized(user_role):
     return user_role in [UserRole.MANAGER, UserRole.ADMIN]
 
-def get_order_related_data(order, session) -> Tuple[Optional[User], Optional[Currency], Optional[Currency], Optional[Bank]]:
-    user = session.query(User).filter_by(telegram_id=order.user_id).first()
-    from_currency = session.query(Currency).filter_by(id=order.from_currency_id).first()
-    to_currency = session.query(Currency).filter_by(id=order.to_currency_id).first()
-    bank = session.query(Bank).filter_by(id=order.bank_id).first() if order.bank_id else None
-    return user, from_currency, to_currency, bank
+async def get_order_or_respond(callback: types.CallbackQuery, session, order_id: int):
+    order = await session.get(Order, order_id)
+    if not order:
+        return None, callback.answer("Заявка не знайдена")
+    return order, None
 
-def format_order_text(order, user, from_currency, to_currency, bank) -> str:
-    status_emoji = {
-        OrderStatus.CREATED: "🆕",
-        OrderStatus.AWAITING_PAYMENT: "⏳",
-        OrderStatus.PAYMENT_CONFIRMED: "✅",
-        OrderStatus.COMPLETED: "✅",
-        OrderStatus.CANCELLED: "❌",
-    }.get(order.status, "❓")
+def get_order_manager_actions(order):
+    """Inline actions available to a manager for the current order status"""
+    builder = InlineKeyboardBuilder()
+    
+    if order.status == OrderStatus.CREATED:
+        builder.row(
+            types.InlineKeyboardButton(
+                text="✅ Прийняти",
+                callback_data=f"manager:accept:{order.id}"
+            ),
+            types.InlineKeyboardButton(
+                text="❌ Відхилити",
+                callback_data=f"manager:reject:{order.id}"
+            )
+        )
+    elif order.status == OrderStatus.AWAITING_PAYMENT:
+        builder.row(
+            types.InlineKeyboardButton(
+                text="💰 Підтвердити оплату",
+                callback_data=f"manager:confirm_payment:{order.id}"
+            ),
+            types.InlineKeyboardButton(
+                text="❌ Відхилити",
+                callback_data=f"manager:reject:{order.id}"
+            )
+        )
+    elif order.status == OrderStatus.PAYMENT_CONFIRMED:
+        builder.row(
+            types.InlineKeyboardButton(
+                text="✅ Завершити",
+                callback_data=f"manager:complete:{order.id}"
+            ),
+            types.InlineKeyboardButton(
+                text="❌ Відхилити",
+                callback_data=f"manager:reject:{order.id}"
+            )
+        )
+    
+    return builder.as_markup()
 
-    text = (
-        f"{status_emoji} <b>Заявка #{order.id}</b>\n\n"
-        f"Користувач: {user.first_name or ''} {user.last_name or ''} "
-        f"(@{user.username or 'немає'}, ID: {user.telegram_id})\n"
-        f"Обмін: {order.amount_from} {from_currency.code} → {order.amount_to:.2f} {to_currency.code}\n"
-        f"Курс: 1 {from_currency.code} = {order.rate:.2f} {to_currency.code}\n"
+def get_page_cursors(orders, keyset_of):
+    return (
+        "p" + encode_cursor(*keyset_of(orders[0])),
+        "n" + encode_cursor(*keyset_of(orders[-1]))
     )
-    if bank:
-        text += f"Банк: {bank.name}\n"
 
-    text += (
-        f"Реквізити клієнта: <code>{order.details}</code>\n"
-    )
-    if order.manager_payment_details:
-        text += f"Платіжні реквізити менеджера: <code>{order.manager_payment_details}</code>\n"
+def parse_page_callback(data, kinds):
+    """Parse '<prefix>:<page>[:<p|n><cursor>]' into (page, cursor, backward)"""
+    parts = data.split(":")
+    page = int(parts[1])
+    if len(parts) < 3:
+        return page, None, False
+    token = parts[2]
+    return page, decode_cursor(token[1:], kinds), token[0] == "p"
 
-    text += (
-        f"Дата створення: {order.created_at.strftime('%d.%m.%Y %H:%M')}\n"
-        f"Статус: {ORDER_STATUS_LABELS[order.status]}\n"
+async def build_active_orders_page(session, page=1, cursor=None, backward=False):
+    orders, total = await session.run_sync(
+        load_orders_page,
+        lambda model: (model.status.in_(ACTIVE_ORDER_STATUSES),),
+        ('status', 'created_at', 'id'),
+        cursor=cursor,
+        backward=backward
     )
-    return text
-
-async def notify_user(bot, telegram_id: int, text: str, reply_markup=None):
-    try:
-        await bot.send_message(
-            chat_id=telegram_id,
-            text=text,
-            parse_mode="HTML",
-            reply_markup=reply_markup
+    
+    if not orders:
+        return "Немає активних заявок на даний момент.", None
+    
+    total_pages = max(1, -(-total // ORDERS_PAGE_SIZE))
+    page = min(max(page, 1), total_pages)
+    
+    text = f"📝 <b>Активні заявки</b> ({total})\n\n"
+    builder = InlineKeyboardBuilder()
+    for order in orders:
+        emoji = ORDER_STATUS_EMOJI.get(order.status, "❓")
+        text += loaded_order_card(order, MANAGER_ROW)
+        builder.add(
+            types.InlineKeyboardButton(text=f"{emoji} #{order.id}", callback_data=f"manager:order:{order.id}")
         )
-    except Exception as e:
-        logger.error(f"Failed to send notification to user {telegram_id}: {e}")
-
-def get_order_or_respond(callback: types.CallbackQuery, session, order_id: int):
-    order = session.query(Order).filter_by(id=order_id).first()
-    if not order:
-        return None, callback.answer("Заявка не знайдена")
-    return order, None
+    builder.adjust(3)
+    
+    prev_cursor, next_cursor = get_page_cursors(orders, lambda o: (o.status, o.created_at, o.id))
+    pagination = get_pagination_keyboard(page, total_pages, "mgr_orders", prev_cursor, next_cursor)
+    for row in pagination.inline_keyboard:
+        builder.row(*row)
+    return text, builder.as_markup()
 
 @router.message(F.text == "📝 Заявки")
 @handle_errors
@@ -83,66 +138,50 @@ async def cmd_orders(message: types.Message, db_user: dict, session):
         await message.answer("Доступ заборонено. Ця функція доступна тільки для менеджерів.")
         return
     
-    active_statuses = [
-        OrderStatus.CREATED, 
-        OrderStatus.AWAITING_PAYMENT, 
-        OrderStatus.PAYMENT_CONFIRMED
-    ]
+    text, keyboard = await build_active_orders_page(session)
+    await message.answer(text, reply_markup=keyboard)
+
+@router.callback_query(F.data.startswith("mgr_orders:"))
+@handle_errors
+async def paginate_orders(callback: types.CallbackQuery, db_user: dict, session):
+    if not is_authorized(db_user['role']):
+        await callback.answer("Доступ заборонено")
+        return
     
-    orders = session.query(Order).filter(
-        Order.status.in_(active_statuses)
-    ).order_by(Order.created_at).all()
+    page, cursor, backward = parse_page_callback(callback.data, (OrderStatus, datetime, int))
+    text, keyboard = await build_active_orders_page(session, page, cursor, backward)
+    await callback.message.edit_text(text, reply_markup=keyboard)
+    await callback.answer()
+
+@router.callback_query(F.data.startswith("manager:order:"))
+@handle_errors
+async def show_order_card(callback: types.CallbackQuery, db_user: dict, session):
+    """Send the full order card with the actions for its status"""
+    if not is_authorized(db_user['role']):
+        await callback.answer("Доступ заборонено")
+        return
     
+    order_id = int(callback.data.split(":")[2])
+    bind_log_context(order_id=order_id)
+    orders = await session.run_sync(load_orders_with_relations, Order.id == order_id)
     if not orders:
-        await message.answer("Немає активних заявок на даний момент.")
+        await callback.answer("Заявка не знайдена")
         return
     
-    for order in orders:
-        user, from_currency, to_currency, bank = get_order_related_data(order, session)
-        if not user or not from_currency or not to_currency:
-            logger.warning(f"Пропущено заявку #{order.id} через відсутні дані.")
-            continue
-        
-        order_text = format_order_text(order, user, from_currency, to_currency, bank)
-        builder = InlineKeyboardBuilder()
-        
-        if order.status == OrderStatus.CREATED:
-            builder.row(
-                types.InlineKeyboardButton(
-                    text="✅ Прийняти",
-                    callback_data=f"manager:accept:{order.id}"
-                ),
-                types.InlineKeyboardButton(
-                    text="❌ Відхилити",
-                    callback_data=f"manager:reject:{order.id}"
-                )
-            )
-        elif order.status == OrderStatus.AWAITING_PAYMENT:
-            builder.row(
-                types.InlineKeyboardButton(
-                    text="💰 Підтвердити оплату",
-                    callback_data=f"manager:confirm_payment:{order.id}"
-                ),
-                types.InlineKeyboardButton(
-                    text="❌ Відхилити",
-                    callback_data=f"manager:reject:{order.id}"
-                )
-            )
-        elif order.status == OrderStatus.PAYMENT_CONFIRMED:
-            builder.row(
-                types.InlineKeyboardButton(
-                    text="✅ Завершити",
-                    callback_data=f"manager:complete:{order.id}"
-                ),
-                types.InlineKeyboardButton(
-                    text="❌ Відхилити",
-                    callback_data=f"manager:reject:{order.id}"
-                )
-            )
-        
-        order_message = await message.answer(order_text, reply_markup=builder.as_markup())
-        order.message_id = order_message.message_id
-        session.commit()
+    order = orders[0]
+    if not order.customer or not order.from_currency or not order.to_currency:
+        logger.warning(f"Заявка #{order.id} має відсутні дані.")
+        await callback.answer("Дані заявки неповні")
+        return
+    
+    order_text = loaded_order_card(order, MANAGER_CARD)
+    order_message = await callback.message.answer(order_text, reply_markup=get_order_manager_actions(order))
+    await session.run_sync(save_order_message_ids, {order.id: order_message.message_id})
+    await callback.answer()
+
+@router.callback_query(F.data == "ignore")
+async def ignore_callback(callback: types.CallbackQuery):
+    await callback.answer()
 
 @router.callback_query(F.data.startswith("manager:accept:"))
 @handle_errors
@@ -153,7 +192,8 @@ async def accept_order(callback: types.CallbackQuery, db_user: dict, session, st
         return
     
     order_id = int(callback.data.split(":")[2])
-    order = session.query(Order).filter_by(id=order_id).first()
+    bind_log_context(order_id=order_id)
+    order = await session.get(Order, order_id)
     
     if not order:
         await callback.answer("Заявка не знайдена")
@@ -164,10 +204,11 @@ async def accept_order(callback: types.CallbackQuery, db_user: dict, session, st
         return
     
     # Update order status and assign manager
-    order.status = OrderStatus.AWAITING_PAYMENT
-    order.manager_id = db_user['telegram_id']
-    order.updated_at = datetime.now(ZoneInfo("Europe/Kyiv"))
-    session.commit()
+    if not await transition(session, order, ACCEPT, manager_id=db_user['telegram_id']):
+        await callback.answer(ORDER_CHANGED_TEXT)
+        return
+    order_expiry.schedule(order)
+    invalidate_order_card(order.id)
     
     # Сохраняем order_id в FSM для последующей обработки
     await state.update_data(order_id=order_id)
@@ -198,7 +239,8 @@ async def confirm_payment(callback: types.CallbackQuery, db_user: dict, session)
         return
     
     order_id = int(callback.data.split(":")[2])
-    order = session.query(Order).filter_by(id=order_id).first()
+    bind_log_context(order_id=order_id)
+    order = await session.get(Order, order_id)
     
     if not order:
         await callback.answer("Заявка не знайдена")
@@ -208,29 +250,20 @@ async def confirm_payment(callback: types.CallbackQuery, db_user: dict, session)
         await callback.answer(f"Заявка в неправильному статусі: {order.status.value}")
         return
     
-    # Update order status
-    order.status = OrderStatus.PAYMENT_CONFIRMED
-    order.updated_at = datetime.now(ZoneInfo("Europe/Kyiv"))
-    session.commit()
-    
-    # Notify customer
-    user = session.query(User).filter_by(telegram_id=order.user_id).first()
-    to_currency = session.query(Currency).filter_by(id=order.to_currency_id).first()
+    refs = await load_card_refs(session, order, customer=False)
     
     customer_notification = (
         f"✅ <b>Оплату для заявки #{order.id} підтверджено!</b>\n\n"
-        f"Ми обробляємо ваш обмін і скоро відправимо {order.amount_to:.2f} {to_currency.code} "
+        f"Ми обробляємо ваш обмін і скоро відправимо {order.amount_to:.2f} {refs.to_code} "
         f"на вказані вами реквізити."
     )
     
-    try:
-        await callback.bot.send_message(
-            chat_id=user.telegram_id,
-            text=customer_notification,
-            parse_mode="HTML"
-        )
-    except Exception as e:
-        logger.error(f"Failed to send notification to user {user.telegram_id}: {e}")
+    # Update order status and notify customer in the same transaction
+    if not await transition(session, order, CONFIRM_PAYMENT, notices=[(order.user_id, customer_notification)]):
+        await callback.answer(ORDER_CHANGED_TEXT)
+        return
+    outbox_worker.wake()
+    invalidate_order_card(order.id)
     
     # Update the callback message
     await callback.message.edit_text(
@@ -254,7 +287,8 @@ async def complete_order(callback: types.CallbackQuery, db_user: dict, session):
         return
     
     order_id = int(callback.data.split(":")[2])
-    order = session.query(Order).filter_by(id=order_id).first()
+    bind_log_context(order_id=order_id)
+    order = await session.get(Order, order_id)
     
     if not order:
         await callback.answer("Заявка не знайдена")
@@ -264,30 +298,20 @@ async def complete_order(callback: types.CallbackQuery, db_user: dict, session):
         await callback.answer(f"Заявка в неправильному статусі: {order.status.value}")
         return
     
-    # Update order status
-    order.status = OrderStatus.COMPLETED
-    order.updated_at = datetime.now(ZoneInfo("Europe/Kyiv"))
-    order.completed_at = datetime.now(ZoneInfo("Europe/Kyiv"))
-    session.commit()
-    
-    # Notify customer
-    user = session.query(User).filter_by(telegram_id=order.user_id).first()
-    to_currency = session.query(Currency).filter_by(id=order.to_currency_id).first()
+    refs = await load_card_refs(session, order, customer=False)
     
     customer_notification = (
         f"✅ <b>Заявку #{order.id} завершено!</b>\n\n"
-        f"Ми відправили {order.amount_to:.2f} {to_currency.code} на вказані вами реквізити.\n\n"
+        f"Ми відправили {order.amount_to:.2f} {refs.to_code} на вказані вами реквізити.\n\n"
         f"Дякуємо за використання нашого сервісу! Будемо раді бачити вас знову."
     )
     
-    try:
-        await callback.bot.send_message(
-            chat_id=user.telegram_id,
-            text=customer_notification,
-            parse_mode="HTML"
-        )
-    except Exception as e:
-        logger.error(f"Failed to send notification to user {user.telegram_id}: {e}")
+    # Update order status and notify customer in the same transaction
+    if not await transition(session, order, COMPLETE, notices=[(order.user_id, customer_notification)]):
+        await callback.answer(ORDER_CHANGED_TEXT)
+        return
+    outbox_worker.wake()
+    invalidate_order_card(order.id)
     
     # Update the callback message
     await callback.message.edit_text(
@@ -306,7 +330,8 @@ async def reject_order(callback: types.CallbackQuery, db_user: dict, session, st
         return
     
     order_id = int(callback.data.split(":")[2])
-    order = session.query(Order).filter_by(id=order_id).first()
+    bind_log_context(order_id=order_id)
+    order = await session.get(Order, order_id)
     
     if not order:
         await callback.answer("Заявка не знайдена")
@@ -340,13 +365,14 @@ async def process_rejection_comment(message: types.Message, db_user: dict, sessi
     # Get order_id from FSM context
     data = await state.get_data()
     order_id = data.get("order_id")
+    bind_log_context(order_id=order_id)
     
     if not order_id:
         await message.answer("Помилка: ID заявки не знайдено.")
         await state.clear()
         return
     
-    order = session.query(Order).filter_by(id=order_id).first()
+    order = await session.get(Order, order_id)
     if not order:
         await message.answer("Заявка не знайдена.")
         await state.clear()
@@ -359,35 +385,29 @@ async def process_rejection_comment(message: types.Message, db_user: dict, sessi
     
     # Store the rejection comment
     rejection_reason = message.text
-    order.rejection_reason = rejection_reason
-    order.status = OrderStatus.CANCELLED
-    order.updated_at = datetime.now(ZoneInfo("Europe/Kyiv"))
-    session.commit()
-    
-    # Notify customer
-    user = session.query(User).filter_by(telegram_id=order.user_id).first()
-    
     customer_notification = (
         f"❌ <b>Заявку #{order.id} скасовано</b>\n\n"
         f"Причина: {rejection_reason}\n\n"
         f"Якщо у вас виникли питання, зверніться до підтримки через меню 'Підтримка'."
     )
-    
-    try:
-        await message.bot.send_message(
-            chat_id=user.telegram_id,
-            text=customer_notification,
-            parse_mode="HTML"
-        )
-    except Exception as e:
-        logger.error(f"Failed to send notification to user {user.telegram_id}: {e}")
+    if not await transition(
+        session, order, REJECT,
+        notices=[(order.user_id, customer_notification)],
+        rejection_reason=rejection_reason
+    ):
+        await message.answer(ORDER_CHANGED_TEXT, reply_markup=get_manager_keyboard())
+        await state.clear()
+        return
+    outbox_worker.wake()
+    invalidate_order_card(order.id)
     
     # Update the original order message
+    order_text = await order_card(session, order, MANAGER_CARD)
     try:
         await message.bot.edit_message_text(
             chat_id=message.chat.id,
             message_id=order.message_id if hasattr(order, 'message_id') else message.message_id,
-            text=f"{format_order_text(order, user, *get_order_related_data(order, session)[1:])}\n\n❌ Заявку скасовано. Причина: {rejection_reason}",
+            text=f"{order_text}\n\n❌ Заявку скасовано. Причина: {rejection_reason}",
             parse_mode="HTML",
             reply_markup=None
         )
@@ -402,6 +422,31 @@ async def process_rejection_comment(message: types.Message, db_user: dict, sessi
     # Clear FSM state
     await state.clear()
 
+async def build_completed_orders_page(session, page=1, cursor=None, backward=False):
+    completed_orders, total = await session.run_sync(
+        load_orders_page,
+        lambda model: (model.status == OrderStatus.COMPLETED,),
+        ('completed_at', 'id'),
+        cursor=cursor,
+        backward=backward,
+        descending=True,
+        models=ORDER_MODELS
+    )
+    
+    if not completed_orders:
+        return "Немає завершених заявок.", None
+    
+    total_pages = max(1, -(-total // ORDERS_PAGE_SIZE))
+    page = min(max(page, 1), total_pages)
+    
+    text = "✅ <b>Останні завершені заявки:</b>\n\n"
+    
+    for order in completed_orders:
+        text += loaded_order_card(order, COMPLETED_ROW)
+    
+    prev_cursor, next_cursor = get_page_cursors(completed_orders, lambda o: (o.completed_at, o.id))
+    return text, get_pagination_keyboard(page, total_pages, "mgr_done", prev_cursor, next_cursor)
+
 @router.message(F.text == "✅ Завершені")
 @handle_errors
 async def cmd_completed_orders(message: types.Message, db_user: dict, session):
@@ -410,29 +455,90 @@ async def cmd_completed_orders(message: types.Message, db_user: dict, session):
         await message.answer("Доступ заборонено. Ця функція доступна тільки для менеджерів.")
         return
     
-    # Get completed orders
-    completed_orders = session.query(Order).filter(
-        Order.status == OrderStatus.COMPLETED
-    ).order_by(Order.completed_at.desc()).limit(10).all()
-    
-    if not completed_orders:
-        await message.answer("Немає завершених заявок.")
+    text, keyboard = await build_completed_orders_page(session)
+    await message.answer(text, parse_mode="HTML", reply_markup=keyboard)
+
+@router.callback_query(F.data.startswith("mgr_done:"))
+@handle_errors
+async def paginate_completed_orders(callback: types.CallbackQuery, db_user: dict, session):
+    if not is_authorized(db_user['role']):
+        await callback.answer("Доступ заборонено")
         return
     
-    text = "✅ <b>Останні завершені заявки:</b>\n\n"
-    
-    for order in completed_orders:
-        user = session.query(User).filter_by(telegram_id=order.user_id).first()
-        from_currency = session.query(Currency).filter_by(id=order.from_currency_id).first()
-        to_currency = session.query(Currency).filter_by(id=order.to_currency_id).first()
-        
+    page, cursor, backward = parse_page_callback(callback.data, (datetime, int))
+    text, keyboard = await build_completed_orders_page(session, page, cursor, backward)
+    await callback.message.edit_text(text, parse_mode="HTML", reply_markup=keyboard)
+    await callback.answer()
+
+STATS_DEFAULT_DAYS = 7
+STATS_MAX_DAYS = 366
+
+def format_duration(duration):
+    minutes = int(duration.total_seconds()) // 60
+    hours, minutes = divmod(minutes, 60)
+    return f"{hours} год {minutes:02d} хв" if hours else f"{minutes} хв"
+
+def format_stats(summary, days, manager_names):
+    snapshot = reference_data.snapshot
+    text = f"📊 <b>Статистика за {days} дн.</b> (з {summary['since'].strftime('%d.%m.%Y')})\n\n"
+    if not summary['pairs']:
+        return text + "Немає заявок за цей період."
+    
+    for (from_id, to_id), counters in sorted(summary['pairs'].items()):
+        from_curr, to_curr = snapshot.currency_by_id(from_id), snapshot.currency_by_id(to_id)
+        from_code = from_curr.code if from_curr else f"#{from_id}"
+        to_code = to_curr.code if to_curr else f"#{to_id}"
         text += (
-            f"<b>Заявка #{order.id}</b> ({order.completed_at.strftime('%d.%m.%Y %H:%M')})\n"
-            f"Користувач: {user.first_name or ''} (@{user.username or 'немає'})\n"
-            f"Обмін: {order.amount_from} {from_currency.code} → {order.amount_to:.2f} {to_currency.code}\n\n"
+            f"<b>{from_code} → {to_code}</b>\n"
+            f"Створено: {counters['created']}, завершено: {counters['completed']}, "
+            f"скасовано: {counters['cancelled']}\n"
+        )
+        if counters['completed']:
+            text += (
+                f"Обсяг: {counters['volume_from']} {from_code} → {counters['volume_to']:.2f} {to_code}\n"
+                f"Середній курс: {order_stats.average_rate(counters):.4f}\n"
+                f"Середній час виконання: {format_duration(order_stats.average_complete_time(counters))}\n"
+            )
+        text += "\n"
+    
+    if summary['managers']:
+        text += "<b>Менеджери</b>\n"
+        for manager_id, counters in sorted(summary['managers'].items(), key=lambda item: -item[1]['completed']):
+            text += f"{manager_names.get(manager_id) or manager_id}: завершено {counters['completed']}, скасовано {counters['cancelled']}"
+            if counters['completed']:
+                text += f", в середньому {format_duration(order_stats.average_complete_time(counters))}"
+            text += "\n"
+    return text
+
+@router.message(F.text == "📊 Статистика")
+@router.message(Command("stats"))
+@handle_errors
+async def cmd_stats(message: types.Message, db_user: dict, session):
+    """Order statistics of the last days, read from the daily rollups: /stats [days]"""
+    if not is_authorized(db_user['role']):
+        await message.answer("Доступ заборонено. Ця функція доступна тільки для менеджерів.")
+        return
+    
+    days = STATS_DEFAULT_DAYS
+    command_parts = message.text.split()
+    if command_parts[0].startswith("/") and len(command_parts) > 1:
+        try:
+            days = int(command_parts[1])
+            if not 1 <= days <= STATS_MAX_DAYS:
+                raise ValueError
+        except ValueError:
+            await message.answer(f"Використання: /stats [КІЛЬКІСТЬ_ДНІВ], від 1 до {STATS_MAX_DAYS}")
+            return
+    
+    summary = await session.run_sync(order_stats.load_summary, days)
+    manager_names = {}
+    if summary['managers']:
+        rows = await session.rows(
+            select(User.telegram_id, User.first_name).where(User.telegram_id.in_(list(summary['managers'])))
         )
+        manager_names = {telegram_id: first_name for telegram_id, first_name in rows}
     
-    await message.answer(text, parse_mode="HTML")
+    await message.answer(format_stats(summary, days, manager_names), parse_mode="HTML")
 
 @router.message(Command("reply"))
 @handle_errors
@@ -456,7 +562,7 @@ async def cmd_reply_to_user(message: types.Message, db_user: dict, session):
         return
     
     # Check if user exists
-    user = session.query(User).filter_by(telegram_id=user_id).first()
+    user = await session.scalar(select(User).filter_by(telegram_id=user_id))
     if not user:
         await message.answer(f"Користувач з ID {user_id} не знайдений.")
         return
@@ -506,7 +612,7 @@ async def cmd_close_chat(message: types.Message, db_user: dict, session):
         return
     
     # Check if user exists
-    user = session.query(User).filter_by(telegram_id=user_id).first()
+    user = await session.scalar(select(User).filter_by(telegram_id=user_id))
     if not user:
         await message.answer(f"Користувач з ID {user_id} не знайдений.")
         return
@@ -533,16 +639,8 @@ async def cmd_close_chat(message: types.Message, db_user: dict, session):
             f"завершив чат з користувачем {user_first_name} (@{user_username}, ID: {user_id})."
         )
         
-        for manager_id in MANAGER_IDS:
-            if manager_id != message.from_user.id:  # Don't send to the closing manager
-                try:
-                    await message.bot.send_message(
-                        chat_id=manager_id,
-                        text=chat_closed_notification,
-                        parse_mode="HTML"
-                    )
-                except Exception as e:
-                    print(f"Failed to send notification to manager {manager_id}: {e}")
+        # Don't send to the closing manager
+        notifier.notify_managers(chat_closed_notification, exclude=message.from_user.id, parse_mode="HTML")
         
         await message.answer(f"✅ Чат з користувачем {user_id} успішно завершено.")
         
@@ -560,13 +658,14 @@ async def process_payment_details(message: types.Message, db_user: dict, session
     # Получаем order_id из FSM
     data = await state.get_data()
     order_id = data.get("order_id")
+    bind_log_context(order_id=order_id)
     
     if not order_id:
         await message.answer("Помилка: ID заявки не знайдено.")
         await state.clear()
         return
     
-    order = session.query(Order).filter_by(id=order_id).first()
+    order = await session.get(Order, order_id)
     if not order:
         await message.answer("Заявка не знайдена.")
         await state.clear()
@@ -574,49 +673,49 @@ async def process_payment_details(message: types.Message, db_user: dict, session
     
     if message.text == "🔙 Скасувати введення реквізитів":
         # Возвращаем заявку в статус CREATED и очищаем менеджера
-        order.status = OrderStatus.CREATED
-        order.manager_id = None
-        session.commit()
+        if await transition(session, order, RELEASE, manager_id=None):
+            order_expiry.schedule(order)
+            invalidate_order_card(order.id)
+            text = "Введення реквізитів скасовано. Заявка повернута до статусу 'Створена'."
+        else:
+            text = ORDER_CHANGED_TEXT
         
-        await message.answer(
-            "Введення реквізитів скасовано. Заявка повернута до статусу 'Створена'.",
-            reply_markup=get_manager_keyboard()
-        )
+        await message.answer(text, reply_markup=get_manager_keyboard())
         await state.clear()
         return
     
     # Сохраняем введенные реквизиты в новое поле
     manager_payment_details = message.text
-    order.manager_payment_details = manager_payment_details
-    session.commit()
     
     # Получаем данные для уведомления клиента
-    user = session.query(User).filter_by(telegram_id=order.user_id).first()
-    from_currency = session.query(Currency).filter_by(id=order.from_currency_id).first()
+    refs = await load_card_refs(session, order, customer=False)
     
     customer_notification = (
         f"✅ <b>Заявку #{order.id} прийнято!</b>\n\n"
-        f"Для продовження, будь ласка, відправте {order.amount_from} {from_currency.code} на наступні реквізити:\n\n"
+        f"Для продовження, будь ласка, відправте {order.amount_from} {refs.from_code} на наступні реквізити:\n\n"
         f"<code>{manager_payment_details}</code>\n\n"
         f"Після оплати натисніть кнопку 'Я оплатив' у деталях заявки."
     )
-    
-    try:
-        await notify_user(
-            bot=message.bot,
-            telegram_id=user.telegram_id,
-            text=customer_notification,
-            reply_markup=get_order_actions(order.id, OrderStatus.AWAITING_PAYMENT.value)
-        )
-    except Exception as e:
-        logger.error(f"Failed to send notification to user {user.telegram_id}: {e}")
+    notice = (order.user_id, customer_notification, get_order_actions(order.id, OrderStatus.AWAITING_PAYMENT.value))
+    
+    if not await transition(
+        session, order, SET_PAYMENT_DETAILS,
+        notices=[notice],
+        manager_payment_details=manager_payment_details
+    ):
+        await message.answer(ORDER_CHANGED_TEXT, reply_markup=get_manager_keyboard())
+        await state.clear()
+        return
+    outbox_worker.wake()
+    invalidate_order_card(order.id)
     
     # Обновляем сообщение в чате менеджера
+    order_text = await order_card(session, order, MANAGER_CARD)
     try:
         await message.bot.edit_message_text(
             chat_id=message.chat.id,
             message_id=order.message_id if hasattr(order, 'message_id') else message.message_id,
-            text=f"{format_order_text(order, user, *get_order_related_data(order, session)[1:])}\n\n✅ Заявку прийнято. Клієнту надіслано реквізити.",
+            text=f"{order_text}\n\n✅ Заявку прийнято. Клієнту надіслано реквізити.",
             parse_mode="HTML",
             reply_markup=None
         )
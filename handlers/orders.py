@@ -1,30 +1,21 @@
 from aiogram import F, Dispatcher, types
 from aiogram.utils.keyboard import InlineKeyboardBuilder
 from aiogram.types import InlineKeyboardButton
-from config import MANAGER_IDS
-from database.models import ORDER_STATUS_LABELS, Order, OrderStatus, User, Currency, Bank
-from sqlalchemy import desc
-from database.db_operations import get_session
-from datetime import datetime
+from database.models import Order, OrderStatus
 
 from keyboards.inline import get_order_actions
-from utils import logger
+from services.notifier import notifier
+from services.order_state import CANCEL_BY_USER, MARK_PAID, transition
+from utils.db_utils import load_customer_orders
+from utils.logger import bind_log_context
+from utils.order_cards import CUSTOMER_DETAILS, CUSTOMER_ROW, PAID_NOTICE, invalidate_order_card, order_card
 
-async def show_user_orders(message: types.Message):
+ORDER_CHANGED_TEXT = "Статус заявки щойно змінився. Відкрийте заявку ще раз."
+
+async def show_user_orders(message: types.Message, db_user: dict, session):
     """Показывает историю заявок пользователя"""
-    user_id = message.from_user.id
-    
-    engine = message.bot.get("db_engine")
-    session = get_session(engine)
-    
     try:
-        db_user = session.query(User).filter_by(telegram_id=user_id).first()
-        
-        if not db_user:
-            await message.answer("Помилка при отриманні даних користувача.")
-            return
-        
-        orders = session.query(Order).filter_by(user_id=db_user.id).order_by(desc(Order.created_at)).limit(10).all()
+        orders = await session.run_sync(load_customer_orders, db_user['telegram_id'], 10)
         
         if not orders:
             await message.answer("У вас ще немає жодної заявки на обмін.")
@@ -33,24 +24,7 @@ async def show_user_orders(message: types.Message):
         text = "📋 <b>Ваші останні заявки:</b>\n\n"
         
         for order in orders:
-            from_currency = session.query(Currency).filter_by(id=order.from_currency_id).first()
-            to_currency = session.query(Currency).filter_by(id=order.to_currency_id).first()
-            
-            status_emoji = {
-                OrderStatus.CREATED: "🆕",
-                OrderStatus.AWAITING_PAYMENT: "⏳",
-                OrderStatus.PAYMENT_CONFIRMED: "✅",
-                OrderStatus.PROCESSING: "⚙️",
-                OrderStatus.COMPLETED: "✅",
-                OrderStatus.CANCELLED: "❌"
-            }
-
-            text += (
-                f"<b>Заявка #{order.id}</b> ({order.created_at.strftime('%d.%m.%Y %H:%M')})\n"
-                f"Напрямок: {from_currency.code} → {to_currency.code}\n"
-                f"Сума: {order.amount_from:.2f} {from_currency.code} → {order.amount_to:.2f} {to_currency.code}\n"
-                f"Статус: {status_emoji.get(order.status, '❓')} {ORDER_STATUS_LABELS[order.status]}\n\n"
-            )
+            text += await order_card(session, order, CUSTOMER_ROW)
             
             # Добавляем кнопки действий для активных заявок
             if order.status in [OrderStatus.CREATED, OrderStatus.AWAITING_PAYMENT]:
@@ -74,66 +48,24 @@ async def show_user_orders(message: types.Message):
     
     except Exception as e:
         await message.answer(f"Помилка при отриманні заявок: {e}")
-    finally:
-        session.close()
 
-async def show_order_details(callback: types.CallbackQuery):
+async def show_order_details(callback: types.CallbackQuery, session):
     """Показывает детали заявки"""
     await callback.answer()
     
     # Получаем ID заявки из callback_data
     order_id = int(callback.data.split(":")[2])
-    
-    engine = callback.bot.get("db_engine")
-    session = get_session(engine)
+    bind_log_context(order_id=order_id)
     
     try:
         # Получаем заявку из БД
-        order = session.query(Order).filter_by(id=order_id).first()
+        order = await session.get(Order, order_id)
         
         if not order:
             await callback.message.answer("Заявку не знайдено.")
             return
         
-        # Получаем данные о валютах и банке
-        from_currency = session.query(Currency).filter_by(id=order.from_currency_id).first()
-        to_currency = session.query(Currency).filter_by(id=order.to_currency_id).first()
-        bank = session.query(Bank).filter_by(id=order.bank_id).first() if order.bank_id else None
-        
-        status_text = {
-            OrderStatus.CREATED: "Створено",
-            OrderStatus.AWAITING_PAYMENT: "Очікує оплати",
-            OrderStatus.PAYMENT_CONFIRMED: "Оплату підтверджено",
-            OrderStatus.PROCESSING: "В обробці",
-            OrderStatus.COMPLETED: "Завершено",
-            OrderStatus.CANCELLED: "Скасовано"
-        }
-        
-        text = (
-            f"📋 <b>Деталі заявки #{order.id}</b>\n\n"
-            f"Дата створення: {order.created_at.strftime('%d.%m.%Y %H:%M')}\n"
-            f"Напрямок: {from_currency.code} → {to_currency.code}\n"
-            f"Сума: {order.amount_from:.2f} {from_currency.code} → {order.amount_to:.2f} {to_currency.code}\n"
-            f"Курс: 1 {from_currency.code} = {order.rate:.2f} {to_currency.code}\n"
-        )
-        
-        if bank:
-            text += f"Банк: {bank.name}\n"
-        
-        if order.details:
-            text += f"Реквізити: <code>{order.details}</code>\n"
-        
-        text += f"Статус: {ORDER_STATUS_LABELS[order.status]}\n"
-        
-        # Добавляем инструкции в зависимости от статуса
-        if order.status == OrderStatus.AWAITING_PAYMENT:
-            text += (
-                "\n<b>Інструкції для оплати:</b>\n"
-                "1. Відправте вказану суму на реквізити:\n"
-                "<code>Будуть надані менеджером</code>\n"
-                "2. Після оплати натисніть кнопку 'Я оплатив'\n"
-                "3. Дочекайтесь підтвердження від менеджера"
-            )
+        text = await order_card(session, order, CUSTOMER_DETAILS)
         
         builder = InlineKeyboardBuilder()
         
@@ -155,8 +87,6 @@ async def show_order_details(callback: types.CallbackQuery):
     
     except Exception as e:
         await callback.message.answer(f"Помилка при отриманні деталей заявки: {e}")
-    finally:
-        session.close()
 
 async def mark_order_as_paid(callback: types.CallbackQuery, session):
     """Отмечает заявку как оплаченную"""
@@ -164,11 +94,12 @@ async def mark_order_as_paid(callback: types.CallbackQuery, session):
     
     # Получаем ID заявки из callback_data
     order_id = int(callback.data.split(":")[2])
+    bind_log_context(order_id=order_id)
     
     
     try:
         # Получаем заявку из БД
-        order = session.query(Order).filter_by(id=order_id).first()
+        order = await session.get(Order, order_id)
         
         if not order:
             await callback.message.answer("Заявку не знайдено.")
@@ -179,9 +110,10 @@ async def mark_order_as_paid(callback: types.CallbackQuery, session):
             return
         
         # Обновляем статус
-        order.status = OrderStatus.PAYMENT_CONFIRMED
-        order.updated_at = datetime.utcnow()
-        session.commit()
+        if not await transition(session, order, MARK_PAID):
+            await callback.message.answer(ORDER_CHANGED_TEXT)
+            return
+        invalidate_order_card(order.id)
         
         await callback.message.answer(
             "✅ Заявку позначено як оплачену!\n\n"
@@ -189,33 +121,10 @@ async def mark_order_as_paid(callback: types.CallbackQuery, session):
             "Ми повідомимо вас про зміну статусу."
         )
 
-        user = session.query(User).filter(User.telegram_id == order.user_id).first()
-        bank = session.query(Bank).filter(Bank.id == order.bank_id).first() if order.bank_id else None
-        from_curr = session.query(Currency).filter(Currency.id == order.from_currency_id).first()
-        to_curr = session.query(Currency).filter(Currency.id == order.to_currency_id).first()
-
         # Текст уведомления менеджеру
-        notify_text = (
-            f"💰 <b>Клієнт підтвердив оплату по заявці #{order_id}</b>\n\n"
-            f"👤 {user.first_name or ''} {user.last_name or ''} "
-            f"(@{user.username or 'немає'}, ID: {user.telegram_id})\n"
-            f"💱 Обмін: {order.amount_from} {from_curr.code} → {order.amount_to:.2f} {to_curr.code}\n"
-            f"📊 Курс: 1 {from_curr.code} = {order.rate:.2f} {to_curr.code}\n"
-        )
-        if bank:
-            notify_text += f"🏦 Банк: {bank.name}\n"
+        notify_text = await order_card(session, order, PAID_NOTICE)
 
-        notify_text += (
-            f"📝 Реквізити: <code>{order.details}</code>\n"
-            f"📅 Дата створення: {order.created_at.strftime('%d.%m.%Y %H:%M')}\n"
-            f"⏳ Новий статус: {order.status.value}"
-        )
-
-        for manager_id in MANAGER_IDS:
-            try:
-                await callback.bot.send_message(manager_id, notify_text, parse_mode="HTML")
-            except Exception as e:
-                logger.error(f"Не вдалося повідомити менеджера {manager_id}: {e}")
+        notifier.notify_managers(notify_text, parse_mode="HTML")
 
         await callback.message.edit_reply_markup(reply_markup=get_order_actions(order_id, "paid"))
         await callback.answer("Дякуємо! Менеджер буде повідомлений про оплату.")
@@ -223,8 +132,6 @@ async def mark_order_as_paid(callback: types.CallbackQuery, session):
     
     except Exception as e:
         await callback.message.answer(f"Помилка при оновленні статусу заявки: {e}")
-    finally:
-        session.close()
 
 async def cancel_order_by_user(callback: types.CallbackQuery, session):
     """Отмена заявки пользователем"""
@@ -232,10 +139,11 @@ async def cancel_order_by_user(callback: types.CallbackQuery, session):
     
     # Получаем ID заявки из callback_data
     order_id = int(callback.data.split(":")[2])
+    bind_log_context(order_id=order_id)
     
     try:
         # Получаем заявку из БД
-        order = session.query(Order).filter_by(id=order_id).first()
+        order = await session.get(Order, order_id)
         
         if not order:
             await callback.message.answer("Заявку не знайдено.")
@@ -246,9 +154,10 @@ async def cancel_order_by_user(callback: types.CallbackQuery, session):
             return
         
         # Обновляем статус
-        order.status = OrderStatus.CANCELLED
-        order.updated_at = datetime.utcnow()
-        session.commit()
+        if not await transition(session, order, CANCEL_BY_USER):
+            await callback.message.answer(ORDER_CHANGED_TEXT)
+            return
+        invalidate_order_card(order.id)
         
         await callback.message.answer("❌ Заявку скасовано.")
         
@@ -257,15 +166,13 @@ async def cancel_order_by_user(callback: types.CallbackQuery, session):
     
     except Exception as e:
         await callback.message.answer(f"Помилка при скасуванні заявки: {e}")
-    finally:
-        session.close()
 
-async def show_orders_list(callback: types.CallbackQuery):
+async def show_orders_list(callback: types.CallbackQuery, db_user: dict, session):
     """Возвращает к списку заявок"""
     await callback.answer()
     
     # Создаем новое сообщение со списком заявок
-    await show_user_orders(callback.message)
+    await show_user_orders(callback.message, db_user, session)
 
 def setup(dp: Dispatcher):
     """Регистрация обработчиков"""
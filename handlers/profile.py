@@ -14,11 +14,10 @@ router = Router()
 @handle_errors
 async def cmd_profile(message: types.Message, db_user: dict, session):
     """Handler for profile command"""
-    from database.models import Order
-    from sqlalchemy.orm import Session
     from keyboards.inline import get_profile_settings
+    from utils.db_utils import load_customer_orders
     
-    orders = session.query(Order).filter(Order.user_id == db_user['telegram_id']).order_by(Order.created_at.desc()).limit(5).all()
+    orders = await session.run_sync(load_customer_orders, db_user['telegram_id'], 5, with_relations=True)
     
     profile_text = f"📋 <b>Ваш профіль</b>\n\n"
     profile_text += f"👤 <b>Ім'я:</b> {message.from_user.first_name}\n"
@@ -79,10 +78,10 @@ async def save_contacts(message: types.Message, state: FSMContext, db_user: dict
         return
     
 
-    user = session.query(User).filter(User.id == db_user['telegram_id']).first()
+    user = await session.get(User, db_user['telegram_id'])
     if user:
         user.contact_info = new_contact
-        session.commit()
+        await session.commit()
     
     await state.clear()
     await message.answer(
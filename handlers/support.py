@@ -4,7 +4,7 @@ from aiogram.fsm.state import State, StatesGroup
 from keyboards.reply import get_main_keyboard, get_support_keyboard
 from states.support import SupportStates
 from utils.error_handler import handle_errors
-import config
+from services.notifier import notifier
 
 router = Router()
 
@@ -47,15 +47,7 @@ async def process_support_message(message: types.Message, state: FSMContext):
     )
 
     # Отправка уведомления менеджерам
-    for manager_id in config.MANAGER_IDS:
-        try:
-            await message.bot.send_message(
-                chat_id=manager_id,
-                text=manager_notification,
-                parse_mode="HTML"
-            )
-        except Exception as e:
-            print(f"Failed to send message to manager {manager_id}: {e}")
+    notifier.notify_managers(manager_notification, parse_mode="HTML")
 
     await message.answer(
         "✅ Ваш запит успішно відправлено менеджеру!\n"
@@ -93,15 +85,7 @@ async def continue_support_chat(message: types.Message, state: FSMContext):
         )
         
         # Send notification to all managers
-        for manager_id in config.MANAGER_IDS:
-            try:
-                await message.bot.send_message(
-                    chat_id=manager_id,
-                    text=chat_ended_notification,
-                    parse_mode="HTML"
-                )
-            except Exception as e:
-                print(f"Failed to send notification to manager {manager_id}: {e}")
+        notifier.notify_managers(chat_ended_notification, parse_mode="HTML")
         
         # Clear the state
         await state.clear()
@@ -116,15 +100,7 @@ async def continue_support_chat(message: types.Message, state: FSMContext):
     )
 
     # Send message to all managers
-    for manager_id in config.MANAGER_IDS:
-        try:
-            await message.bot.send_message(
-                chat_id=manager_id,
-                text=manager_notification,
-                parse_mode="HTML"
-            )
-        except Exception as e:
-            print(f"Failed to send message to manager {manager_id}: {e}")
+    notifier.notify_managers(manager_notification, parse_mode="HTML")
 
     await message.answer(
         "✅ Ваше повідомлення відправлено менеджеру.",
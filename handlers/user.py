@@ -1,11 +1,11 @@
 from aiogram import Router, F, types
 from aiogram.fsm.context import FSMContext
 
-from database.models import ORDER_STATUS_LABELS
 from keyboards.inline import get_currencies_selection, get_pagination_keyboard
 from states.exchange import ExchangeStates
 from utils.error_handler import handle_errors
-from utils.db_utils import get_all_currencies, get_exchange_rate
+from utils.db_utils import get_all_currencies, get_exchange_rate, load_customer_orders
+from utils.order_cards import HISTORY_ROW, order_card
 from keyboards.reply import get_support_keyboard
 from states.support import SupportStates
 router = Router()
@@ -39,29 +39,13 @@ async def show_rates(message: types.Message, db_user: dict, session):
 @router.message(F.text == "📋 Історія")
 @handle_errors
 async def show_history(message: types.Message, db_user: dict, session):
-    from database.models import Order, OrderStatus
-    orders = session.query(Order).filter(Order.user_id == db_user['telegram_id']).order_by(Order.created_at.desc()).limit(5).all()
+    orders = await session.run_sync(load_customer_orders, db_user['telegram_id'], 5)
     if not orders:
         await message.answer("У вашій історії ще немає заявок на обмін.")
         return
     history_text = "📝 <b>Ваша історія заявок</b>\n\n"
     for order in orders:
-        status_emoji = {
-            OrderStatus.CREATED: "🆕",
-            OrderStatus.AWAITING_PAYMENT: "⏳",
-            OrderStatus.PAYMENT_CONFIRMED: "✅",
-            OrderStatus.PROCESSING: "⚙️",
-            OrderStatus.COMPLETED: "✅",
-            OrderStatus.CANCELLED: "❌"
-        }.get(order.status, "❓")
-        history_text += (
-            f"<b>Заявка #{order.id}</b> {status_emoji}\n"
-            f"📅 {order.created_at.strftime('%d.%m.%Y %H:%M')}\n"
-            f"💱 {order.amount_from} {order.from_currency.code} → "
-            f"{order.amount_to} {order.to_currency.code}\n"
-            f"📊 Курс: {order.rate:.2f}\n"
-            f"📑 Статус: {ORDER_STATUS_LABELS[order.status]}\n\n"
-        )
+        history_text += await order_card(session, order, HISTORY_ROW)
     await message.answer(
         history_text,
         parse_mode="HTML",
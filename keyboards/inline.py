@@ -1,23 +1,36 @@
+from functools import lru_cache
+
 from aiogram.types import InlineKeyboardMarkup, InlineKeyboardButton
 from aiogram.utils.keyboard import InlineKeyboardBuilder
 
+from services.reference_data import reference_data
+
+# Shown before the code on currency buttons
+CURRENCY_SYMBOLS = {"USDT": "₮", "USD": "$", "UAH": "₴"}
+
+
 def get_currencies_selection(from_to="from", selected_currency=None):
+    """
+    Клавіатура вибору валюти з активних валют довідника
+
+    Markup будується один раз на версію довідника і далі береться з кешу.
+    """
+    return _currencies_selection(reference_data.snapshot.version, from_to, selected_currency)
+
+
+@lru_cache(maxsize=64)
+def _currencies_selection(version, from_to, selected_currency):
     builder = InlineKeyboardBuilder()
     
-    currencies = [
-        {"code": "USDT", "symbol": "₮"},
-        # {"code": "USD", "symbol": "$"},
-        {"code": "UAH", "symbol": "₴"}
-    ]
-    
-    for currency in currencies:
-        if selected_currency and currency["code"] == selected_currency:
+    for currency in reference_data.snapshot.enabled_currencies:
+        if selected_currency and currency.code == selected_currency:
             continue
         
+        symbol = CURRENCY_SYMBOLS.get(currency.code)
         builder.row(
             InlineKeyboardButton(
-                text=f"{currency['symbol']} {currency['code']}",
-                callback_data=f"currency:{from_to}:{currency['code']}"
+                text=f"{symbol} {currency.code}" if symbol else currency.code,
+                callback_data=f"currency:{from_to}:{currency.code}"
             )
         )
     
@@ -29,23 +42,22 @@ def get_currencies_selection(from_to="from", selected_currency=None):
     return builder.as_markup()
 
 
-def get_bank_selection():
+def get_bank_selection(currency_code="UAH"):
     """
-    Створює інлайн-клавіатуру для вибору банку (для UAH)
+    Створює інлайн-клавіатуру для вибору банку з активних банків валюти
     """
+    return _bank_selection(reference_data.snapshot.version, currency_code)
+
+
+@lru_cache(maxsize=64)
+def _bank_selection(version, currency_code):
     builder = InlineKeyboardBuilder()
     
-    banks = [
-        {"id": 1, "name": "ПриватБанк"},
-        {"id": 2, "name": "Монобанк"},
-        {"id": 3, "name": "ПУМБ"}
-    ]
-    
-    for bank in banks:
+    for bank in reference_data.snapshot.banks_for(currency_code):
         builder.row(
             InlineKeyboardButton(
-                text=bank["name"],
-                callback_data=f"bank:{bank['id']}"
+                text=bank.name,
+                callback_data=f"bank:{bank.id}"
             )
         )
     
@@ -82,12 +94,14 @@ def get_order_actions(order_id, status):
     return builder.as_markup()
 
 
-def get_pagination_keyboard(page=1, total_pages=1, prefix="page"):
+def get_pagination_keyboard(page=1, total_pages=1, prefix="page", prev_cursor=None, next_cursor=None):
     """
     Створює інлайн-клавіатуру для пагінації
     :param page: поточна сторінка
     :param total_pages: всього сторінок
     :param prefix: префікс для callback_data
+    :param prev_cursor: ключ для переходу на попередню сторінку (keyset-пагінація)
+    :param next_cursor: ключ для переходу на наступну сторінку (keyset-пагінація)
     """
     builder = InlineKeyboardBuilder()
     
@@ -95,7 +109,10 @@ def get_pagination_keyboard(page=1, total_pages=1, prefix="page"):
     
     if page > 1:
         buttons.append(
-            InlineKeyboardButton(text="⬅️", callback_data=f"{prefix}:{page-1}")
+            InlineKeyboardButton(
+                text="⬅️",
+                callback_data=f"{prefix}:{page-1}:{prev_cursor}" if prev_cursor else f"{prefix}:{page-1}"
+            )
         )
     
     buttons.append(
@@ -104,7 +121,10 @@ def get_pagination_keyboard(page=1, total_pages=1, prefix="page"):
     
     if page < total_pages:
         buttons.append(
-            InlineKeyboardButton(text="➡️", callback_data=f"{prefix}:{page+1}")
+            InlineKeyboardButton(
+                text="➡️",
+                callback_data=f"{prefix}:{page+1}:{next_cursor}" if next_cursor else f"{prefix}:{page+1}"
+            )
         )
     
     builder.row(*buttons)
@@ -112,6 +132,7 @@ def get_pagination_keyboard(page=1, total_pages=1, prefix="page"):
     return builder.as_markup()
 
 
+@lru_cache(maxsize=None)
 def get_profile_settings():
     """
     Створює інлайн-клавіатуру для налаштувань профілю
@@ -1,9 +1,15 @@
+from functools import lru_cache
+
 from aiogram.types import ReplyKeyboardMarkup, KeyboardButton
 from aiogram.utils.keyboard import ReplyKeyboardBuilder
 
+@lru_cache(maxsize=None)
 def get_main_keyboard():
     """
     Створює основну клавіатуру для користувача
+
+    Статичні клавіатури будуються один раз; markup не змінюється після
+    створення, тому один об'єкт використовується для всіх відповідей.
     """
     builder = ReplyKeyboardBuilder()
     
@@ -21,6 +27,7 @@ def get_main_keyboard():
     
     return builder.as_markup(resize_keyboard=True)
 
+@lru_cache(maxsize=None)
 def get_manager_keyboard():
     """
     Створює клавіатуру для менеджера
@@ -33,11 +40,13 @@ def get_manager_keyboard():
     )
     
     builder.row(
+        KeyboardButton(text="📊 Статистика"),
         KeyboardButton(text="👤 Профіль")
     )
     
     return builder.as_markup(resize_keyboard=True)
 
+@lru_cache(maxsize=None)
 def get_admin_keyboard():
     """
     Створює клавіатуру для адміністратора
@@ -56,6 +65,7 @@ def get_admin_keyboard():
     
     return builder.as_markup(resize_keyboard=True)
 
+@lru_cache(maxsize=None)
 def get_support_keyboard():
     """
     Створює клавіатуру для меню підтримки
@@ -1,36 +1,66 @@
 import asyncio
+import tempfile
+from datetime import datetime
+from pathlib import Path
+from zoneinfo import ZoneInfo
+
+from aiohttp import web
 from aiogram import Bot, Dispatcher, Router, types
+from aiogram.types import FSInputFile
 from aiogram.filters import Command
-from aiogram.fsm.storage.memory import MemoryStorage
 from aiogram.enums import ParseMode
 from aiogram.client.default import DefaultBotProperties
+from aiogram.client.session.aiohttp import AiohttpSession
+from aiogram.client.telegram import TelegramAPIServer
+from aiogram.webhook.aiohttp_server import SimpleRequestHandler, setup_application
 
 import config
-from database.db_operations import get_engine, init_db, get_session, setup_initial_data
+from database.async_session import run_in_db_thread
+from database.db_operations import get_engine, init_db, get_session, get_async_session, setup_initial_data
 from database.models import User, UserRole
 from keyboards.reply import get_main_keyboard, get_manager_keyboard, get_admin_keyboard
+from middlewares.log_context_middleware import LogContextMiddleware
+from middlewares.metrics_middleware import MetricsMiddleware, TelegramAPIMetricsMiddleware
 from middlewares.user_middleware import UserMiddleware
+from services import order_export, order_stats
+from services.fsm_storage import create_fsm_storage
+from services.notifier import notifier
+from services.order_archive import order_archiver
+from services.order_expiry import order_expiry
+from services.outbox import outbox_worker
+from services.rate_feed import rate_feed
+from services.reference_data import reference_data
+from services.user_activity import activity_flusher
 from utils.logger import setup_logger
 from utils.error_handler import handle_errors
+from utils.metrics import start_metrics_server
 from handlers import setup_handlers
 
 logger = setup_logger(__name__)
 
 bot = Bot(
     token=config.BOT_TOKEN,
+    session=AiohttpSession(api=TelegramAPIServer.from_base(config.TELEGRAM_API_SERVER))
+    if config.TELEGRAM_API_SERVER else None,
     default=DefaultBotProperties(parse_mode=ParseMode.HTML)
 )
-storage = MemoryStorage()
-dp = Dispatcher(storage=storage)
-
-fallback_router = Router()
+bot.session.middleware(TelegramAPIMetricsMiddleware())
 
 engine = get_engine(config.DATABASE_URL)
 init_db(engine)
 db_session = get_session(engine)
 setup_initial_data(db_session)
 db_session.close()
+reference_data.load(engine)
+
+storage = create_fsm_storage(engine)
+dp = Dispatcher(storage=storage)
+
+fallback_router = Router()
 
+dp.update.outer_middleware(LogContextMiddleware())
+dp.message.middleware(MetricsMiddleware())
+dp.callback_query.middleware(MetricsMiddleware())
 dp.message.middleware(UserMiddleware(engine))
 dp.callback_query.middleware(UserMiddleware(engine))
 
@@ -61,9 +91,62 @@ async def cmd_help(message: types.Message):
     )
     await message.answer(help_text)
 
-async def on_startup():
-    logger.info("Bot started")
-    session = get_session(engine)
+@dp.message(Command("reload"))
+@handle_errors
+async def cmd_reload(message: types.Message, db_user: dict):
+    """Re-read currencies, banks and settings after editing them in the database"""
+    if db_user['role'] != UserRole.ADMIN:
+        return
+    changed = await reference_data.refresh()
+    snapshot = reference_data.snapshot
+    await message.answer(
+        f"Довідник оновлено до версії {snapshot.version}." if changed
+        else f"Довідник не змінився (версія {snapshot.version})."
+    )
+
+@dp.message(Command("stats_rebuild"))
+@handle_errors
+async def cmd_stats_rebuild(message: types.Message, db_user: dict):
+    """Recompute the statistics rollups from all orders, e.g. after upgrading a database with history"""
+    if db_user['role'] != UserRole.ADMIN:
+        return
+    orders = await run_in_db_thread(order_stats.rebuild, engine)
+    await message.answer(f"Статистику перераховано за {orders} заявками.")
+
+@dp.message(Command("export"))
+@handle_errors
+async def cmd_export(message: types.Message, db_user: dict):
+    """Order history as a CSV file: /export orders|turnover [DAYS]"""
+    if db_user['role'] != UserRole.ADMIN:
+        return
+    usage = "Використання: /export orders|turnover [КІЛЬКІСТЬ_ДНІВ]"
+    kind, days, fmt = None, None, 'csv'
+    for arg in message.text.lower().split()[1:]:
+        if arg in order_export.EXPORTS:
+            kind = arg
+        elif arg in order_export.FORMATS:
+            fmt = arg
+        elif arg.isdigit() and int(arg) > 0:
+            days = int(arg)
+        else:
+            kind = None
+            break
+    if kind is None:
+        await message.answer(usage)
+        return
+    
+    await message.answer("⏳ Формую звіт...")
+    with tempfile.TemporaryDirectory() as directory:
+        path = Path(directory) / f"{kind}_{datetime.now(ZoneInfo('Europe/Kyiv')):%Y%m%d}.{fmt}"
+        rows = await run_in_db_thread(order_export.EXPORTS[kind], engine, path, fmt, days)
+        size = path.stat().st_size
+        if size > config.EXPORT_MAX_FILE_SIZE:
+            await message.answer(f"Файл завеликий ({size // 1024 ** 2} МБ). Вкажіть менший період.")
+            return
+        period = f"за {days} дн." if days else "за весь час"
+        await message.answer_document(FSInputFile(path), caption=f"{kind} {period}: {rows} рядків")
+
+def sync_staff_roles(session):
     for admin_id in config.ADMIN_IDS:
         from database.db_operations import create_admin_user
         create_admin_user(session, admin_id)
@@ -75,16 +158,95 @@ async def on_startup():
             new_manager = User(telegram_id=manager_id, role=UserRole.MANAGER)
             session.add(new_manager)
     session.commit()
-    session.close()
+
+metrics_runner = None
+
+async def on_startup(metrics_port=config.METRICS_PORT, worker=None):
+    """
+    worker is the index of a cluster.py worker process, None for a single process
+
+    The outbox, expiry and archive loops run in one process only (worker 0):
+    other workers' outbox rows and new deadlines are picked up by its polls
+    and rescans. Caches, the rate feed and activity buffers are per process.
+    """
+    global metrics_runner
+    logger.info("Bot started")
+    async with get_async_session(engine) as session:
+        await session.run_sync(sync_staff_roles)
+    activity_flusher.start(engine)
+    notifier.start(bot, processes=1 if worker is None else config.BOT_WORKERS)
+    reference_data.start()
+    rate_feed.start(engine)
+    if not worker:
+        outbox_worker.start(engine, notifier)
+        order_expiry.start(engine)
+        order_archiver.start(engine)
+    if metrics_port:
+        metrics_runner = await start_metrics_server(config.METRICS_HOST, metrics_port)
+        logger.info(f"Metrics available on http://{config.METRICS_HOST}:{metrics_port}/metrics")
 
 async def on_shutdown():
+    global metrics_runner
+    if metrics_runner is not None:
+        await metrics_runner.cleanup()
+        metrics_runner = None
+    await order_archiver.stop()
+    await order_expiry.stop()
+    await rate_feed.stop()
+    await reference_data.stop()
+    await outbox_worker.stop()
+    await notifier.stop()
+    await activity_flusher.stop()
+    await storage.close()
     logger.info("Bot stopped")
 
+def create_webhook_app():
+    """aiohttp application that feeds Telegram webhook requests into the dispatcher"""
+    app = web.Application()
+    # Updates are handled in background tasks, so Telegram gets 200 at once
+    # and slow handlers of one chat do not delay the others
+    SimpleRequestHandler(
+        dispatcher=dp,
+        bot=bot,
+        secret_token=config.WEBHOOK_SECRET,
+        handle_in_background=True
+    ).register(app, path=config.WEBHOOK_PATH)
+    setup_application(app, dp, bot=bot)
+    return app
+
+async def run_webhook():
+    app = create_webhook_app()
+    runner = web.AppRunner(app)
+    await runner.setup()
+    site = web.TCPSite(runner, config.WEBHOOK_HOST, config.WEBHOOK_PORT)
+    await site.start()
+    logger.info(f"Webhook server listening on {config.WEBHOOK_HOST}:{config.WEBHOOK_PORT}{config.WEBHOOK_PATH}")
+
+    if config.WEBHOOK_URL:
+        await bot.set_webhook(
+            f"{config.WEBHOOK_URL.rstrip('/')}{config.WEBHOOK_PATH}",
+            secret_token=config.WEBHOOK_SECRET,
+            allowed_updates=dp.resolve_used_update_types()
+        )
+    else:
+        logger.warning("WEBHOOK_URL is not set, the webhook has to be registered manually")
+
+    try:
+        await asyncio.Event().wait()
+    finally:
+        await runner.cleanup()
+        await bot.session.close()
+
 async def main():
     try:
         await on_startup()
         setup_handlers(dp)
-        await dp.start_polling(bot)
+        if config.BOT_MODE == 'webhook':
+            await run_webhook()
+        else:
+            # getUpdates does not work while a webhook is set
+            await bot.delete_webhook()
+            await dp.start_polling(bot)
     finally:
         await on_shutdown()
         
@@ -1,3 +1,5 @@
+from .log_context_middleware import LogContextMiddleware
+from .metrics_middleware import MetricsMiddleware, TelegramAPIMetricsMiddleware
 from .user_middleware import UserMiddleware
 
-__all__ = ["UserMiddleware"]
\ No newline at end of file
+__all__ = ["LogContextMiddleware", "MetricsMiddleware", "TelegramAPIMetricsMiddleware", "UserMiddleware"]
@@ -0,0 +1,29 @@
+from typing import Any, Awaitable, Callable, Dict
+
+from aiogram import BaseMiddleware
+from aiogram.types import TelegramObject, Update
+
+from utils.logger import log_context
+
+
+class LogContextMiddleware(BaseMiddleware):
+    """
+    Outer update middleware: every record logged while an update is handled,
+    DB threads included, carries its update_id and user_id
+    """
+
+    async def __call__(
+        self,
+        handler: Callable[[TelegramObject, Dict[str, Any]], Awaitable[Any]],
+        event: TelegramObject,
+        data: Dict[str, Any]
+    ) -> Any:
+        context = {'update_id': event.update_id} if isinstance(event, Update) else {}
+        user = data.get('event_from_user')
+        if user is not None:
+            context['user_id'] = user.id
+        token = log_context.set(context)
+        try:
+            return await handler(event, data)
+        finally:
+            log_context.reset(token)
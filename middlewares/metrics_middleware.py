@@ -0,0 +1,57 @@
+import time
+from typing import Any, Awaitable, Callable, Dict
+
+from aiogram import BaseMiddleware
+from aiogram.client.session.middlewares.base import BaseRequestMiddleware
+from aiogram.types import TelegramObject
+
+from utils.metrics import (
+    HANDLER_DB_QUERIES, HANDLER_DB_SECONDS, HANDLER_DURATION, HANDLER_ERRORS,
+    TELEGRAM_API_DURATION, TELEGRAM_API_ERRORS, HandlerStats, current_handler_stats, handler_name
+)
+
+
+class MetricsMiddleware(BaseMiddleware):
+    """
+    Records latency, SQL statement count and DB time per handler
+
+    Has to be registered before UserMiddleware, so that the user lookup is
+    counted as part of the handler.
+    """
+
+    async def __call__(
+        self,
+        handler: Callable[[TelegramObject, Dict[str, Any]], Awaitable[Any]],
+        event: TelegramObject,
+        data: Dict[str, Any]
+    ) -> Any:
+        handler_object = data.get('handler')
+        name = handler_name(handler_object.callback) if handler_object else 'unknown'
+        stats = HandlerStats()
+        token = current_handler_stats.set(stats)
+        started = time.perf_counter()
+        try:
+            return await handler(event, data)
+        except Exception:
+            HANDLER_ERRORS.inc(handler=name)
+            raise
+        finally:
+            HANDLER_DURATION.observe(time.perf_counter() - started, handler=name)
+            HANDLER_DB_QUERIES.observe(stats.queries, handler=name)
+            HANDLER_DB_SECONDS.inc(stats.db_seconds, handler=name)
+            current_handler_stats.reset(token)
+
+
+class TelegramAPIMetricsMiddleware(BaseRequestMiddleware):
+    """Bot session middleware timing every Bot API request"""
+
+    async def __call__(self, make_request, bot, method):
+        name = type(method).__name__
+        started = time.perf_counter()
+        try:
+            return await make_request(bot, method)
+        except Exception as e:
+            TELEGRAM_API_ERRORS.inc(method=name, error=type(e).__name__)
+            raise
+        finally:
+            TELEGRAM_API_DURATION.observe(time.perf_counter() - started, method=name)
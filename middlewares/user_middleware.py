@@ -2,10 +2,11 @@ from typing import Any, Awaitable, Callable, Dict
 from zoneinfo import ZoneInfo
 from aiogram import BaseMiddleware
 from aiogram.types import TelegramObject, Message, CallbackQuery
-from database.db_operations import get_session, get_or_create_user
+from database.db_operations import get_async_session, get_or_create_user
 from database.models import UserRole
 from datetime import datetime
 from sqlalchemy.exc import SQLAlchemyError
+from services.user_activity import activity_flusher, profile_cache
 import logging
 
 logger = logging.getLogger(__name__)
@@ -34,46 +35,56 @@ class UserMiddleware(BaseMiddleware):
             logger.warning("Invalid or missing user in event")
             return await handler(event, data)
 
-        try:
-            with get_session(self.engine) as session:
-                data['session'] = session
+        session = get_async_session(self.engine)
+        data['session'] = session
 
+        try:
+            try:
+                now = datetime.now(ZoneInfo("Europe/Kyiv"))
                 user_data = {
                     'telegram_id': user.id,
                     'username': sanitize(user.username),
                     'first_name': sanitize(user.first_name),
                     'last_name': sanitize(user.last_name),
-                    'last_active': datetime.now(ZoneInfo("Europe/Kyiv"))
                 }
 
-                db_user = get_or_create_user(session, user_data)
-                session.commit()
+                profile = profile_cache.get(user.id, None)
+                if profile is None or any(profile[k] != v for k, v in user_data.items()):
+                    db_user = await session.run_sync(get_or_create_user, user_data)
+                    profile = {
+                        'telegram_id': db_user.telegram_id,
+                        'username': db_user.username,
+                        'first_name': db_user.first_name,
+                        'last_name': db_user.last_name,
+                        'role': db_user.role,
+                        'last_active': db_user.last_active,
+                        'created_at': db_user.created_at
+                    }
+                    profile_cache.set(user.id, profile)
 
-                data['db_user'] = {
-                    'telegram_id': db_user.telegram_id,
-                    'username': db_user.username,
-                    'first_name': db_user.first_name,
-                    'last_name': db_user.last_name,
-                    'role': db_user.role,
-                    'last_active': db_user.last_active,
-                    'created_at': db_user.created_at
-                }
+                activity_flusher.touch(user.id, now)
+                data['db_user'] = {**profile, 'last_active': now}
 
-                logger.info(f"UserMiddleware processed user ID {user.id} with role {db_user.role.name}")
+                logger.debug(
+                    "UserMiddleware processed user ID %s with role %s", user.id, profile['role'].name,
+                    extra={'sampled': True}
+                )
 
-        except SQLAlchemyError as db_err:
-            logger.error(f"Database error in UserMiddleware: {db_err}", exc_info=True)
-        except Exception as e:
-            logger.exception("Unexpected error in UserMiddleware")
+            except SQLAlchemyError as db_err:
+                logger.error(f"Database error in UserMiddleware: {db_err}", exc_info=True)
+            except Exception as e:
+                logger.exception("Unexpected error in UserMiddleware")
 
-        if 'db_user' not in data:
-            data['db_user'] = {
-                'telegram_id': user.id,
-                'username': sanitize(user.username),
-                'first_name': sanitize(user.first_name),
-                'last_name': sanitize(user.last_name),
-                'role': UserRole.USER,
-                'last_active': datetime.now(ZoneInfo("Europe/Kyiv"))
-            }
+            if 'db_user' not in data:
+                data['db_user'] = {
+                    'telegram_id': user.id,
+                    'username': sanitize(user.username),
+                    'first_name': sanitize(user.first_name),
+                    'last_name': sanitize(user.last_name),
+                    'role': UserRole.USER,
+                    'last_active': datetime.now(ZoneInfo("Europe/Kyiv"))
+                }
 
-        return await handler(event, data)
+            return await handler(event, data)
+        finally:
+            await session.close()
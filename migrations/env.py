@@ -0,0 +1,66 @@
+from logging.config import fileConfig
+
+from alembic import context
+from sqlalchemy import engine_from_config, pool
+
+import config as app_config
+from database.models import Base
+
+config = context.config
+
+# init_db passes its own connection and keeps the bot's logging setup
+connection = config.attributes.get('connection')
+
+if config.config_file_name is not None and connection is None:
+    fileConfig(config.config_file_name)
+
+target_metadata = Base.metadata
+
+
+def get_url():
+    return config.get_main_option('sqlalchemy.url') or app_config.DATABASE_URL
+
+
+def run_migrations_offline() -> None:
+    context.configure(
+        url=get_url(),
+        target_metadata=target_metadata,
+        literal_binds=True,
+        dialect_opts={"paramstyle": "named"},
+        render_as_batch=True,
+    )
+
+    with context.begin_transaction():
+        context.run_migrations()
+
+
+def do_run_migrations(connection) -> None:
+    context.configure(
+        connection=connection,
+        target_metadata=target_metadata,
+        # SQLite cannot ALTER most things in place
+        render_as_batch=connection.dialect.name == 'sqlite',
+    )
+
+    with context.begin_transaction():
+        context.run_migrations()
+
+
+def run_migrations_online() -> None:
+    if connection is not None:
+        do_run_migrations(connection)
+        return
+
+    connectable = engine_from_config(
+        {'sqlalchemy.url': get_url()},
+        prefix='sqlalchemy.',
+        poolclass=pool.NullPool,
+    )
+    with connectable.connect() as conn:
+        do_run_migrations(conn)
+
+
+if context.is_offline_mode():
+    run_migrations_offline()
+else:
+    run_migrations_online()
@@ -0,0 +1,106 @@
+"""initial schema
+
+Revision ID: 0001
+Revises:
+Create Date: 2026-10-18 10:00:00
+
+Matches the tables previously created by Base.metadata.create_all, so
+existing databases are stamped with this revision instead of running it.
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '0001'
+down_revision: Union[str, None] = None
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.create_table(
+        'users',
+        sa.Column('id', sa.Integer(), primary_key=True),
+        sa.Column('telegram_id', sa.Integer(), nullable=False, unique=True),
+        sa.Column('username', sa.String(50), nullable=True),
+        sa.Column('first_name', sa.String(50), nullable=True),
+        sa.Column('last_name', sa.String(50), nullable=True),
+        sa.Column('role', sa.Enum('USER', 'MANAGER', 'ADMIN', name='userrole'), nullable=True),
+        sa.Column('created_at', sa.DateTime(), nullable=True),
+        sa.Column('last_active', sa.DateTime(), nullable=True),
+    )
+    op.create_table(
+        'currencies',
+        sa.Column('id', sa.Integer(), primary_key=True),
+        sa.Column('code', sa.String(10), nullable=False, unique=True),
+        sa.Column('name', sa.String(50), nullable=False),
+        sa.Column('type', sa.Enum('CRYPTO', 'FIAT', name='currencytype'), nullable=False),
+        sa.Column('enabled', sa.Boolean(), nullable=True),
+    )
+    op.create_table(
+        'settings',
+        sa.Column('key', sa.String(50), primary_key=True),
+        sa.Column('value', sa.Text(), nullable=False),
+        sa.Column('description', sa.Text(), nullable=True),
+        sa.Column('updated_at', sa.DateTime(), nullable=True),
+    )
+    op.create_table(
+        'banks',
+        sa.Column('id', sa.Integer(), primary_key=True),
+        sa.Column('name', sa.String(50), nullable=False),
+        sa.Column('enabled', sa.Boolean(), nullable=True),
+        sa.Column('currency_id', sa.Integer(), sa.ForeignKey('currencies.id'), nullable=True),
+    )
+    op.create_table(
+        'exchange_rates',
+        sa.Column('id', sa.Integer(), primary_key=True),
+        sa.Column('from_currency_id', sa.Integer(), sa.ForeignKey('currencies.id'), nullable=False),
+        sa.Column('to_currency_id', sa.Integer(), sa.ForeignKey('currencies.id'), nullable=False),
+        sa.Column('rate', sa.Float(), nullable=False),
+        sa.Column('updated_at', sa.DateTime(), nullable=True),
+    )
+    op.create_table(
+        'orders',
+        sa.Column('id', sa.Integer(), primary_key=True),
+        sa.Column('user_id', sa.Integer(), sa.ForeignKey('users.id'), nullable=False),
+        sa.Column('manager_id', sa.Integer(), sa.ForeignKey('users.id'), nullable=True),
+        sa.Column('from_currency_id', sa.Integer(), sa.ForeignKey('currencies.id'), nullable=False),
+        sa.Column('to_currency_id', sa.Integer(), sa.ForeignKey('currencies.id'), nullable=False),
+        sa.Column('amount_from', sa.Float(), nullable=False),
+        sa.Column('amount_to', sa.Float(), nullable=False),
+        sa.Column('rate', sa.Float(), nullable=False),
+        sa.Column(
+            'status',
+            sa.Enum(
+                'CREATED', 'AWAITING_PAYMENT', 'PAYMENT_CONFIRMED',
+                'PROCESSING', 'COMPLETED', 'CANCELLED',
+                name='orderstatus'
+            ),
+            nullable=True
+        ),
+        sa.Column('bank_id', sa.Integer(), sa.ForeignKey('banks.id'), nullable=True),
+        sa.Column('details', sa.Text(), nullable=True),
+        sa.Column('manager_payment_details', sa.Text(), nullable=True),
+        sa.Column('rejection_reason', sa.String(), nullable=True),
+        sa.Column('message_id', sa.Integer(), nullable=True),
+        sa.Column('created_at', sa.DateTime(), nullable=True),
+        sa.Column('updated_at', sa.DateTime(), nullable=True),
+        sa.Column('completed_at', sa.DateTime(), nullable=True),
+    )
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_table('orders')
+    op.drop_table('exchange_rates')
+    op.drop_table('banks')
+    op.drop_table('settings')
+    op.drop_table('currencies')
+    op.drop_table('users')
+    sa.Enum(name='orderstatus').drop(op.get_bind(), checkfirst=True)
+    sa.Enum(name='currencytype').drop(op.get_bind(), checkfirst=True)
+    sa.Enum(name='userrole').drop(op.get_bind(), checkfirst=True)
@@ -0,0 +1,55 @@
+"""hot path indexes
+
+Revision ID: 0002
+Revises: 0001
+Create Date: 2026-10-18 10:10:00
+
+Indexes for the queries every update runs: manager order lists, user
+history, exchange rate lookups by pair and banks by currency.
+currencies.code and users.telegram_id are already covered by their
+unique constraints.
+"""
+from typing import Sequence, Union
+
+from alembic import op
+
+
+# revision identifiers, used by Alembic.
+revision: str = '0002'
+down_revision: Union[str, None] = '0001'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    # Databases initialised by create_all may already have the pagination indexes
+    op.create_index(
+        'ix_orders_status_created_at_id', 'orders',
+        ['status', 'created_at', 'id'], if_not_exists=True
+    )
+    op.create_index(
+        'ix_orders_status_completed_at_id', 'orders',
+        ['status', 'completed_at', 'id'], if_not_exists=True
+    )
+    op.create_index('ix_orders_user_id_created_at', 'orders', ['user_id', 'created_at'])
+    op.create_index('ix_banks_currency_id', 'banks', ['currency_id'])
+
+    # Keep only the newest row per pair before enforcing uniqueness
+    op.execute(
+        "DELETE FROM exchange_rates WHERE id NOT IN ("
+        "SELECT MAX(id) FROM exchange_rates GROUP BY from_currency_id, to_currency_id)"
+    )
+    op.create_index(
+        'uq_exchange_rates_pair', 'exchange_rates',
+        ['from_currency_id', 'to_currency_id'], unique=True
+    )
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_index('uq_exchange_rates_pair', table_name='exchange_rates')
+    op.drop_index('ix_banks_currency_id', table_name='banks')
+    op.drop_index('ix_orders_user_id_created_at', table_name='orders')
+    op.drop_index('ix_orders_status_completed_at_id', table_name='orders')
+    op.drop_index('ix_orders_status_created_at_id', table_name='orders')
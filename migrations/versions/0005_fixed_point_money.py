@@ -0,0 +1,76 @@
+"""fixed point money
+
+Revision ID: 0005
+Revises: 0004
+Create Date: 2026-10-18 14:00:00
+
+Order amounts and exchange rates become integers of 10**-scale units
+(utils.money.FixedPoint) instead of floats: amounts keep 8 digits after
+the point, rates 10.
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '0005'
+down_revision: Union[str, None] = '0004'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+AMOUNT_SCALE = 8
+RATE_SCALE = 10
+
+COLUMNS = [
+    ('orders', 'amount_from', AMOUNT_SCALE),
+    ('orders', 'amount_to', AMOUNT_SCALE),
+    ('orders', 'rate', RATE_SCALE),
+    ('exchange_rates', 'rate', RATE_SCALE),
+]
+
+
+def _tables():
+    tables = {}
+    for table, column, scale in COLUMNS:
+        tables.setdefault(table, []).append((column, scale))
+    return tables
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    for table, columns in _tables().items():
+        # Scale while the columns are still floats, then change the type;
+        # the values are whole numbers by then, so the cast is exact
+        op.execute(
+            f"UPDATE {table} SET "
+            + ", ".join(f"{column} = ROUND({column} * {10 ** scale})" for column, scale in columns)
+        )
+        with op.batch_alter_table(table) as batch_op:
+            for column, _ in columns:
+                batch_op.alter_column(
+                    column,
+                    existing_type=sa.Float(),
+                    type_=sa.BigInteger(),
+                    existing_nullable=False,
+                    postgresql_using=f"{column}::bigint"
+                )
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    for table, columns in _tables().items():
+        with op.batch_alter_table(table) as batch_op:
+            for column, _ in columns:
+                batch_op.alter_column(
+                    column,
+                    existing_type=sa.BigInteger(),
+                    type_=sa.Float(),
+                    existing_nullable=False,
+                    postgresql_using=f"{column}::double precision"
+                )
+        op.execute(
+            f"UPDATE {table} SET "
+            + ", ".join(f"{column} = {column} / {float(10 ** scale)}" for column, scale in columns)
+        )
@@ -0,0 +1,63 @@
+"""orders archive
+
+Revision ID: 0007
+Revises: 0006
+Create Date: 2026-10-18 16:00:00
+
+Finished orders are moved out of `orders` by services.order_archive.
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+from sqlalchemy.dialects import postgresql
+
+
+# revision identifiers, used by Alembic.
+revision: str = '0007'
+down_revision: Union[str, None] = '0006'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+# Created by 0001 on PostgreSQL
+ORDER_STATUS = postgresql.ENUM(
+    'CREATED', 'AWAITING_PAYMENT', 'PAYMENT_CONFIRMED', 'PROCESSING', 'COMPLETED', 'CANCELLED',
+    name='orderstatus', create_type=False
+)
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.create_table(
+        'orders_archive',
+        sa.Column('id', sa.Integer(), autoincrement=False, nullable=False),
+        sa.Column('user_id', sa.Integer(), nullable=False),
+        sa.Column('manager_id', sa.Integer(), nullable=True),
+        sa.Column('from_currency_id', sa.Integer(), nullable=False),
+        sa.Column('to_currency_id', sa.Integer(), nullable=False),
+        sa.Column('amount_from', sa.BigInteger(), nullable=False),
+        sa.Column('amount_to', sa.BigInteger(), nullable=False),
+        sa.Column('rate', sa.BigInteger(), nullable=False),
+        sa.Column('status', ORDER_STATUS, nullable=True),
+        sa.Column('bank_id', sa.Integer(), nullable=True),
+        sa.Column('details', sa.Text(), nullable=True),
+        sa.Column('manager_payment_details', sa.Text(), nullable=True),
+        sa.Column('rejection_reason', sa.String(), nullable=True),
+        sa.Column('message_id', sa.Integer(), nullable=True),
+        sa.Column('created_at', sa.DateTime(), nullable=True),
+        sa.Column('updated_at', sa.DateTime(), nullable=True),
+        sa.Column('completed_at', sa.DateTime(), nullable=True),
+        sa.Column('version', sa.Integer(), nullable=False),
+        sa.PrimaryKeyConstraint('id')
+    )
+    op.create_index(
+        'ix_orders_archive_status_completed_at_id', 'orders_archive', ['status', 'completed_at', 'id']
+    )
+    op.create_index('ix_orders_archive_user_id_created_at', 'orders_archive', ['user_id', 'created_at'])
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_index('ix_orders_archive_user_id_created_at', table_name='orders_archive')
+    op.drop_index('ix_orders_archive_status_completed_at_id', table_name='orders_archive')
+    op.drop_table('orders_archive')
@@ -0,0 +1,44 @@
+"""order stats daily
+
+Revision ID: 0008
+Revises: 0007
+Create Date: 2026-10-18 17:00:00
+
+Daily order rollups of services.order_stats. Filled from the existing
+orders by the /stats_rebuild admin command.
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '0008'
+down_revision: Union[str, None] = '0007'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.create_table(
+        'order_stats_daily',
+        sa.Column('day', sa.Date(), nullable=False),
+        sa.Column('from_currency_id', sa.Integer(), nullable=False),
+        sa.Column('to_currency_id', sa.Integer(), nullable=False),
+        sa.Column('manager_id', sa.BigInteger(), nullable=False),
+        sa.Column('created', sa.Integer(), nullable=False),
+        sa.Column('completed', sa.Integer(), nullable=False),
+        sa.Column('cancelled', sa.Integer(), nullable=False),
+        sa.Column('volume_from', sa.BigInteger(), nullable=False),
+        sa.Column('volume_to', sa.BigInteger(), nullable=False),
+        sa.Column('rate_sum', sa.BigInteger(), nullable=False),
+        sa.Column('complete_seconds', sa.BigInteger(), nullable=False),
+        sa.PrimaryKeyConstraint('day', 'from_currency_id', 'to_currency_id', 'manager_id')
+    )
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_table('order_stats_daily')
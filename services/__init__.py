@@ -0,0 +1,21 @@
+from .fsm_storage import SQLAlchemyStorage, create_fsm_storage
+from .notifier import Notifier, notifier
+from .order_archive import OrderArchiver, order_archiver
+from .order_expiry import OrderExpiryScheduler, order_expiry
+from .order_state import Transition, transition
+from .outbox import OutboxWorker, enqueue_notification, outbox_worker
+from .rate_feed import RateFeed, create_rate_source, rate_feed
+from .reference_data import ReferenceData, ReferenceSnapshot, reference_data
+from .user_activity import LastActiveFlusher, activity_flusher, profile_cache
+
+__all__ = [
+    "SQLAlchemyStorage", "create_fsm_storage",
+    "Notifier", "notifier",
+    "OrderArchiver", "order_archiver",
+    "OrderExpiryScheduler", "order_expiry",
+    "Transition", "transition",
+    "OutboxWorker", "enqueue_notification", "outbox_worker",
+    "RateFeed", "create_rate_source", "rate_feed",
+    "ReferenceData", "ReferenceSnapshot", "reference_data",
+    "LastActiveFlusher", "activity_flusher", "profile_cache",
+]
@@ -0,0 +1,188 @@
+import asyncio
+import json
+import logging
+from collections import OrderedDict
+from datetime import datetime
+from zoneinfo import ZoneInfo
+
+from aiogram.fsm.state import State
+from aiogram.fsm.storage.base import BaseStorage, DefaultKeyBuilder
+from aiogram.fsm.storage.memory import MemoryStorage
+from sqlalchemy import delete, select
+from sqlalchemy.exc import SQLAlchemyError
+
+import config
+from database.async_session import run_in_db_thread
+from database.models import FSMRecord
+
+logger = logging.getLogger(__name__)
+
+
+class SQLAlchemyStorage(BaseStorage):
+    """
+    FSM storage in the fsm_states table
+
+    Reads are served from an in-process LRU cache, so the FSM middleware
+    costs no query on regular updates. Writes only mark the key dirty;
+    everything changed within FSM_FLUSH_INTERVAL is written in one
+    transaction, and the several set_state/update_data calls a handler
+    makes collapse into a single upsert. Empty records are deleted.
+
+    The cache is per process: when several bot processes share the table,
+    updates of one chat must always be routed to the same process.
+    """
+
+    def __init__(self, engine, flush_interval=config.FSM_FLUSH_INTERVAL, cache_size=config.FSM_CACHE_SIZE):
+        self.engine = engine
+        self.flush_interval = flush_interval
+        self.cache_size = cache_size
+        self.key_builder = DefaultKeyBuilder(with_bot_id=True, with_destiny=True)
+        # key -> [state, data]
+        self._records = OrderedDict()
+        self._dirty = set()
+        self._flush_task = None
+
+    async def _load(self, key):
+        db_key = self.key_builder.build(key)
+        record = self._records.get(db_key)
+        if record is not None:
+            self._records.move_to_end(db_key)
+            return db_key, record
+
+        row = await run_in_db_thread(self._read, db_key)
+        # A write may have happened while we were reading
+        record = self._records.get(db_key)
+        if record is None:
+            record = [row[0], json.loads(row[1]) if row[1] else {}] if row else [None, {}]
+            self._records[db_key] = record
+        return db_key, record
+
+    def _read(self, db_key):
+        with self.engine.connect() as conn:
+            return conn.execute(
+                select(FSMRecord.state, FSMRecord.data).where(FSMRecord.key == db_key)
+            ).first()
+
+    async def set_state(self, key, state=None):
+        db_key, record = await self._load(key)
+        record[0] = state.state if isinstance(state, State) else state
+        self._mark_dirty(db_key)
+
+    async def get_state(self, key):
+        _, record = await self._load(key)
+        return record[0]
+
+    async def set_data(self, key, data):
+        db_key, record = await self._load(key)
+        record[1] = data.copy()
+        self._mark_dirty(db_key)
+
+    async def get_data(self, key):
+        _, record = await self._load(key)
+        return record[1].copy()
+
+    def _mark_dirty(self, db_key):
+        self._dirty.add(db_key)
+        if self._flush_task is None or self._flush_task.done():
+            self._flush_task = asyncio.create_task(self._delayed_flush())
+
+    async def _delayed_flush(self):
+        try:
+            await asyncio.sleep(self.flush_interval)
+        except asyncio.CancelledError:
+            # close() does not want to wait for the interval
+            pass
+        await self.flush()
+
+    async def flush(self):
+        if not self._dirty:
+            return 0
+
+        keys, self._dirty = self._dirty, set()
+        now = datetime.now(ZoneInfo("Europe/Kyiv"))
+        upserts = []
+        deletes = []
+        for db_key in keys:
+            state, data = self._records[db_key]
+            if state is None and not data:
+                deletes.append(db_key)
+            else:
+                upserts.append({
+                    'key': db_key,
+                    'state': state,
+                    'data': json.dumps(data, ensure_ascii=False),
+                    'updated_at': now,
+                })
+
+        try:
+            await run_in_db_thread(self._write, upserts, deletes)
+        except SQLAlchemyError as e:
+            logger.error(f"Failed to flush {len(keys)} FSM records: {e}")
+            self._dirty |= keys
+            return 0
+
+        self._evict()
+        return len(keys)
+
+    def _write(self, upserts, deletes):
+        with self.engine.begin() as conn:
+            if deletes:
+                conn.execute(delete(FSMRecord).where(FSMRecord.key.in_(deletes)))
+            if upserts:
+                conn.execute(self._upsert_statement(conn.dialect.name), upserts)
+
+    @staticmethod
+    def _upsert_statement(dialect_name):
+        if dialect_name == 'postgresql':
+            from sqlalchemy.dialects.postgresql import insert as dialect_insert
+        elif dialect_name == 'sqlite':
+            from sqlalchemy.dialects.sqlite import insert as dialect_insert
+        else:
+            raise NotImplementedError(f"SQLAlchemyStorage has no upsert for {dialect_name}")
+
+        stmt = dialect_insert(FSMRecord)
+        return stmt.on_conflict_do_update(
+            index_elements=[FSMRecord.key],
+            set_={
+                'state': stmt.excluded.state,
+                'data': stmt.excluded.data,
+                'updated_at': stmt.excluded.updated_at,
+            }
+        )
+
+    def _evict(self):
+        """Drop least recently used clean records above cache_size"""
+        excess = len(self._records) - self.cache_size
+        if excess <= 0:
+            return
+        for db_key in list(self._records):
+            if excess <= 0:
+                break
+            if db_key not in self._dirty:
+                del self._records[db_key]
+                excess -= 1
+
+    async def close(self):
+        if self._flush_task is not None and not self._flush_task.done():
+            self._flush_task.cancel()
+            await asyncio.gather(self._flush_task, return_exceptions=True)
+        self._flush_task = None
+        await self.flush()
+
+
+def create_fsm_storage(engine):
+    """Build the FSM storage selected by config.FSM_STORAGE"""
+    if config.FSM_STORAGE == 'memory':
+        return MemoryStorage()
+
+    if config.FSM_STORAGE == 'redis':
+        try:
+            from aiogram.fsm.storage.redis import RedisStorage
+        except ImportError:
+            raise RuntimeError("FSM_STORAGE=redis requires the redis package (pip install redis)")
+        return RedisStorage.from_url(
+            config.REDIS_URL,
+            key_builder=DefaultKeyBuilder(with_bot_id=True, with_destiny=True)
+        )
+
+    return SQLAlchemyStorage(engine)
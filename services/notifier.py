@@ -0,0 +1,107 @@
+import asyncio
+import logging
+import time
+
+from aiogram.exceptions import TelegramRetryAfter
+
+import config
+
+logger = logging.getLogger(__name__)
+
+
+class Notifier:
+    """
+    Sends outgoing notifications off the request path
+
+    A fixed number of worker tasks drain the queue, so the fan-out to all
+    managers runs concurrently with bounded parallelism. Every send first
+    reserves a slot in the global and in the per-chat schedule, which keeps
+    the bot under Telegram's flood limits; RetryAfter postpones the chat
+    for the time Telegram asks for.
+    """
+
+    def __init__(
+        self,
+        concurrency=config.NOTIFY_CONCURRENCY,
+        global_rate=config.NOTIFY_GLOBAL_RATE,
+        per_chat_interval=config.NOTIFY_PER_CHAT_INTERVAL,
+        max_retries=config.NOTIFY_MAX_RETRIES
+    ):
+        self.concurrency = concurrency
+        self.global_rate = global_rate
+        self.global_interval = 1 / global_rate
+        self.per_chat_interval = per_chat_interval
+        self.max_retries = max_retries
+        self.bot = None
+        self._queue = asyncio.Queue()
+        self._workers = []
+        self._next_global = 0.0
+        self._next_per_chat = {}
+
+    def start(self, bot, processes=1):
+        """processes: how many processes send for the same bot; the flood limit is per bot, so they split it"""
+        self.bot = bot
+        self.global_interval = processes / self.global_rate
+        if not self._workers:
+            self._workers = [asyncio.create_task(self._worker()) for _ in range(self.concurrency)]
+
+    async def stop(self, timeout=10):
+        """Give queued notifications a chance to go out, then stop the workers"""
+        if not self._workers:
+            return
+        try:
+            await asyncio.wait_for(self._queue.join(), timeout)
+        except asyncio.TimeoutError:
+            logger.warning(f"Notifier stopped with {self._queue.qsize()} undelivered notifications")
+        for worker in self._workers:
+            worker.cancel()
+        await asyncio.gather(*self._workers, return_exceptions=True)
+        self._workers = []
+
+    def notify(self, chat_id, text, **kwargs):
+        """Queue a message and return immediately"""
+        self._queue.put_nowait((chat_id, text, kwargs))
+
+    def notify_managers(self, text, exclude=None, **kwargs):
+        for manager_id in config.MANAGER_IDS:
+            if manager_id != exclude:
+                self.notify(manager_id, text, **kwargs)
+
+    async def deliver(self, chat_id, text, **kwargs):
+        """Send a message respecting the flood limits; errors other than RetryAfter are raised"""
+        for attempt in range(self.max_retries + 1):
+            await asyncio.sleep(self._reserve(chat_id))
+            try:
+                return await self.bot.send_message(chat_id=chat_id, text=text, **kwargs)
+            except TelegramRetryAfter as e:
+                if attempt == self.max_retries:
+                    raise
+                logger.warning(f"Flood limit for chat {chat_id}, retrying in {e.retry_after}s")
+                self._postpone(chat_id, e.retry_after)
+
+    def _reserve(self, chat_id):
+        """Book the next free send slot and return how long to wait for it"""
+        now = time.monotonic()
+        slot = max(now, self._next_global, self._next_per_chat.get(chat_id, 0.0))
+        self._next_global = slot + self.global_interval
+        self._next_per_chat[chat_id] = slot + self.per_chat_interval
+        if len(self._next_per_chat) > 10000:
+            self._next_per_chat = {k: v for k, v in self._next_per_chat.items() if v > now}
+        return slot - now
+
+    def _postpone(self, chat_id, delay):
+        until = time.monotonic() + delay
+        self._next_per_chat[chat_id] = max(self._next_per_chat.get(chat_id, 0.0), until)
+
+    async def _worker(self):
+        while True:
+            chat_id, text, kwargs = await self._queue.get()
+            try:
+                await self.deliver(chat_id, text, **kwargs)
+            except Exception as e:
+                logger.error(f"Failed to send notification to {chat_id}: {e}")
+            finally:
+                self._queue.task_done()
+
+
+notifier = Notifier()
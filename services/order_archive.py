@@ -0,0 +1,97 @@
+"""
+Archival of finished orders
+
+Orders that are COMPLETED or CANCELLED and were last changed more than
+ORDER_ARCHIVE_AFTER_DAYS ago are moved from `orders` to `orders_archive`,
+ORDER_ARCHIVE_BATCH_SIZE rows per transaction, so the table every manager
+list and customer lookup filters stays small. History views read both
+tables (utils.db_utils.load_customer_orders, load_orders_page with
+ORDER_MODELS).
+"""
+import asyncio
+import logging
+from datetime import datetime, timedelta
+from zoneinfo import ZoneInfo
+
+from sqlalchemy import delete, insert, select
+from sqlalchemy.exc import SQLAlchemyError
+
+import config
+from database.async_session import run_in_db_thread
+from database.models import TERMINAL_ORDER_STATUSES, ArchivedOrder, Order
+
+logger = logging.getLogger(__name__)
+
+_COLUMNS = [column.name for column in ArchivedOrder.__table__.columns]
+
+
+class OrderArchiver:
+    def __init__(self, after_days=config.ORDER_ARCHIVE_AFTER_DAYS, interval=config.ORDER_ARCHIVE_INTERVAL,
+                 batch_size=config.ORDER_ARCHIVE_BATCH_SIZE):
+        self.after = timedelta(days=after_days)
+        self.enabled = after_days > 0
+        self.interval = interval
+        self.batch_size = batch_size
+        self.engine = None
+        self._task = None
+
+    def start(self, engine):
+        self.engine = engine
+        if self._task is None and self.enabled and self.interval > 0:
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+    async def _run(self):
+        while True:
+            await self.archive()
+            await asyncio.sleep(self.interval)
+
+    async def archive(self):
+        """Move every order past the threshold; returns how many were moved"""
+        # updated_at is stored as naive Kyiv time
+        cutoff = datetime.now(ZoneInfo("Europe/Kyiv")).replace(tzinfo=None) - self.after
+        moved = 0
+        while True:
+            try:
+                batch = await run_in_db_thread(self._archive_batch, cutoff)
+            except SQLAlchemyError as e:
+                # Another process may have archived the same rows; the next run retries
+                logger.error(f"Order archival failed after {moved} orders: {e}")
+                break
+            moved += batch
+            if batch < self.batch_size:
+                break
+        if moved:
+            logger.info(f"Archived {moved} orders finished before {cutoff:%d.%m.%Y}")
+        return moved
+
+    def _archive_batch(self, cutoff):
+        with self.engine.begin() as conn:
+            order_ids = conn.execute(
+                select(Order.id)
+                .where(Order.status.in_(TERMINAL_ORDER_STATUSES), Order.updated_at < cutoff)
+                .order_by(Order.id)
+                .limit(self.batch_size)
+                .with_for_update(skip_locked=True)
+            ).scalars().all()
+            if not order_ids:
+                return 0
+            conn.execute(
+                insert(ArchivedOrder).from_select(
+                    _COLUMNS,
+                    select(*[Order.__table__.c[name] for name in _COLUMNS]).where(Order.id.in_(order_ids))
+                )
+            )
+            conn.execute(delete(Order).where(Order.id.in_(order_ids)))
+        return len(order_ids)
+
+
+order_archiver = OrderArchiver()
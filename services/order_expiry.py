@@ -0,0 +1,177 @@
+"""
+Expiry of orders nobody moved forward
+
+An order waiting in CREATED longer than ORDER_CREATED_TTL, or in
+AWAITING_PAYMENT longer than ORDER_AWAITING_PAYMENT_TTL, is cancelled and
+its customer is notified through the outbox.
+
+One task keeps a heap of (deadline, order id) and sleeps until the
+earliest deadline; due orders are cancelled in bulk UPDATEs. Heap entries
+are never removed: when an order moves on, its entry simply stops
+matching, because the UPDATE repeats the status and deadline conditions.
+The heap is rebuilt from the table every ORDER_EXPIRY_RESCAN_INTERVAL,
+which also picks up orders created by other processes.
+"""
+import asyncio
+import heapq
+import logging
+from datetime import datetime, timedelta
+from zoneinfo import ZoneInfo
+
+from sqlalchemy import select, update
+from sqlalchemy.exc import SQLAlchemyError
+from sqlalchemy.orm import Session
+
+import config
+from database.async_session import run_in_db_thread
+from database.models import Order, OrderStatus
+from services import order_stats
+from services.order_state import EXPIRE
+from services.outbox import enqueue_notification, outbox_worker
+from utils.order_cards import invalidate_order_card
+
+logger = logging.getLogger(__name__)
+
+EXPIRED_REASON = "Минув час очікування"
+
+
+def _now():
+    # updated_at is stored as naive Kyiv time
+    return datetime.now(ZoneInfo("Europe/Kyiv")).replace(tzinfo=None)
+
+
+def _naive(moment):
+    return moment.astimezone(ZoneInfo("Europe/Kyiv")).replace(tzinfo=None) if moment.tzinfo else moment
+
+
+class OrderExpiryScheduler:
+    def __init__(self, ttls=None, rescan_interval=config.ORDER_EXPIRY_RESCAN_INTERVAL,
+                 batch_size=config.ORDER_EXPIRY_BATCH_SIZE):
+        if ttls is None:
+            ttls = {
+                OrderStatus.CREATED: config.ORDER_CREATED_TTL,
+                OrderStatus.AWAITING_PAYMENT: config.ORDER_AWAITING_PAYMENT_TTL,
+            }
+        self.ttls = {status: timedelta(seconds=ttl) for status, ttl in ttls.items() if ttl > 0}
+        self.rescan_interval = rescan_interval
+        self.batch_size = batch_size
+        self.engine = None
+        self.expired = 0
+        self._heap = []
+        self._wakeup = asyncio.Event()
+        self._task = None
+
+    def start(self, engine):
+        self.engine = engine
+        if self._task is None and self.ttls:
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+    def schedule(self, order):
+        """Called after a commit that put an order into an expiring status"""
+        ttl = self.ttls.get(order.status)
+        if ttl is None or self._task is None:
+            return
+        deadline = _naive(order.updated_at) + ttl
+        if not self._heap or deadline < self._heap[0][0]:
+            self._wakeup.set()
+        heapq.heappush(self._heap, (deadline, order.id, order.status))
+
+    async def _run(self):
+        next_rescan = None
+        while True:
+            try:
+                if next_rescan is None or _now() >= next_rescan:
+                    self._heap = await run_in_db_thread(self._load)
+                    next_rescan = _now() + timedelta(seconds=self.rescan_interval)
+                await self.expire_due()
+            except SQLAlchemyError as e:
+                logger.error(f"Order expiry database error: {e}")
+
+            wake_at = next_rescan
+            if self._heap and self._heap[0][0] < wake_at:
+                wake_at = self._heap[0][0]
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), max((wake_at - _now()).total_seconds(), 0))
+            except asyncio.TimeoutError:
+                pass
+            self._wakeup.clear()
+
+    def _load(self):
+        with self.engine.connect() as conn:
+            rows = conn.execute(
+                select(Order.id, Order.status, Order.updated_at)
+                .where(Order.status.in_(list(self.ttls)))
+            ).all()
+        heap = [(_naive(row.updated_at) + self.ttls[row.status], row.id, row.status) for row in rows]
+        heapq.heapify(heap)
+        return heap
+
+    async def expire_due(self):
+        """Cancel every order whose deadline has passed; returns how many were cancelled"""
+        now = _now()
+        due = {}
+        while self._heap and self._heap[0][0] <= now:
+            _, order_id, status = heapq.heappop(self._heap)
+            due.setdefault(status, set()).add(order_id)
+        if not due:
+            return 0
+
+        expired = []
+        for status, order_ids in due.items():
+            order_ids = sorted(order_ids)
+            for start in range(0, len(order_ids), self.batch_size):
+                expired += await run_in_db_thread(
+                    self._expire, status, order_ids[start:start + self.batch_size], now
+                )
+        if expired:
+            outbox_worker.wake()
+            for row in expired:
+                invalidate_order_card(row.id)
+            self.expired += len(expired)
+            logger.info(f"Expired {len(expired)} orders")
+        return len(expired)
+
+    def _expire(self, status, order_ids, now):
+        """One UPDATE ... RETURNING per batch; the customers' notices are queued in the same transaction"""
+        with Session(self.engine) as session, session.begin():
+            rows = session.execute(
+                update(Order)
+                .where(
+                    Order.id.in_(order_ids),
+                    Order.status == status,
+                    Order.updated_at <= now - self.ttls[status]
+                )
+                .values(
+                    status=EXPIRE.target,
+                    version=Order.version + 1,
+                    rejection_reason=EXPIRED_REASON,
+                    updated_at=now
+                )
+                .returning(
+                    Order.id, Order.user_id, Order.status, Order.updated_at,
+                    Order.from_currency_id, Order.to_currency_id, Order.manager_id
+                )
+                .execution_options(synchronize_session=False)
+            ).all()
+            order_stats.record(session.connection(), [order_stats.status_row(row) for row in rows])
+            for row in rows:
+                enqueue_notification(
+                    session,
+                    row.user_id,
+                    f"⌛ <b>Заявку #{row.id} скасовано</b>\n\n"
+                    f"Причина: {EXPIRED_REASON.lower()}.\n\n"
+                    f"Якщо обмін ще актуальний, створіть нову заявку через '🔄 Обмін валют'."
+                )
+        return rows
+
+
+order_expiry = OrderExpiryScheduler()
@@ -0,0 +1,268 @@
+"""
+Order history exports
+
+Orders are read from orders and orders_archive as plain rows through a
+streaming cursor (yield_per: a server-side cursor on PostgreSQL), one
+pandas frame per chunk, so memory stays bounded by config.EXPORT_CHUNK_SIZE
+whatever the table size. No ORM objects are built.
+
+Money columns stay integers of 10**-scale units (the raw FixedPoint
+values) while they are processed: sums are exact and every step works on
+whole columns. They become decimal text only when written.
+
+export_orders() writes one line per order; export_turnover() sums the
+completed orders per day, currency pair, manager and bank. Both write CSV.
+"""
+from datetime import datetime, timedelta
+from zoneinfo import ZoneInfo
+
+import numpy as np
+import pandas as pd
+from sqlalchemy import BigInteger, String, func, select, true, type_coerce
+
+import config
+from database.models import ORDER_MODELS, OrderStatus, User
+from services.reference_data import reference_data
+from utils.money import AMOUNT_SCALE, RATE_SCALE, format_minor_units
+
+FORMATS = ('csv',)
+
+ORDER_COLUMNS = (
+    'id', 'created_at', 'completed_at', 'status', 'customer_id', 'manager_id',
+    'from_currency', 'to_currency', 'amount_from', 'amount_to', 'rate', 'bank'
+)
+TURNOVER_KEYS = ('day', 'from_currency_id', 'to_currency_id', 'manager_id', 'bank_id')
+TURNOVER_COLUMNS = (
+    'day', 'from_currency', 'to_currency', 'manager_id', 'manager', 'bank',
+    'orders', 'amount_from', 'amount_to', 'average_rate'
+)
+
+_STATUS_VALUES = {status.name: status.value for status in OrderStatus}
+# Enum columns store the member name
+_COMPLETED = OrderStatus.COMPLETED.name
+# Partial turnover frames kept before they are folded into one
+_TURNOVER_FOLD = 32
+
+
+def _since(days):
+    if not days:
+        return None
+    # created_at/completed_at are stored as naive Kyiv time
+    today = datetime.now(ZoneInfo("Europe/Kyiv")).replace(hour=0, minute=0, second=0, microsecond=0, tzinfo=None)
+    return today - timedelta(days=days - 1)
+
+
+def _raw_columns(model):
+    """
+    Order columns without per-row result processing: FixedPoint units as
+    integers, statuses as names, timestamps as SQLite returns them (text)
+    for pandas to parse a whole column at once
+    """
+    return (
+        model.id,
+        model.user_id,
+        model.manager_id,
+        model.bank_id,
+        model.from_currency_id,
+        model.to_currency_id,
+        type_coerce(model.amount_from, BigInteger).label('amount_from'),
+        type_coerce(model.amount_to, BigInteger).label('amount_to'),
+        type_coerce(model.rate, BigInteger).label('rate'),
+        type_coerce(model.status, String).label('status'),
+        type_coerce(model.created_at, String).label('created_at'),
+        type_coerce(func.coalesce(model.completed_at, model.updated_at), String).label('completed_at'),
+    )
+
+
+def iter_order_frames(connection, criteria, chunk_size=None):
+    """
+    DataFrames of at most `chunk_size` orders matching `criteria(model)`,
+    from both order tables
+
+    completed_at falls back to updated_at for orders that never got one.
+    """
+    chunk_size = chunk_size or config.EXPORT_CHUNK_SIZE
+    for model in ORDER_MODELS:
+        query = (
+            select(*_raw_columns(model))
+            .where(criteria(model))
+            .order_by(model.id)
+            .execution_options(yield_per=chunk_size)
+        )
+        result = connection.execute(query)
+        columns = list(result.keys())
+        for rows in result.partitions():
+            frame = pd.DataFrame.from_records(rows, columns=columns)
+            for name in ('manager_id', 'bank_id'):
+                frame[name] = frame[name].astype('Int64')
+            for name in ('amount_from', 'amount_to', 'rate'):
+                frame[name] = frame[name].astype(np.int64)
+            for name in ('created_at', 'completed_at'):
+                frame[name] = pd.to_datetime(frame[name], format='ISO8601')
+            yield frame
+
+
+def _lookup(ids, names):
+    """Vectorized id -> name; an unknown id becomes '#id', an empty one stays empty"""
+    mapped = ids.map(names)
+    return mapped.fillna('#' + ids.astype('string')).astype('string')
+
+
+def _reference_names():
+    snapshot = reference_data.snapshot
+    return (
+        {currency.id: currency.code for currency in snapshot.currencies},
+        {bank.id: bank.name for bank in snapshot.banks},
+    )
+
+
+class _Writer:
+    """Appends frames to a CSV file"""
+
+    def __init__(self, path, fmt, columns):
+        if fmt not in FORMATS:
+            raise ValueError(f"Unknown export format {fmt!r}")
+        self.path = path
+        self.fmt = fmt
+        self.columns = list(columns)
+        self.rows = 0
+        self._file = None
+
+    def __enter__(self):
+        self._file = open(self.path, 'w', encoding='utf-8', newline='')
+        self._file.write(','.join(self.columns) + '\n')
+        return self
+
+    def write(self, frame):
+        frame[self.columns].to_csv(self._file, header=False, index=False, date_format='%Y-%m-%d %H:%M:%S')
+        self.rows += len(frame)
+
+    def __exit__(self, exc_type, exc, tb):
+        self._file.close()
+
+
+def _order_rows(frame, currency_codes, bank_names):
+    return pd.DataFrame({
+        'id': frame['id'],
+        'created_at': frame['created_at'],
+        'completed_at': frame['completed_at'].where(frame['status'] == _COMPLETED),
+        'status': frame['status'].map(_STATUS_VALUES).astype('string'),
+        'customer_id': frame['user_id'],
+        'manager_id': frame['manager_id'],
+        'from_currency': _lookup(frame['from_currency_id'], currency_codes),
+        'to_currency': _lookup(frame['to_currency_id'], currency_codes),
+        'amount_from': pd.array(format_minor_units(frame['amount_from'].to_numpy(), AMOUNT_SCALE), dtype='string'),
+        'amount_to': pd.array(format_minor_units(frame['amount_to'].to_numpy(), AMOUNT_SCALE), dtype='string'),
+        'rate': pd.array(format_minor_units(frame['rate'].to_numpy(), RATE_SCALE), dtype='string'),
+        'bank': _lookup(frame['bank_id'], bank_names),
+    })
+
+
+def export_orders(engine, path, fmt='csv', days=None):
+    """Every order created in the last `days` days (all if None) into `path`; returns the row count"""
+    since = _since(days)
+    currency_codes, bank_names = _reference_names()
+    criteria = (lambda model: model.created_at >= since) if since else (lambda model: true())
+    with engine.connect() as conn, _Writer(path, fmt, ORDER_COLUMNS) as writer:
+        for frame in iter_order_frames(conn, criteria):
+            writer.write(_order_rows(frame, currency_codes, bank_names))
+    return writer.rows
+
+
+def _exact(column):
+    """int64 column, or Python integers when a sum of it could overflow int64"""
+    if len(column) and int(column.abs().max()) * len(column) >= 2 ** 63:
+        return column.astype(object)
+    return column
+
+
+def _sum_turnover(frame):
+    return frame.groupby(list(TURNOVER_KEYS), dropna=False, sort=False).agg(
+        orders=('orders', 'sum'),
+        amount_from=('amount_from', 'sum'),
+        amount_to=('amount_to', 'sum'),
+        rate=('rate', 'sum'),
+    ).reset_index()
+
+
+def _fold(partials):
+    # Partial sums can be summed again: orders and money are all plain totals
+    totals = pd.concat(partials, ignore_index=True)
+    for name in ('amount_from', 'amount_to', 'rate'):
+        totals[name] = _exact(totals[name])
+    return _sum_turnover(totals)
+
+
+def turnover_frame(engine, days=None):
+    """
+    Completed orders summed per TURNOVER_KEYS, completed in the last `days`
+    days (all if None)
+
+    Each chunk is grouped on its own and the partial sums are folded
+    together, so memory depends on the number of groups, not of orders.
+    Money columns are integer units; average_rate is left to the caller.
+    """
+    since = _since(days)
+
+    def criteria(model):
+        completed = model.status == OrderStatus.COMPLETED
+        if since is None:
+            return completed
+        return completed & (func.coalesce(model.completed_at, model.updated_at) >= since)
+
+    partials = []
+    with engine.connect() as conn:
+        for frame in iter_order_frames(conn, criteria):
+            chunk = frame[['manager_id', 'bank_id', 'from_currency_id', 'to_currency_id']].copy()
+            chunk['day'] = frame['completed_at'].dt.normalize()
+            chunk['orders'] = 1
+            for name in ('amount_from', 'amount_to', 'rate'):
+                chunk[name] = _exact(frame[name])
+            partials.append(_sum_turnover(chunk))
+            if len(partials) >= _TURNOVER_FOLD:
+                partials = [_fold(partials)]
+
+    if not partials:
+        return pd.DataFrame(columns=[*TURNOVER_KEYS, 'orders', 'amount_from', 'amount_to', 'rate'])
+    totals = _fold(partials) if len(partials) > 1 else partials[0]
+    return totals.sort_values(list(TURNOVER_KEYS), ignore_index=True)
+
+
+def export_turnover(engine, path, fmt='csv', days=None):
+    """turnover_frame() with currency codes, manager and bank names into `path`; returns the row count"""
+    totals = turnover_frame(engine, days)
+    currency_codes, bank_names = _reference_names()
+
+    manager_ids = [int(manager_id) for manager_id in totals['manager_id'].dropna().unique()]
+    manager_names = {}
+    if manager_ids:
+        with engine.connect() as conn:
+            manager_names = dict(conn.execute(
+                select(User.telegram_id, User.first_name).where(User.telegram_id.in_(manager_ids))
+            ).all())
+
+    orders = totals['orders'].to_numpy()
+    report = pd.DataFrame({
+        'day': pd.to_datetime(totals['day']).dt.date,
+        'from_currency': _lookup(totals['from_currency_id'], currency_codes),
+        'to_currency': _lookup(totals['to_currency_id'], currency_codes),
+        'manager_id': totals['manager_id'].astype('Int64'),
+        'manager': totals['manager_id'].map(manager_names).astype('string'),
+        'bank': _lookup(totals['bank_id'], bank_names),
+        'orders': orders.astype(np.int64),
+        'amount_from': pd.array(format_minor_units(totals['amount_from'].to_numpy(), AMOUNT_SCALE), dtype='string'),
+        'amount_to': pd.array(format_minor_units(totals['amount_to'].to_numpy(), AMOUNT_SCALE), dtype='string'),
+        # Mean of the rates, rounded down to RATE_SCALE digits
+        'average_rate': pd.array(
+            format_minor_units(totals['rate'].to_numpy() // np.maximum(orders, 1), RATE_SCALE), dtype='string'
+        ),
+    })
+    with _Writer(path, fmt, TURNOVER_COLUMNS) as writer:
+        writer.write(report)
+    return writer.rows
+
+
+EXPORTS = {
+    'orders': export_orders,
+    'turnover': export_turnover,
+}
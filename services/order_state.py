@@ -0,0 +1,113 @@
+"""
+Order status transitions
+
+Every status change goes through transition(): one conditional
+
+    UPDATE orders SET status = :target, version = version + 1, ...
+    WHERE id = :id AND version = :version AND status IN (:sources)
+
+committed together with the statistics rollups of the new status
+(services.order_stats) and the outbox rows of the customer's notices.
+Exactly one of two managers pressing the same button gets a row back; the
+other gets False and nothing is queued.
+
+All of it runs in one DB-thread call that ends with the commit, so the
+write lock is never held across an await: with more concurrent
+transitions than DB_EXECUTOR_WORKERS, a lock held by a session waiting for
+a free thread would block every thread until busy_timeout.
+"""
+import logging
+from datetime import datetime
+from typing import NamedTuple, Tuple
+from zoneinfo import ZoneInfo
+
+from sqlalchemy import update
+from sqlalchemy.orm.attributes import set_committed_value
+
+from database.models import Order, OrderStatus
+from services import order_stats
+from services.outbox import enqueue_notification
+
+logger = logging.getLogger(__name__)
+
+
+class Transition(NamedTuple):
+    name: str
+    sources: Tuple[OrderStatus, ...]
+    target: OrderStatus
+
+    def allowed(self, order):
+        return order.status in self.sources
+
+
+# Manager takes a new order and is asked for payment details
+ACCEPT = Transition('accept', (OrderStatus.CREATED,), OrderStatus.AWAITING_PAYMENT)
+# Manager gave up entering payment details, the order is free again
+RELEASE = Transition('release', (OrderStatus.AWAITING_PAYMENT,), OrderStatus.CREATED)
+# Payment details saved; the status stays, the version moves
+SET_PAYMENT_DETAILS = Transition(
+    'set_payment_details', (OrderStatus.AWAITING_PAYMENT,), OrderStatus.AWAITING_PAYMENT
+)
+# Customer pressed "Я оплатив"
+MARK_PAID = Transition('mark_paid', (OrderStatus.AWAITING_PAYMENT,), OrderStatus.PAYMENT_CONFIRMED)
+CONFIRM_PAYMENT = Transition('confirm_payment', (OrderStatus.AWAITING_PAYMENT,), OrderStatus.PAYMENT_CONFIRMED)
+COMPLETE = Transition('complete', (OrderStatus.PAYMENT_CONFIRMED,), OrderStatus.COMPLETED)
+REJECT = Transition(
+    'reject',
+    (OrderStatus.CREATED, OrderStatus.AWAITING_PAYMENT, OrderStatus.PAYMENT_CONFIRMED, OrderStatus.PROCESSING),
+    OrderStatus.CANCELLED
+)
+CANCEL_BY_USER = Transition(
+    'cancel_by_user', (OrderStatus.CREATED, OrderStatus.AWAITING_PAYMENT), OrderStatus.CANCELLED
+)
+# Applied in bulk by services.order_expiry, not through transition()
+EXPIRE = Transition('expire', (OrderStatus.CREATED, OrderStatus.AWAITING_PAYMENT), OrderStatus.CANCELLED)
+
+
+def _transition(sync_session, order, step, values, notices):
+    now = datetime.now(ZoneInfo("Europe/Kyiv"))
+    values = {'status': step.target, 'updated_at': now, **values}
+    if step.target == OrderStatus.COMPLETED:
+        values.setdefault('completed_at', now)
+
+    result = sync_session.execute(
+        update(Order)
+        .where(
+            Order.id == order.id,
+            Order.version == order.version,
+            Order.status.in_(step.sources)
+        )
+        .values(version=Order.version + 1, **values)
+        .execution_options(synchronize_session=False)
+    )
+    if result.rowcount != 1:
+        # Ends the transaction the UPDATE opened; unlike rollback() it does
+        # not expire the loaded objects
+        sync_session.commit()
+        return False
+
+    # The row is known, so the loaded object is brought up to date without a SELECT
+    for key, value in values.items():
+        set_committed_value(order, key, value)
+    set_committed_value(order, 'version', order.version + 1)
+    order_stats.record(sync_session.connection(), [order_stats.status_row(order)])
+    for notice in notices:
+        enqueue_notification(sync_session, *notice)
+    sync_session.commit()
+    return True
+
+
+async def transition(session, order, step, notices=(), **values):
+    """
+    Move `order` along the Transition `step`, also setting `values`, and commit
+
+    `notices` are (chat_id, text) or (chat_id, text, reply_markup) tuples
+    queued in the outbox with the change; wake the outbox worker after a
+    successful call. Returns False without changing or queueing anything
+    when the order is no longer in the state it was loaded in: another
+    manager, the customer or the expiry scheduler got there first.
+    """
+    won = await session.run_sync(_transition, order, step, values, notices)
+    if not won:
+        logger.info(f"Order {order.id}: {step.name} lost, order changed concurrently")
+    return won
@@ -0,0 +1,161 @@
+"""
+Order statistics rollups
+
+order_stats_daily holds counters per (day, currency pair, manager). They
+are incremented in the transaction that changes the order: on creation,
+by services.order_state.transition() and by the expiry scheduler, with
+one INSERT ... ON CONFLICT DO UPDATE. Reports read the rollups of the
+requested days instead of scanning orders.
+
+rebuild() recomputes the table from orders and orders_archive, for
+databases that had orders before the rollups existed.
+"""
+from collections import defaultdict
+from datetime import datetime, timedelta
+from decimal import Decimal
+from zoneinfo import ZoneInfo
+
+from sqlalchemy import delete, insert, select
+from sqlalchemy.dialects.postgresql import insert as postgresql_insert
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
+
+from database.models import ORDER_MODELS, OrderStatsDaily, OrderStatus
+
+KEY = ('day', 'from_currency_id', 'to_currency_id', 'manager_id')
+COUNTERS = ('created', 'completed', 'cancelled', 'volume_from', 'volume_to', 'rate_sum', 'complete_seconds')
+
+_KYIV = ZoneInfo("Europe/Kyiv")
+_REBUILD_CHUNK = 1000
+
+
+def _naive(moment):
+    # Stored timestamps are naive Kyiv time, fresh ones are aware
+    return moment.astimezone(_KYIV).replace(tzinfo=None) if moment.tzinfo else moment
+
+
+def _row(order, moment, **counters):
+    row = dict.fromkeys(COUNTERS, 0)
+    row.update(
+        day=_naive(moment).date(),
+        from_currency_id=order.from_currency_id,
+        to_currency_id=order.to_currency_id,
+        manager_id=order.manager_id or 0,
+        **counters
+    )
+    return row
+
+
+def created_row(order):
+    return _row(order, order.created_at or datetime.now(_KYIV), created=1)
+
+
+def status_row(order):
+    """Counters an order adds by reaching its current status, None for intermediate statuses"""
+    if order.status == OrderStatus.COMPLETED:
+        completed_at = order.completed_at or order.updated_at
+        return _row(
+            order, completed_at,
+            completed=1,
+            volume_from=order.amount_from,
+            volume_to=order.amount_to,
+            rate_sum=order.rate,
+            complete_seconds=max(int((_naive(completed_at) - _naive(order.created_at)).total_seconds()), 0)
+        )
+    if order.status == OrderStatus.CANCELLED:
+        return _row(order, order.updated_at, cancelled=1)
+    return None
+
+
+def _add(totals, row):
+    key = tuple(row[name] for name in KEY)
+    if key in totals:
+        for name in COUNTERS:
+            totals[key][name] += row[name]
+    else:
+        totals[key] = dict(row)
+
+
+def _merge(rows):
+    # One row per key: PostgreSQL refuses to update a row twice in one multi-row upsert
+    totals = {}
+    for row in rows:
+        if row is not None:
+            _add(totals, row)
+    return list(totals.values())
+
+
+def record(connection, rows):
+    """Add the counters of `rows` to their rollups in the connection's transaction"""
+    rows = _merge(rows)
+    if not rows:
+        return
+    dialect_insert = postgresql_insert if connection.dialect.name == 'postgresql' else sqlite_insert
+    stmt = dialect_insert(OrderStatsDaily)
+    table = OrderStatsDaily.__table__
+    stmt = stmt.on_conflict_do_update(
+        index_elements=list(KEY),
+        set_={name: table.c[name] + stmt.excluded[name] for name in COUNTERS}
+    )
+    connection.execute(stmt, rows)
+
+
+def record_created(sync_session, order):
+    """For AsyncDBSession.run_sync, before committing a new order"""
+    record(sync_session.connection(), [created_row(order)])
+
+
+def rebuild(engine):
+    """Recompute every rollup from both order tables in one transaction; returns the number of orders"""
+    totals = {}
+    orders = 0
+    with engine.begin() as conn:
+        conn.execute(delete(OrderStatsDaily))
+        for model in ORDER_MODELS:
+            query = select(
+                model.from_currency_id, model.to_currency_id, model.manager_id, model.status,
+                model.amount_from, model.amount_to, model.rate,
+                model.created_at, model.updated_at, model.completed_at
+            ).execution_options(yield_per=_REBUILD_CHUNK)
+            for order in conn.execute(query):
+                orders += 1
+                created = _row(order, order.created_at, created=1)
+                # The manager is unknown at creation time
+                created['manager_id'] = 0
+                _add(totals, created)
+                finished = status_row(order)
+                if finished is not None:
+                    _add(totals, finished)
+        rows = list(totals.values())
+        for start in range(0, len(rows), _REBUILD_CHUNK):
+            conn.execute(insert(OrderStatsDaily), rows[start:start + _REBUILD_CHUNK])
+    return orders
+
+
+def load_summary(sync_session, days):
+    """
+    Totals of the last `days` days, today included
+
+    Returns {'since': first day, 'pairs': {(from_id, to_id): counters},
+    'managers': {manager_id: counters}}, counters being the COUNTERS sums.
+    """
+    since = datetime.now(_KYIV).date() - timedelta(days=days - 1)
+    pairs = defaultdict(lambda: dict.fromkeys(COUNTERS, 0))
+    managers = defaultdict(lambda: dict.fromkeys(COUNTERS, 0))
+    for row in sync_session.scalars(select(OrderStatsDaily).where(OrderStatsDaily.day >= since)):
+        for target in (pairs[(row.from_currency_id, row.to_currency_id)], managers[row.manager_id]):
+            for name in COUNTERS:
+                target[name] += getattr(row, name)
+    managers.pop(0, None)
+    return {'since': since, 'pairs': dict(pairs), 'managers': dict(managers)}
+
+
+def average_rate(counters):
+    if not counters['completed']:
+        return None
+    return counters['rate_sum'] / Decimal(counters['completed'])
+
+
+def average_complete_time(counters):
+    if not counters['completed']:
+        return None
+    return timedelta(seconds=counters['complete_seconds'] // counters['completed'])
@@ -0,0 +1,226 @@
+import asyncio
+import json
+import logging
+from datetime import datetime, timedelta
+from zoneinfo import ZoneInfo
+
+from aiogram.exceptions import TelegramBadRequest, TelegramForbiddenError
+from aiogram.types import InlineKeyboardMarkup, ReplyKeyboardMarkup
+from sqlalchemy import and_, bindparam, delete, or_, select, update
+from sqlalchemy.exc import SQLAlchemyError
+
+import config
+from database.async_session import run_in_db_thread
+from database.models import OutboxMessage
+
+logger = logging.getLogger(__name__)
+
+
+def enqueue_notification(session, chat_id, text, reply_markup=None, parse_mode="HTML"):
+    """
+    Add a message to the outbox of the current transaction
+
+    It is only delivered if the caller commits, so a notification is never
+    sent for an order change that was rolled back.
+    """
+    session.add(OutboxMessage(
+        chat_id=chat_id,
+        text=text,
+        parse_mode=parse_mode,
+        reply_markup=reply_markup.model_dump_json(exclude_none=True) if reply_markup else None,
+        attempts=0
+    ))
+
+
+def load_reply_markup(raw):
+    if not raw:
+        return None
+    data = json.loads(raw)
+    if 'inline_keyboard' in data:
+        return InlineKeyboardMarkup.model_validate(data)
+    return ReplyKeyboardMarkup.model_validate(data)
+
+
+class OutboxWorker:
+    """
+    Delivers outbox rows with at-least-once semantics
+
+    Due rows are claimed in batches by pushing next_attempt_at forward by
+    OUTBOX_LEASE, sent through the notifier and then deleted in a single
+    DELETE. Failed rows are retried with exponential backoff until
+    OUTBOX_MAX_ATTEMPTS; rows left unsent by a crash become due again when
+    their lease expires. Rows given up on are kept for OUTBOX_RETENTION_DAYS
+    and then pruned, so the table only holds pending and recently failed rows.
+    """
+
+    def __init__(self):
+        self.engine = None
+        self.notifier = None
+        self._wakeup = asyncio.Event()
+        self._task = None
+        self._stopping = False
+        self._pruned_at = None
+
+    def start(self, engine, notifier):
+        self.engine = engine
+        self.notifier = notifier
+        self._stopping = False
+        if self._task is None:
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        if self._task is not None:
+            # wait_for() may swallow the cancellation when the wakeup event
+            # fires at the same moment, so the loop also checks the flag
+            self._stopping = True
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+    def wake(self):
+        """Called after a commit that added outbox rows"""
+        self._wakeup.set()
+
+    async def _run(self):
+        loop = asyncio.get_running_loop()
+        while not self._stopping:
+            if self._pruned_at is None or loop.time() - self._pruned_at >= config.OUTBOX_PRUNE_INTERVAL:
+                self._pruned_at = loop.time()
+                try:
+                    pruned = await run_in_db_thread(self.prune)
+                    if pruned:
+                        logger.info(f"Pruned {pruned} outbox messages")
+                except SQLAlchemyError as e:
+                    logger.error(f"Outbox prune database error: {e}")
+            try:
+                delivered = await self.drain_once()
+            except SQLAlchemyError as e:
+                logger.error(f"Outbox worker database error: {e}")
+                delivered = 0
+            if delivered >= config.OUTBOX_BATCH_SIZE:
+                continue
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), config.OUTBOX_POLL_INTERVAL)
+            except asyncio.TimeoutError:
+                pass
+            self._wakeup.clear()
+
+    async def drain_once(self):
+        batch = await run_in_db_thread(self._claim_batch)
+        if not batch:
+            return 0
+
+        results = await asyncio.gather(*(self._send(row) for row in batch))
+        await run_in_db_thread(self._save_results, batch, results)
+        return len(batch)
+
+    async def _send(self, row):
+        try:
+            await self.notifier.deliver(
+                row['chat_id'],
+                row['text'],
+                parse_mode=row['parse_mode'],
+                reply_markup=load_reply_markup(row['reply_markup'])
+            )
+            return None
+        except (TelegramForbiddenError, TelegramBadRequest) as e:
+            # The user blocked the bot or the message is invalid; retrying will not help
+            return e, True
+        except Exception as e:
+            return e, False
+
+    def _claim_batch(self):
+        """
+        Lease due rows in one UPDATE ... RETURNING
+
+        The statement is atomic, so several bot processes can run the worker
+        against one database without sending a row twice; on PostgreSQL rows
+        leased by a concurrent transaction are skipped instead of waited for.
+        """
+        now = datetime.now(ZoneInfo("Europe/Kyiv"))
+        due = (
+            select(OutboxMessage.id)
+            .where(
+                OutboxMessage.sent_at.is_(None),
+                OutboxMessage.next_attempt_at <= now,
+                OutboxMessage.attempts < config.OUTBOX_MAX_ATTEMPTS
+            )
+            .order_by(OutboxMessage.next_attempt_at, OutboxMessage.id)
+            .limit(config.OUTBOX_BATCH_SIZE)
+            .with_for_update(skip_locked=True)
+        )
+        with self.engine.begin() as conn:
+            rows = conn.execute(
+                update(OutboxMessage)
+                .where(OutboxMessage.id.in_(due))
+                .values(next_attempt_at=now + timedelta(seconds=config.OUTBOX_LEASE))
+                .returning(
+                    OutboxMessage.id, OutboxMessage.chat_id, OutboxMessage.text,
+                    OutboxMessage.parse_mode, OutboxMessage.reply_markup, OutboxMessage.attempts
+                )
+            ).mappings().all()
+        return sorted((dict(row) for row in rows), key=lambda row: row['id'])
+
+    def _save_results(self, batch, results):
+        now = datetime.now(ZoneInfo("Europe/Kyiv"))
+        sent_ids = []
+        failures = []
+        for row, result in zip(batch, results):
+            if result is None:
+                sent_ids.append(row['id'])
+                continue
+            error, permanent = result
+            attempts = config.OUTBOX_MAX_ATTEMPTS if permanent else row['attempts'] + 1
+            delay = config.OUTBOX_RETRY_BASE * 2 ** row['attempts']
+            failures.append({
+                'row_id': row['id'],
+                'new_attempts': attempts,
+                'error': str(error)[:1000],
+                'retry_at': now + timedelta(seconds=delay),
+            })
+            if attempts >= config.OUTBOX_MAX_ATTEMPTS:
+                logger.error(f"Giving up on outbox message {row['id']} to {row['chat_id']}: {error}")
+            else:
+                logger.warning(f"Outbox message {row['id']} to {row['chat_id']} failed, retry in {delay:.0f}s: {error}")
+
+        with self.engine.begin() as conn:
+            if sent_ids:
+                # Nothing reads delivered rows, keeping them would only grow the table
+                conn.execute(delete(OutboxMessage).where(OutboxMessage.id.in_(sent_ids)))
+            if failures:
+                conn.execute(
+                    update(OutboxMessage)
+                    .where(OutboxMessage.id == bindparam('row_id'))
+                    .values(
+                        attempts=bindparam('new_attempts'),
+                        last_error=bindparam('error'),
+                        next_attempt_at=bindparam('retry_at')
+                    ),
+                    failures
+                )
+
+    def prune(self):
+        """
+        Delete rows given up on more than OUTBOX_RETENTION_DAYS ago, and rows
+        marked as sent by older versions; returns the count
+        """
+        # next_attempt_at is stored as naive Kyiv time
+        now = datetime.now(ZoneInfo("Europe/Kyiv")).replace(tzinfo=None)
+        cutoff = now - timedelta(days=config.OUTBOX_RETENTION_DAYS)
+        with self.engine.begin() as conn:
+            return conn.execute(
+                delete(OutboxMessage)
+                .where(or_(
+                    OutboxMessage.sent_at.is_not(None),
+                    and_(
+                        OutboxMessage.attempts >= config.OUTBOX_MAX_ATTEMPTS,
+                        OutboxMessage.next_attempt_at < cutoff
+                    )
+                ))
+            ).rowcount
+
+
+outbox_worker = OutboxWorker()
@@ -0,0 +1,256 @@
+"""
+Exchange rates pulled from an external feed
+
+A source returns mid rates as {"USDT/UAH": "41.29", ...}. RateFeed applies
+the spread rules of config.RATE_SPREADS, writes every pair that changed
+in one transaction and puts all of them into rate_cache, so handlers see
+the new quotes at once and unchanged pairs cost no write.
+
+Every bot process runs its own feed; the pairs are compared with the
+table before writing, so after the first process has written a change
+the others only refresh their caches.
+"""
+import asyncio
+import json
+import logging
+from datetime import datetime
+from decimal import Decimal, InvalidOperation
+from pathlib import Path
+from zoneinfo import ZoneInfo
+
+import aiohttp
+from sqlalchemy import bindparam, insert, select, update
+from sqlalchemy.exc import SQLAlchemyError
+
+import config
+from database.async_session import run_in_db_thread
+from database.models import ExchangeRate
+from services.reference_data import reference_data
+from utils.cache import rate_cache
+from utils.money import invert_rate, quantize_rate, to_decimal
+
+logger = logging.getLogger(__name__)
+
+
+class RateFeedError(Exception):
+    pass
+
+
+def parse_rates(raw):
+    """JSON object of "FROM/TO": rate -> {(from_code, to_code): Decimal}"""
+    try:
+        data = json.loads(raw, parse_float=Decimal)
+    except ValueError as e:
+        raise RateFeedError(f"Invalid JSON: {e}")
+    if not isinstance(data, dict):
+        raise RateFeedError("Expected a JSON object of FROM/TO: rate")
+
+    rates = {}
+    for pair, value in data.items():
+        from_code, _, to_code = pair.partition('/')
+        try:
+            rate = to_decimal(value)
+        except (InvalidOperation, TypeError):
+            raise RateFeedError(f"Invalid rate for {pair}: {value!r}")
+        if not from_code or not to_code or not rate.is_finite() or rate <= 0:
+            raise RateFeedError(f"Invalid rate for {pair}: {value!r}")
+        rates[(from_code.upper(), to_code.upper())] = rate
+    return rates
+
+
+class FileRateSource:
+    """Rates from a JSON file, re-read on every pull"""
+
+    def __init__(self, path):
+        self.path = Path(path)
+
+    async def fetch(self):
+        try:
+            raw = await asyncio.to_thread(self.path.read_text, encoding='utf-8')
+        except OSError as e:
+            raise RateFeedError(f"Cannot read {self.path}: {e}")
+        return parse_rates(raw)
+
+    def __repr__(self):
+        return f"FileRateSource({str(self.path)!r})"
+
+
+class HttpRateSource:
+    """Rates from an HTTP endpoint returning the same JSON"""
+
+    def __init__(self, url, timeout=config.RATE_FEED_TIMEOUT):
+        self.url = url
+        self.timeout = aiohttp.ClientTimeout(total=timeout)
+
+    async def fetch(self):
+        try:
+            async with aiohttp.ClientSession(timeout=self.timeout) as http:
+                async with http.get(self.url) as response:
+                    response.raise_for_status()
+                    raw = await response.text()
+        except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+            raise RateFeedError(f"Cannot fetch {self.url}: {e!r}")
+        return parse_rates(raw)
+
+    def __repr__(self):
+        return f"HttpRateSource({self.url!r})"
+
+
+def create_rate_source(spec=config.RATE_FEED_SOURCE):
+    """Source for config.RATE_FEED_SOURCE: an http(s) URL or a file path; None if empty"""
+    if not spec:
+        return None
+    if spec.startswith(('http://', 'https://')):
+        return HttpRateSource(spec)
+    path = Path(spec)
+    return FileRateSource(path if path.is_absolute() else config.BASE_DIR / path)
+
+
+def parse_spreads(text=config.RATE_SPREADS):
+    """
+    "USDT/UAH:1.5,*:1" -> {('USDT', 'UAH'): Decimal('1.5'), '*': Decimal('1')}
+
+    Values are percents added to the mid rate; '*' is used for pairs
+    without a rule of their own.
+    """
+    spreads = {}
+    for item in filter(None, (part.strip() for part in text.split(','))):
+        pair, _, percent = item.rpartition(':')
+        try:
+            value = Decimal(percent)
+        except InvalidOperation:
+            raise ValueError(f"Invalid spread {item!r} in RATE_SPREADS")
+        if pair == '*':
+            spreads['*'] = value
+        else:
+            from_code, _, to_code = pair.partition('/')
+            if not from_code or not to_code:
+                raise ValueError(f"Invalid pair {pair!r} in RATE_SPREADS")
+            spreads[(from_code.upper(), to_code.upper())] = value
+    return spreads
+
+
+def apply_spreads(mid_rates, spreads):
+    """
+    Quoted rates of every pair
+
+    A pair quoted by the feed gets its spread; the opposite direction, if
+    the feed does not quote it, is 1 / the quoted rate, like the rates
+    seeded by setup_initial_data.
+    """
+    default = spreads.get('*', Decimal(0))
+    rates = {}
+    for pair, mid in mid_rates.items():
+        percent = spreads.get(pair, default)
+        rates[pair] = quantize_rate(mid * (1 + percent / 100))
+    for (from_code, to_code), rate in list(rates.items()):
+        rates.setdefault((to_code, from_code), invert_rate(rate))
+    return rates
+
+
+class RateFeed:
+    """
+    Pulls the source every `interval` seconds and stores the quoted rates
+
+    A failed pull or write keeps the previous rates; the next pull retries.
+    """
+
+    def __init__(self, source=None, spreads=None, interval=config.RATE_FEED_INTERVAL):
+        self.source = source
+        self.spreads = spreads if spreads is not None else parse_spreads()
+        self.interval = interval
+        self.engine = None
+        self.last_update = None
+        self._unknown_pairs = set()
+        self._task = None
+
+    def start(self, engine):
+        self.engine = engine
+        if self.source is None:
+            self.source = create_rate_source()
+        if self._task is None and self.source is not None and self.interval > 0:
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+    async def _run(self):
+        while True:
+            await self.pull()
+            await asyncio.sleep(self.interval)
+
+    async def pull(self):
+        """Fetch, apply spreads and store; returns the number of pairs written, None on failure"""
+        try:
+            mid_rates = await self.source.fetch()
+        except RateFeedError as e:
+            logger.error(f"Rate feed {self.source!r} failed: {e}")
+            return None
+
+        snapshot = reference_data.snapshot
+        rates = {}
+        for (from_code, to_code), rate in apply_spreads(mid_rates, self.spreads).items():
+            from_currency, to_currency = snapshot.currency(from_code), snapshot.currency(to_code)
+            if from_currency is None or to_currency is None:
+                if (from_code, to_code) not in self._unknown_pairs:
+                    self._unknown_pairs.add((from_code, to_code))
+                    logger.warning(f"Rate feed quotes unknown pair {from_code}/{to_code}, skipped")
+                continue
+            rates[(from_code, to_code)] = (from_currency.id, to_currency.id, rate)
+        if not rates:
+            return 0
+
+        try:
+            written = await run_in_db_thread(self._write, list(rates.values()))
+        except SQLAlchemyError as e:
+            logger.error(f"Failed to store {len(rates)} rates from the feed: {e}")
+            return None
+
+        for pair, (_, _, rate) in rates.items():
+            rate_cache.set(pair, rate)
+        self.last_update = datetime.now(ZoneInfo("Europe/Kyiv"))
+        if written:
+            logger.info(f"Rate feed updated {written} of {len(rates)} pairs")
+        return written
+
+    def _write(self, rates):
+        now = datetime.now(ZoneInfo("Europe/Kyiv"))
+        with self.engine.begin() as conn:
+            stored = {
+                (row.from_currency_id, row.to_currency_id): row.rate
+                for row in conn.execute(
+                    select(ExchangeRate.from_currency_id, ExchangeRate.to_currency_id, ExchangeRate.rate)
+                )
+            }
+            changed = [
+                {'f': from_id, 't': to_id, 'r': rate, 'ts': now}
+                for from_id, to_id, rate in rates
+                if (from_id, to_id) in stored and stored[(from_id, to_id)] != rate
+            ]
+            added = [
+                {'from_currency_id': from_id, 'to_currency_id': to_id, 'rate': rate, 'updated_at': now}
+                for from_id, to_id, rate in rates
+                if (from_id, to_id) not in stored
+            ]
+            if changed:
+                conn.execute(
+                    update(ExchangeRate)
+                    .where(
+                        ExchangeRate.from_currency_id == bindparam('f'),
+                        ExchangeRate.to_currency_id == bindparam('t')
+                    )
+                    .values(rate=bindparam('r', type_=ExchangeRate.rate.type), updated_at=bindparam('ts')),
+                    changed
+                )
+            if added:
+                conn.execute(insert(ExchangeRate), added)
+        return len(changed) + len(added)
+
+
+rate_feed = RateFeed()
@@ -0,0 +1,165 @@
+import asyncio
+import logging
+from types import MappingProxyType
+from typing import NamedTuple, Optional
+
+from sqlalchemy import select
+from sqlalchemy.exc import SQLAlchemyError
+
+from config import REFERENCE_REFRESH_INTERVAL
+from database.async_session import run_in_db_thread
+from database.models import Bank, Currency, CurrencyType, Setting
+
+logger = logging.getLogger(__name__)
+
+
+class CurrencyRef(NamedTuple):
+    id: int
+    code: str
+    name: str
+    type: CurrencyType
+    enabled: bool
+
+
+class BankRef(NamedTuple):
+    id: int
+    name: str
+    currency_id: Optional[int]
+    enabled: bool
+
+
+class ReferenceSnapshot:
+    """
+    Currencies, banks and settings as read at one moment
+
+    Never modified after creation: lookups by id and code are plain dict
+    reads, and a reader that took a snapshot sees consistent data until it
+    is done, whatever reloads happen meanwhile.
+    """
+
+    __slots__ = (
+        'version', 'currencies', 'banks', 'settings', 'enabled_currencies',
+        '_currency_by_id', '_currency_by_code', '_bank_by_id', '_banks_by_currency'
+    )
+
+    def __init__(self, version, currencies=(), banks=(), settings=None):
+        self.version = version
+        self.currencies = tuple(currencies)
+        self.banks = tuple(banks)
+        self.settings = MappingProxyType(dict(settings or {}))
+        self.enabled_currencies = tuple(c for c in self.currencies if c.enabled)
+        self._currency_by_id = MappingProxyType({c.id: c for c in self.currencies})
+        self._currency_by_code = MappingProxyType({c.code: c for c in self.currencies})
+        self._bank_by_id = MappingProxyType({b.id: b for b in self.banks})
+
+        banks_by_currency = {}
+        for bank in self.banks:
+            currency = self._currency_by_id.get(bank.currency_id)
+            if bank.enabled and currency is not None:
+                banks_by_currency.setdefault(currency.code, []).append(bank)
+        self._banks_by_currency = MappingProxyType({code: tuple(b) for code, b in banks_by_currency.items()})
+
+    def currency(self, code):
+        return self._currency_by_code.get(code)
+
+    def currency_by_id(self, currency_id):
+        return self._currency_by_id.get(currency_id)
+
+    def bank(self, bank_id):
+        return self._bank_by_id.get(bank_id)
+
+    def banks_for(self, currency_code):
+        """Enabled banks paying out in the currency, in id order"""
+        return self._banks_by_currency.get(currency_code, ())
+
+    def setting(self, key, default=None):
+        return self.settings.get(key, default)
+
+    def same_content(self, currencies, banks, settings):
+        return (self.currencies, self.banks, dict(self.settings)) == (tuple(currencies), tuple(banks), settings)
+
+
+class ReferenceData:
+    """
+    Holds the current ReferenceSnapshot
+
+    Readers take `reference_data.snapshot` and use it; a reload builds a new
+    snapshot and replaces the attribute in one assignment, so nobody sees a
+    half-updated one. The version only grows when the content changed, and
+    caches derived from the data (keyboards) are keyed by it.
+
+    Edits made through this process call refresh() right away; the
+    periodic refresh picks up edits made by other processes.
+    """
+
+    def __init__(self, interval=REFERENCE_REFRESH_INTERVAL):
+        self.interval = interval
+        self.engine = None
+        self.snapshot = ReferenceSnapshot(0)
+        self._task = None
+
+    def load(self, engine):
+        """Blocking first load, before the event loop starts handling updates"""
+        self.engine = engine
+        self._apply(*self._read())
+        return self.snapshot
+
+    async def refresh(self):
+        """Re-read the tables; returns True if a new snapshot was installed"""
+        if self.engine is None:
+            return False
+        try:
+            rows = await run_in_db_thread(self._read)
+        except SQLAlchemyError as e:
+            logger.error(f"Failed to refresh reference data: {e}")
+            return False
+        return self._apply(*rows)
+
+    def _read(self):
+        with self.engine.connect() as conn:
+            currencies = [
+                CurrencyRef(row.id, row.code, row.name, row.type, bool(row.enabled))
+                for row in conn.execute(
+                    select(Currency.id, Currency.code, Currency.name, Currency.type, Currency.enabled)
+                    .order_by(Currency.id)
+                )
+            ]
+            banks = [
+                BankRef(row.id, row.name, row.currency_id, bool(row.enabled))
+                for row in conn.execute(
+                    select(Bank.id, Bank.name, Bank.currency_id, Bank.enabled).order_by(Bank.id)
+                )
+            ]
+            settings = dict(conn.execute(select(Setting.key, Setting.value)).all())
+        return currencies, banks, settings
+
+    def _apply(self, currencies, banks, settings):
+        if self.snapshot.version and self.snapshot.same_content(currencies, banks, settings):
+            return False
+        self.snapshot = ReferenceSnapshot(self.snapshot.version + 1, currencies, banks, settings)
+        logger.info(
+            f"Reference data v{self.snapshot.version}: {len(currencies)} currencies, "
+            f"{len(banks)} banks, {len(settings)} settings"
+        )
+        return True
+
+    def start(self):
+        if self._task is None and self.interval > 0:
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+    async def _run(self):
+        while True:
+            await asyncio.sleep(self.interval)
+            await self.refresh()
+
+
+reference_data = ReferenceData()
@@ -0,0 +1,80 @@
+import asyncio
+import logging
+
+from sqlalchemy import bindparam, update
+from sqlalchemy.exc import SQLAlchemyError
+
+from config import USER_ACTIVITY_FLUSH_INTERVAL
+from database.async_session import run_in_db_thread
+from database.models import User
+from utils.cache import TTLCache
+
+logger = logging.getLogger(__name__)
+
+# telegram_id -> db_user dict, as put into handler data by UserMiddleware
+profile_cache = TTLCache()
+
+
+class LastActiveFlusher:
+    """
+    Collects users.last_active bumps in memory and writes them periodically
+
+    Repeated activity of one user between flushes collapses into a single
+    row of one bulk UPDATE, so regular updates cost no write transaction.
+    """
+
+    def __init__(self, interval=USER_ACTIVITY_FLUSH_INTERVAL):
+        self.interval = interval
+        self.engine = None
+        self._pending = {}
+        self._task = None
+
+    def touch(self, telegram_id, last_active):
+        self._pending[telegram_id] = last_active
+
+    def start(self, engine):
+        self.engine = engine
+        if self._task is None:
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+        await self.flush()
+
+    async def _run(self):
+        while True:
+            await asyncio.sleep(self.interval)
+            await self.flush()
+
+    async def flush(self):
+        if not self._pending or self.engine is None:
+            return 0
+
+        batch, self._pending = self._pending, {}
+        try:
+            await run_in_db_thread(self._write, batch)
+        except SQLAlchemyError as e:
+            logger.error(f"Failed to flush last_active for {len(batch)} users: {e}")
+            for telegram_id, last_active in batch.items():
+                self._pending.setdefault(telegram_id, last_active)
+            return 0
+        return len(batch)
+
+    def _write(self, batch):
+        stmt = (
+            update(User)
+            .where(User.telegram_id == bindparam('tid'))
+            .values(last_active=bindparam('ts'))
+        )
+        params = [{'tid': tid, 'ts': ts} for tid, ts in batch.items()]
+        with self.engine.begin() as conn:
+            conn.execute(stmt, params)
+
+
+activity_flusher = LastActiveFlusher()
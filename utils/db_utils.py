@@ -1,68 +1,79 @@
 from datetime import datetime
 from zoneinfo import ZoneInfo
+from sqlalchemy import func, literal, select, tuple_, update
 from sqlalchemy.exc import SQLAlchemyError
+from sqlalchemy.orm import joinedload
 import logging
-from database.models import Currency, Bank, ExchangeRate, Setting
+from config import ORDERS_PAGE_SIZE
+from database.models import ORDER_MODELS, Currency, ExchangeRate, Order, OrderStatus
+from services.reference_data import reference_data
+from utils.cache import rate_cache, is_missing
 
 logger = logging.getLogger(__name__)
 
 async def get_all_currencies(session, enabled_only=True):
     """
-    Получить все валюты из базы данных
+    Получить все валюты из справочника
     
     Args:
-        engine: SQLAlchemy engine
+        session: AsyncDBSession текущего апдейта (не используется, валюты
+            берутся из снимка справочника)
         enabled_only (bool): Если True, возвращать только активные валюты
         
     Returns:
-        list: Список объектов Currency
+        tuple: Кортеж CurrencyRef
     """
-    try:
-        query = session.query(Currency)
-        if enabled_only:
-            query = query.filter_by(enabled=True)
-        currencies = query.all()
-        return currencies
-    except SQLAlchemyError as e:
-        logger.error(f"Ошибка при получении валют: {e}")
-        return []
-    finally:
-        session.close()
+    snapshot = reference_data.snapshot
+    return snapshot.enabled_currencies if enabled_only else snapshot.currencies
+
+def _currency_id(session, currency_code):
+    """Id from the reference snapshot; falls back to the table before it is loaded"""
+    currency = reference_data.snapshot.currency(currency_code)
+    if currency is not None:
+        return currency.id
+    return session.scalar(select(Currency.id).where(Currency.code == currency_code))
+
+def _get_exchange_rate(session, from_currency_code, to_currency_code):
+    from_currency_id = _currency_id(session, from_currency_code)
+    to_currency_id = _currency_id(session, to_currency_code)
+    
+    if not from_currency_id or not to_currency_id:
+        return None
+        
+    return session.scalar(
+        select(ExchangeRate.rate).where(
+            ExchangeRate.from_currency_id == from_currency_id,
+            ExchangeRate.to_currency_id == to_currency_id
+        )
+    )
 
 async def get_exchange_rate(session, from_currency_code, to_currency_code):
+    key = (from_currency_code, to_currency_code)
+    rate = rate_cache.get(key)
+    if not is_missing(rate):
+        return rate
+
     try:
-        from_currency = session.query(Currency).filter_by(code=from_currency_code).first()
-        to_currency = session.query(Currency).filter_by(code=to_currency_code).first()
-        
-        if not from_currency or not to_currency:
-            return None
-            
-        exchange_rate = session.query(ExchangeRate).filter_by(
-            from_currency_id=from_currency.id,
-            to_currency_id=to_currency.id
-        ).first()
-        
-        if exchange_rate:
-            return exchange_rate.rate
-        return None
+        rate = await session.run_sync(_get_exchange_rate, from_currency_code, to_currency_code)
     except SQLAlchemyError as e:
         logger.error(f"Ошибка при получении курса обмена: {e}")
         return None
-    finally:
-        session.close()
+
+    rate_cache.set(key, rate)
+    return rate
 
 def set_exchange_rate(session, from_currency_code, to_currency_code, rate):
     try:
-        from_currency = session.query(Currency).filter_by(code=from_currency_code).first()
-        to_currency = session.query(Currency).filter_by(code=to_currency_code).first()
+        from_currency_id = _currency_id(session, from_currency_code)
+        to_currency_id = _currency_id(session, to_currency_code)
 
-        if not from_currency or not to_currency:
+        if not from_currency_id or not to_currency_id:
             logger.error(f"Одна из валют не найдена: {from_currency_code} → {to_currency_code}")
             return False
 
         existing_rate = session.query(ExchangeRate).filter_by(
-            from_currency_id=from_currency.id,
-            to_currency_id=to_currency.id
+            from_currency_id=from_currency_id,
+            to_currency_id=to_currency_id
         ).first()
 
         if existing_rate:
@@ -71,48 +82,133 @@ def set_exchange_rate(session, from_currency_code, to_currency_code, rate):
             logger.info(f"Обновлен курс {from_currency_code} → {to_currency_code} до {rate}")
         else:
             new_rate = ExchangeRate(
-                from_currency_id=from_currency.id,
-                to_currency_id=to_currency.id,
+                from_currency_id=from_currency_id,
+                to_currency_id=to_currency_id,
                 rate=rate
             )
             session.add(new_rate)
             logger.info(f"Добавлен курс {from_currency_code} → {to_currency_code}: {rate}")
 
         session.commit()
+        rate_cache.set((from_currency_code, to_currency_code), rate)
         return True
     except SQLAlchemyError as e:
         session.rollback()
+        rate_cache.invalidate((from_currency_code, to_currency_code))
         logger.error(f"Ошибка при установке курса обмена: {e}")
         return False
 
 async def get_banks_for_currency(session, currency_code):
-    try:
-        currency = session.query(Currency).filter_by(code=currency_code).first()
-        
-        if not currency:
-            return []
-            
-        banks = session.query(Bank).filter_by(
-            currency_id=currency.id,
-            enabled=True
-        ).all()
-        
-        return banks
-    except SQLAlchemyError as e:
-        logger.error(f"Ошибка при получении банков для валюты: {e}")
-        return []
-    finally:
-        session.close()
+    """Активные банки валюты из снимка справочника (кортеж BankRef)"""
+    return reference_data.snapshot.banks_for(currency_code)
 
 async def get_setting(session, key, default=None):
-    try:
-        setting = session.query(Setting).filter_by(key=key).first()
-        
-        if setting:
-            return setting.value
-        return default
-    except SQLAlchemyError as e:
-        logger.error(f"Ошибка при получении настройки {key}: {e}")
-        return default
-    finally:
-        session.close()
\ No newline at end of file
+    """Значение настройки из снимка справочника"""
+    return reference_data.snapshot.setting(key, default)
+
+
+def order_card_options(model=Order):
+    """Loader options for everything an order card shows; model is Order or ArchivedOrder"""
+    return (
+        joinedload(model.customer),
+        joinedload(model.from_currency),
+        joinedload(model.to_currency),
+        joinedload(model.bank),
+    )
+
+def load_orders_with_relations(session, *criteria, order_by=(), limit=None):
+    """Load orders together with customer, currencies and bank in one query"""
+    query = select(Order).options(*order_card_options()).where(*criteria).order_by(*order_by)
+    if limit is not None:
+        query = query.limit(limit)
+    return session.scalars(query).unique().all()
+
+def load_customer_orders(session, telegram_id, limit, with_relations=False):
+    """Latest orders of a customer, newest first, from both the orders table and the archive"""
+    orders = []
+    for model in ORDER_MODELS:
+        query = select(model).where(model.user_id == telegram_id).order_by(model.created_at.desc()).limit(limit)
+        if with_relations:
+            query = query.options(*order_card_options(model))
+        orders += session.scalars(query).unique().all()
+    orders.sort(key=lambda order: order.created_at, reverse=True)
+    return orders[:limit]
+
+def save_order_message_ids(session, message_ids):
+    """Store {order_id: message_id} with a single executemany UPDATE"""
+    if not message_ids:
+        return
+    session.execute(
+        update(Order),
+        [{'id': order_id, 'message_id': message_id} for order_id, message_id in message_ids.items()]
+    )
+    session.commit()
+
+_CURSOR_TS_FORMAT = "%Y%m%d%H%M%S%f"
+_STATUSES = list(OrderStatus)
+
+def encode_cursor(*values):
+    """Pack keyset values into a short token that fits into callback_data"""
+    parts = []
+    for value in values:
+        if isinstance(value, OrderStatus):
+            parts.append(str(_STATUSES.index(value)))
+        elif isinstance(value, datetime):
+            parts.append(value.strftime(_CURSOR_TS_FORMAT))
+        else:
+            parts.append(str(value))
+    return "-".join(parts)
+
+def decode_cursor(token, kinds):
+    values = []
+    for kind, part in zip(kinds, token.split("-")):
+        if kind is OrderStatus:
+            values.append(_STATUSES[int(part)])
+        elif kind is datetime:
+            values.append(datetime.strptime(part, _CURSOR_TS_FORMAT))
+        else:
+            values.append(kind(part))
+    return tuple(values)
+
+def _sort_value(value):
+    # Enums are stored and compared by name in SQL
+    return value.name if isinstance(value, OrderStatus) else value
+
+def load_orders_page(session, criteria, keyset, cursor=None, backward=False, descending=False,
+                     limit=ORDERS_PAGE_SIZE, models=(Order,)):
+    """
+    Keyset-paginated order list
+
+    Args:
+        criteria: функция model -> фильтры списка, например lambda m: (m.status.in_(...),)
+        keyset: имена колонок уникального ключа сортировки, например ('status', 'created_at', 'id')
+        cursor: значения keyset крайней заявки соседней страницы
+        backward: True - страница перед cursor, False - после него
+        descending: порядок отображения списка
+        models: таблицы списка; ORDER_MODELS - вместе с архивом
+
+    Returns:
+        tuple: (список заявок страницы, общее количество заявок)
+    """
+    scan_desc = descending != backward
+
+    orders = []
+    total = 0
+    for model in models:
+        columns = [getattr(model, name) for name in keyset]
+        query = select(model).options(*order_card_options(model)).where(*criteria(model))
+        if cursor is not None:
+            bound = tuple_(*(literal(value, column.type) for column, value in zip(columns, cursor)))
+            key = tuple_(*columns)
+            query = query.where(key < bound if scan_desc else key > bound)
+        query = query.order_by(*[column.desc() if scan_desc else column.asc() for column in columns]).limit(limit)
+        orders += session.scalars(query).unique().all()
+        total += session.scalar(select(func.count()).select_from(model).where(*criteria(model)))
+
+    if len(models) > 1:
+        # Every table gave its first `limit` rows past the cursor; the page is the first `limit` of them all
+        orders.sort(key=lambda order: tuple(_sort_value(getattr(order, name)) for name in keyset), reverse=scan_desc)
+        del orders[limit:]
+    if backward:
+        orders.reverse()
+    return orders, total
@@ -4,20 +4,26 @@ from functools import wraps
 from aiogram import types
 from aiogram.exceptions import TelegramAPIError
 
+from utils.metrics import HANDLER_ERRORS, handler_name
+
 logger = logging.getLogger(__name__)
 
 def handle_errors(func):
+    name = handler_name(func)
+
     @wraps(func)
     async def wrapper(*args, **kwargs):
         try:
             return await func(*args, **kwargs)
         except TelegramAPIError as e:
+            HANDLER_ERRORS.inc(handler=name)
             logger.error(f"Telegram API Error: {e}")
             for arg in args:
                 if isinstance(arg, types.Message):
                     await arg.answer("Произошла ошибка при обработке запроса. Попробуйте позже.")
                     break
         except Exception as e:
+            HANDLER_ERRORS.inc(handler=name)
             error_msg = f"Необработанная ошибка: {e}\n{traceback.format_exc()}"
             logger.error(error_msg)
             for arg in args:
@@ -1,43 +1,215 @@
 # utils/logger.py
 
+import atexit
+import json
 import logging
+import multiprocessing
 import os
-from logging.handlers import RotatingFileHandler
-from config import LOG_LEVELS, LOG_LEVEL, LOG_FILE, BASE_DIR
+import queue
+import random
+from contextvars import ContextVar
+from datetime import datetime
+from logging.handlers import QueueHandler, QueueListener, RotatingFileHandler
 
-_loggers = {}
+from config import (
+    BASE_DIR, LOG_CONSOLE_FORMAT, LOG_FILE, LOG_FORMAT, LOG_LEVEL, LOG_LEVELS,
+    LOG_QUEUE_SIZE, LOG_SAMPLE_RATE
+)
 
-def setup_logger(name=None):
+TEXT_FORMAT = '%(asctime)s - %(name)s - %(levelname)s - %(message)s'
+CONTEXT_FIELDS = ('update_id', 'user_id', 'order_id')
+# Loggers that write one INFO line per update
+SAMPLED_LOGGERS = ('aiogram.event', 'aiohttp.access')
+
+# update_id / user_id of the update being handled, order_id once a handler knows it
+log_context = ContextVar('log_context', default={})
+
+
+def bind_log_context(**fields):
+    """Add fields to every record logged later while handling this update"""
+    log_context.set({**log_context.get(), **fields})
+
+
+class ContextFilter(logging.Filter):
+    """Copies log_context onto the record in the logging thread"""
+
+    def filter(self, record):
+        for field, value in log_context.get().items():
+            if not hasattr(record, field):
+                setattr(record, field, value)
+        return True
+
+
+class SamplingFilter(logging.Filter):
     """
-    Настраивает и возвращает логгер с заданным именем
+    Keeps `rate` of the per-update records: those logged with
+    extra={'sampled': True} and those of SAMPLED_LOGGERS below WARNING
     """
-    if name in _loggers:
-        return _loggers[name]
 
-    logger = logging.getLogger(name)
-    logger.setLevel(LOG_LEVELS.get(LOG_LEVEL, logging.INFO))
-    logger.propagate = False
+    def __init__(self, rate):
+        super().__init__()
+        self.rate = rate
 
-    if not logger.handlers:
-        log_dir = os.path.join(BASE_DIR, 'logs')
-        os.makedirs(log_dir, exist_ok=True)
+    def filter(self, record):
+        if getattr(record, 'sampled', False) or (
+            record.levelno < logging.WARNING and record.name in SAMPLED_LOGGERS
+        ):
+            return random.random() < self.rate
+        return True
 
-        log_path = os.path.join(log_dir, LOG_FILE)
 
-        formatter = logging.Formatter('%(asctime)s - %(name)s - %(levelname)s - %(message)s')
+class NonBlockingQueueHandler(QueueHandler):
+    """
+    Puts records on a bounded queue and never waits: when the writer falls
+    behind, records are dropped and counted instead of stalling the event loop
+    """
 
-        file_handler = RotatingFileHandler(
-            log_path,
-            maxBytes=10 * 1024 * 1024,
-            backupCount=5
+    def __init__(self, log_queue):
+        super().__init__(log_queue)
+        self.dropped = 0
+
+    def prepare(self, record):
+        # Render message and traceback here, the record may cross a process boundary
+        record = logging.makeLogRecord(record.__dict__)
+        record.msg = record.getMessage()
+        record.args = None
+        if record.exc_info:
+            record.exc_text = record.exc_text or logging.Formatter().formatException(record.exc_info)
+            record.exc_info = None
+        return record
+
+    def enqueue(self, record):
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            self.dropped += 1
+
+
+class JsonFormatter(logging.Formatter):
+    def format(self, record):
+        entry = {
+            'ts': datetime.fromtimestamp(record.created).astimezone().isoformat(timespec='milliseconds'),
+            'level': record.levelname,
+            'logger': record.name,
+            'process': record.processName,
+            'message': record.getMessage(),
+        }
+        for field in CONTEXT_FIELDS:
+            value = getattr(record, field, None)
+            if value is not None:
+                entry[field] = value
+        if record.exc_info and not record.exc_text:
+            record.exc_text = self.formatException(record.exc_info)
+        if record.exc_text:
+            entry['exc'] = record.exc_text
+        return json.dumps(entry, ensure_ascii=False, default=str)
+
+
+class TextFormatter(logging.Formatter):
+    def __init__(self):
+        super().__init__(TEXT_FORMAT)
+
+    def formatMessage(self, record):
+        line = super().formatMessage(record)
+        context = ' '.join(
+            f"{field}={getattr(record, field)}" for field in CONTEXT_FIELDS
+            if getattr(record, field, None) is not None
         )
-        file_handler.setFormatter(formatter)
+        return f"{line} [{context}]" if context else line
+
+
+def _formatter(kind):
+    return JsonFormatter() if kind == 'json' else TextFormatter()
+
+
+_queue_handler = None
+_output_handlers = []
+_listeners = []
 
-        console_handler = logging.StreamHandler()
-        console_handler.setFormatter(formatter)
 
-        logger.addHandler(file_handler)
-        logger.addHandler(console_handler)
+def _build_output_handlers():
+    log_dir = os.path.join(BASE_DIR, 'logs')
+    os.makedirs(log_dir, exist_ok=True)
 
-    _loggers[name] = logger
-    return logger
+    file_handler = RotatingFileHandler(
+        os.path.join(log_dir, LOG_FILE),
+        maxBytes=10 * 1024 * 1024,
+        backupCount=5,
+        encoding='utf-8'
+    )
+    file_handler.setFormatter(_formatter(LOG_FORMAT))
+
+    console_handler = logging.StreamHandler()
+    console_handler.setFormatter(_formatter(LOG_CONSOLE_FORMAT))
+    return [file_handler, console_handler]
+
+
+def configure_logging():
+    """
+    Route the root logger through a queue; a QueueListener thread owns the
+    file and console handlers, so formatting, disk I/O and rotation never
+    happen on the event loop. Safe to call more than once.
+
+    In a child process (a cluster worker, which runs this at import) no
+    handler is opened: records wait on the queue until forward_logs()
+    hands them to the parent, the only process that writes the log file.
+    """
+    global _queue_handler
+    if _queue_handler is not None:
+        return
+
+    _queue_handler = NonBlockingQueueHandler(queue.Queue(LOG_QUEUE_SIZE))
+    _queue_handler.addFilter(SamplingFilter(LOG_SAMPLE_RATE))
+    _queue_handler.addFilter(ContextFilter())
+
+    root = logging.getLogger()
+    root.setLevel(LOG_LEVELS.get(LOG_LEVEL, logging.INFO))
+    root.addHandler(_queue_handler)
+
+    if multiprocessing.parent_process() is None:
+        _output_handlers.extend(_build_output_handlers())
+        listen(_queue_handler.queue)
+    atexit.register(stop_logging)
+
+
+def listen(log_queue):
+    """Write the records arriving on log_queue, e.g. from worker processes"""
+    listener = QueueListener(log_queue, *_output_handlers)
+    listener.start()
+    _listeners.append(listener)
+    return listener
+
+
+def forward_logs(log_queue):
+    """Send this process's records to another process's listener instead of writing them"""
+    configure_logging()
+    stop_logging()
+    while _output_handlers:
+        _output_handlers.pop().close()
+
+    pending, _queue_handler.queue = _queue_handler.queue, log_queue
+    # Records logged before this call, e.g. at import
+    while True:
+        try:
+            _queue_handler.enqueue(pending.get_nowait())
+        except queue.Empty:
+            break
+
+
+def stop_logging():
+    """Write out queued records and stop the listener threads"""
+    if _queue_handler is not None and _queue_handler.dropped:
+        logging.getLogger(__name__).warning(
+            f"Log queue overflow: dropped {_queue_handler.dropped} records"
+        )
+        _queue_handler.dropped = 0
+    while _listeners:
+        _listeners.pop().stop()
+
+
+def setup_logger(name=None):
+    """
+    Настраивает и возвращает логгер с заданным именем
+    """
+    configure_logging()
+    return logging.getLogger(name)
@@ -0,0 +1,184 @@
+# utils/metrics.py
+
+import threading
+import time
+from contextvars import ContextVar
+
+from aiohttp import web
+from sqlalchemy import event
+
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+REGISTRY = []
+
+
+def _escape(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def _format_labels(names, values, extra=()):
+    pairs = [f'{name}="{_escape(value)}"' for name, value in zip(names, values)]
+    pairs.extend(f'{name}="{value}"' for name, value in extra)
+    return '{' + ','.join(pairs) + '}' if pairs else ''
+
+
+class _Metric:
+    type = None
+
+    def __init__(self, name, documentation, labelnames=()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._values = {}
+        self._lock = threading.Lock()
+        REGISTRY.append(self)
+
+    def _key(self, labels):
+        return tuple(str(labels.get(name, '')) for name in self.labelnames)
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} {self.type}"]
+        with self._lock:
+            items = [(key, self._snapshot(value)) for key, value in self._values.items()]
+        for key, value in sorted(items):
+            lines.extend(self._render_sample(key, value))
+        return lines
+
+    def _snapshot(self, value):
+        return value
+
+
+class Counter(_Metric):
+    """Monotonic counter, exposed as <name>_total"""
+    type = 'counter'
+
+    def inc(self, amount=1, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def _render_sample(self, key, value):
+        yield f"{self.name}_total{_format_labels(self.labelnames, key)} {value}"
+
+
+class Histogram(_Metric):
+    type = 'histogram'
+
+    def __init__(self, name, documentation, labelnames=(), buckets=DEFAULT_BUCKETS):
+        super().__init__(name, documentation, labelnames)
+        self.buckets = tuple(buckets)
+
+    def observe(self, value, **labels):
+        key = self._key(labels)
+        with self._lock:
+            # per-bucket counts, then total count and sum
+            state = self._values.get(key)
+            if state is None:
+                state = self._values[key] = [0] * len(self.buckets) + [0, 0.0]
+            for index, bound in enumerate(self.buckets):
+                if value <= bound:
+                    state[index] += 1
+                    break
+            state[-2] += 1
+            state[-1] += value
+
+    def _snapshot(self, value):
+        return list(value)
+
+    def _render_sample(self, key, state):
+        cumulative = 0
+        for bound, count in zip(self.buckets, state):
+            cumulative += count
+            yield f"{self.name}_bucket{_format_labels(self.labelnames, key, (('le', bound),))} {cumulative}"
+        yield f"{self.name}_bucket{_format_labels(self.labelnames, key, (('le', '+Inf'),))} {state[-2]}"
+        yield f"{self.name}_count{_format_labels(self.labelnames, key)} {state[-2]}"
+        yield f"{self.name}_sum{_format_labels(self.labelnames, key)} {state[-1]}"
+
+
+def render_metrics():
+    lines = []
+    for metric in REGISTRY:
+        lines.extend(metric.render())
+    return '\n'.join(lines) + '\n'
+
+
+HANDLER_DURATION = Histogram(
+    'changify_handler_duration_seconds', 'Time spent in a handler, middlewares included', ('handler',)
+)
+HANDLER_ERRORS = Counter(
+    'changify_handler_errors', 'Exceptions raised by handlers', ('handler',)
+)
+HANDLER_DB_QUERIES = Histogram(
+    'changify_handler_db_queries', 'SQL statements executed per handled update', ('handler',),
+    buckets=(0, 1, 2, 3, 5, 8, 13, 21, 34, 55)
+)
+HANDLER_DB_SECONDS = Counter(
+    'changify_handler_db_seconds', 'Time spent in SQL statements per handler', ('handler',)
+)
+DB_QUERY_DURATION = Histogram(
+    'changify_db_query_duration_seconds', 'SQL statement execution time'
+)
+TELEGRAM_API_DURATION = Histogram(
+    'changify_telegram_api_duration_seconds', 'Bot API request latency', ('method',)
+)
+TELEGRAM_API_ERRORS = Counter(
+    'changify_telegram_api_errors', 'Failed Bot API requests', ('method', 'error')
+)
+
+
+def handler_name(callback):
+    """manager.cmd_orders for handlers.manager.cmd_orders"""
+    return f"{callback.__module__.rsplit('.', 1)[-1]}.{callback.__name__}"
+
+
+class HandlerStats:
+    __slots__ = ('queries', 'db_seconds')
+
+    def __init__(self):
+        self.queries = 0
+        self.db_seconds = 0.0
+
+
+# Set by MetricsMiddleware; DB threads see it through the copied context
+current_handler_stats = ContextVar('current_handler_stats', default=None)
+
+
+def instrument_engine(engine):
+    """Time every SQL statement and attribute it to the running handler"""
+
+    @event.listens_for(engine, "before_cursor_execute")
+    def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+        conn.info.setdefault('query_started', []).append(time.perf_counter())
+
+    @event.listens_for(engine, "after_cursor_execute")
+    def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+        elapsed = time.perf_counter() - conn.info['query_started'].pop()
+        DB_QUERY_DURATION.observe(elapsed)
+        stats = current_handler_stats.get()
+        if stats is not None:
+            stats.queries += 1
+            stats.db_seconds += elapsed
+
+    @event.listens_for(engine, "handle_error")
+    def _handle_error(context):
+        # A failed statement never reaches after_cursor_execute
+        if context.connection is not None and context.connection.info.get('query_started'):
+            context.connection.info['query_started'].pop()
+
+    return engine
+
+
+async def start_metrics_server(host, port):
+    """Serve render_metrics() on http://host:port/metrics; returns the runner to clean up"""
+    async def metrics(request):
+        return web.Response(
+            body=render_metrics().encode(),
+            headers={'Content-Type': 'text/plain; version=0.0.4; charset=utf-8'}
+        )
+
+    app = web.Application()
+    app.router.add_get('/metrics', metrics)
+    runner = web.AppRunner(app, access_log=None)
+    await runner.setup()
+    await web.TCPSite(runner, host, port).start()
+    return runner
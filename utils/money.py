@@ -0,0 +1,170 @@
+"""
+Exact money arithmetic
+
+Amounts and rates are Decimal in Python and fixed-point integers in the
+database: FixedPoint(scale) stores value * 10**scale in a BIGINT column,
+so the stored numbers are exact on every backend (SQLite would keep a
+NUMERIC as a binary float) and SUM/AVG run in the database on integers.
+
+Amounts are rounded to the minor unit of their currency, rates to
+RATE_SCALE digits. The *_minor_units helpers convert whole columns at
+once for reports.
+"""
+from decimal import ROUND_DOWN, ROUND_HALF_EVEN, Decimal, InvalidOperation
+
+import numpy as np
+from sqlalchemy import BigInteger
+from sqlalchemy.types import TypeDecorator
+
+# Digits kept in the database
+AMOUNT_SCALE = 8
+RATE_SCALE = 10
+
+# Digits after the point of one minor unit, per currency
+CURRENCY_EXPONENTS = {
+    "UAH": 2,
+    "USD": 2,
+    "EUR": 2,
+    "USDT": 6,
+    "BTC": 8,
+}
+DEFAULT_EXPONENT = 2
+
+_RATE_QUANTUM = Decimal(1).scaleb(-RATE_SCALE)
+
+
+class FixedPoint(TypeDecorator):
+    """Decimal stored as an integer number of 10**-scale units"""
+    impl = BigInteger
+    cache_ok = True
+
+    def __init__(self, scale):
+        super().__init__()
+        self.scale = scale
+
+    def process_bind_param(self, value, dialect):
+        if value is None:
+            return None
+        return int(to_decimal(value).scaleb(self.scale).to_integral_value(ROUND_HALF_EVEN))
+
+    def process_result_value(self, value, dialect):
+        if value is None:
+            return None
+        # AVG and friends come back as floats or Decimals, not integers
+        return _normalize(Decimal(value if isinstance(value, int) else str(value)).scaleb(-self.scale))
+
+
+def _normalize(value):
+    """100.00000000 -> 100, keeps 10.50 as 10.5, never switches to exponent notation"""
+    value = value.normalize()
+    return value.quantize(Decimal(1)) if value == value.to_integral_value() else value
+
+
+def to_decimal(value):
+    """Decimal from a Decimal, int, float or numeric string; floats go through str to drop binary noise"""
+    if isinstance(value, Decimal):
+        return value
+    if isinstance(value, float):
+        return Decimal(repr(value))
+    return Decimal(value)
+
+
+def currency_exponent(currency_code):
+    return CURRENCY_EXPONENTS.get(currency_code, DEFAULT_EXPONENT)
+
+
+def quantize_amount(amount, currency_code, rounding=ROUND_HALF_EVEN):
+    return to_decimal(amount).quantize(Decimal(1).scaleb(-currency_exponent(currency_code)), rounding=rounding)
+
+
+def parse_amount(text, currency_code):
+    """
+    Amount typed by a user: "100", "100.50" or "100,50"
+
+    Raises ValueError when the text is not a positive number with at most
+    the currency's number of decimals.
+    """
+    try:
+        amount = Decimal(text.strip().replace(',', '.').replace(' ', ''))
+    except InvalidOperation:
+        raise ValueError(f"Not a number: {text!r}")
+    if not amount.is_finite() or amount <= 0:
+        raise ValueError("Amount must be positive")
+    if quantize_amount(amount, currency_code) != amount:
+        raise ValueError(f"Too many decimals for {currency_code}")
+    return _normalize(amount)
+
+
+def quantize_rate(rate):
+    return _normalize(to_decimal(rate).quantize(_RATE_QUANTUM, rounding=ROUND_HALF_EVEN))
+
+
+def invert_rate(rate):
+    """Rate of the opposite direction, 1 / rate rounded to RATE_SCALE digits"""
+    return quantize_rate(Decimal(1) / to_decimal(rate))
+
+
+def convert(amount, rate, to_currency_code):
+    """
+    amount * rate in the target currency
+
+    Rounded down to its minor unit: the customer is never promised a
+    fraction more than the rate gives.
+    """
+    return _normalize(quantize_amount(to_decimal(amount) * to_decimal(rate), to_currency_code, ROUND_DOWN))
+
+
+def to_minor_units(amounts, scale=AMOUNT_SCALE):
+    """Sequence of amounts -> int64 array of 10**-scale units"""
+    return np.fromiter(
+        (int(to_decimal(amount).scaleb(scale).to_integral_value(ROUND_HALF_EVEN)) for amount in amounts),
+        dtype=np.int64
+    )
+
+
+def minor_units_to_float(units, scale=AMOUNT_SCALE):
+    """Integer units (raw FixedPoint column values) -> float64 array, for charts and statistics"""
+    return np.asarray(units, dtype=np.int64) / float(10 ** scale)
+
+
+def minor_units_to_decimal(units, scale=AMOUNT_SCALE):
+    """Integer units -> exact Decimals"""
+    return [Decimal(int(unit)).scaleb(-scale) for unit in units]
+
+
+def format_minor_units(units, scale=AMOUNT_SCALE):
+    """
+    Integer units -> array of exact decimal strings, trailing zeros dropped
+
+    417029000000 at scale 8 -> '4170.29'. Works on int64 and on object
+    arrays of Python integers (sums too large for int64).
+    """
+    units = np.asarray(units)
+    if not units.size:
+        return units.astype(str)
+    magnitude = np.abs(units)
+    # // and % rather than np.divmod, which has no loop for object arrays
+    whole, fraction = magnitude // 10 ** scale, magnitude % 10 ** scale
+    text = np.char.add(np.char.add(whole.astype(str), '.'), np.char.zfill(fraction.astype(str), scale))
+    text = np.char.rstrip(np.char.rstrip(text, '0'), '.')
+    return np.where(units < 0, np.char.add('-', text), text)
+
+
+def convert_minor_units(units, rate, from_scale=AMOUNT_SCALE, to_scale=AMOUNT_SCALE):
+    """
+    Convert a whole column of integer amounts with one rate, exactly
+
+    The rate is applied as an integer fraction; results are rounded down
+    like convert(). Falls back to Python integers when the products
+    would not fit into int64.
+    """
+    numerator, denominator = to_decimal(rate).as_integer_ratio()
+    shift = to_scale - from_scale
+    if shift >= 0:
+        numerator *= 10 ** shift
+    else:
+        denominator *= 10 ** -shift
+    units = np.asarray(units, dtype=np.int64)
+    if units.size and int(np.abs(units).max()) * abs(numerator) >= 2 ** 63:
+        units = units.astype(object)
+    return units * numerator // denominator
@@ -0,0 +1,317 @@
+"""
+Order texts shown to customers and managers
+
+Every view of an order is a set of templates prepared once at import.
+Rendered cards are memoized per (order, view): a card is reused while the
+order's status, updated_at and details, and for views showing the customer
+the customer's names, are unchanged, so repeated views and manager
+fan-outs cost no formatting and no related-row queries.
+Handlers that change an order drop its cards with invalidate_order_card;
+the fingerprint also catches changes made by another process.
+
+Currency codes and bank names come from the reference data snapshot, and
+the customer from the profile cache filled by UserMiddleware.
+"""
+from collections import OrderedDict
+from typing import NamedTuple, Optional
+
+from sqlalchemy import select
+
+from config import ORDER_CARD_CACHE_SIZE
+from database.models import ORDER_STATUS_LABELS, OrderStatus, User
+from services.reference_data import reference_data
+from services.user_activity import profile_cache
+
+ORDER_STATUS_EMOJI = {
+    OrderStatus.CREATED: "🆕",
+    OrderStatus.AWAITING_PAYMENT: "⏳",
+    OrderStatus.PAYMENT_CONFIRMED: "✅",
+    OrderStatus.PROCESSING: "⚙️",
+    OrderStatus.COMPLETED: "✅",
+    OrderStatus.CANCELLED: "❌",
+}
+
+
+class CardView:
+    """
+    Templates of one view. A part given as (field, template) is only
+    rendered when that field is truthy.
+    """
+
+    def __init__(self, name, *parts, needs_customer=False):
+        self.name = name
+        self.needs_customer = needs_customer
+        self._parts = [
+            (None, part.format_map) if isinstance(part, str) else (part[0], part[1].format_map)
+            for part in parts
+        ]
+
+    def render(self, fields):
+        return ''.join(render(fields) for field, render in self._parts if field is None or fields[field])
+
+
+_CUSTOMER = "{first_name} {last_name} (@{username}, ID: {telegram_id})\n"
+
+MANAGER_CARD = CardView(
+    'manager_card',
+    "{emoji} <b>Заявка #{id}</b>\n\n"
+    "Користувач: " + _CUSTOMER +
+    "Обмін: {amount_from} {from_code} → {amount_to:.2f} {to_code}\n"
+    "Курс: 1 {from_code} = {rate:.2f} {to_code}\n",
+    ('bank_name', "Банк: {bank_name}\n"),
+    "Реквізити клієнта: <code>{details}</code>\n",
+    ('manager_payment_details', "Платіжні реквізити менеджера: <code>{manager_payment_details}</code>\n"),
+    "Дата створення: {created}\n"
+    "Статус: {status_label}\n",
+    needs_customer=True
+)
+
+MANAGER_ROW = CardView(
+    'manager_row',
+    "{emoji} <b>#{id}</b> {amount_from} {from_code} → {amount_to:.2f} {to_code}\n"
+    "   {first_name} (@{username}), {created}\n",
+    needs_customer=True
+)
+
+COMPLETED_ROW = CardView(
+    'completed_row',
+    "<b>Заявка #{id}</b> ({completed})\n"
+    "Користувач: {first_name} (@{username})\n"
+    "Обмін: {amount_from} {from_code} → {amount_to:.2f} {to_code}\n\n",
+    needs_customer=True
+)
+
+NEW_ORDER_NOTICE = CardView(
+    'new_order_notice',
+    "🆕 <b>Нова заявка #{id}</b>\n\n"
+    "👤 Користувач: " + _CUSTOMER +
+    "💱 Обмін: {amount_from} {from_code} → {amount_to:.2f} {to_code}\n"
+    "📊 Курс: 1 {from_code} = {rate:.2f} {to_code}\n",
+    ('bank_name', "🏦 Банк: {bank_name}\n"),
+    "📝 Реквізити: <code>{details}</code>\n"
+    "📅 Дата: {created}\n"
+    "⏳ Статус: {status_value}",
+    needs_customer=True
+)
+
+PAID_NOTICE = CardView(
+    'paid_notice',
+    "💰 <b>Клієнт підтвердив оплату по заявці #{id}</b>\n\n"
+    "👤 " + _CUSTOMER +
+    "💱 Обмін: {amount_from} {from_code} → {amount_to:.2f} {to_code}\n"
+    "📊 Курс: 1 {from_code} = {rate:.2f} {to_code}\n",
+    ('bank_name', "🏦 Банк: {bank_name}\n"),
+    "📝 Реквізити: <code>{details}</code>\n"
+    "📅 Дата створення: {created}\n"
+    "⏳ Новий статус: {status_value}",
+    needs_customer=True
+)
+
+CREATED_CONFIRMATION = CardView(
+    'created_confirmation',
+    "✅ <b>Заявка #{id} створена!</b>\n\n"
+    "💱 Обмін: {amount_from} {from_code} → {amount_to:.2f} {to_code}\n"
+    "📊 Курс: 1 {from_code} = {rate:.2f} {to_code}\n",
+    ('bank_name', "🏦 Банк: {bank_name}\n"),
+    "📝 Реквізити: {details}\n\n"
+    "Для завершення обміну вам потрібно буде відправити {amount_from} {from_code} "
+    "на вказані реквізити після підтвердження заявки менеджером.\n\n"
+    "Статус заявки ви можете перевірити в розділі '📋 Історія'."
+)
+
+CUSTOMER_DETAILS = CardView(
+    'customer_details',
+    "📋 <b>Деталі заявки #{id}</b>\n\n"
+    "Дата створення: {created}\n"
+    "Напрямок: {from_code} → {to_code}\n"
+    "Сума: {amount_from:.2f} {from_code} → {amount_to:.2f} {to_code}\n"
+    "Курс: 1 {from_code} = {rate:.2f} {to_code}\n",
+    ('bank_name', "Банк: {bank_name}\n"),
+    ('details', "Реквізити: <code>{details}</code>\n"),
+    "Статус: {status_label}\n",
+    ('awaiting_payment',
+     "\n<b>Інструкції для оплати:</b>\n"
+     "1. Відправте вказану суму на реквізити:\n"
+     "<code>Будуть надані менеджером</code>\n"
+     "2. Після оплати натисніть кнопку 'Я оплатив'\n"
+     "3. Дочекайтесь підтвердження від менеджера")
+)
+
+CUSTOMER_ROW = CardView(
+    'customer_row',
+    "<b>Заявка #{id}</b> ({created})\n"
+    "Напрямок: {from_code} → {to_code}\n"
+    "Сума: {amount_from:.2f} {from_code} → {amount_to:.2f} {to_code}\n"
+    "Статус: {emoji} {status_label}\n\n"
+)
+
+HISTORY_ROW = CardView(
+    'history_row',
+    "<b>Заявка #{id}</b> {emoji}\n"
+    "📅 {created}\n"
+    "💱 {amount_from} {from_code} → {amount_to} {to_code}\n"
+    "📊 Курс: {rate:.2f}\n"
+    "📑 Статус: {status_label}\n\n"
+)
+
+
+class CardRefs(NamedTuple):
+    """Related values a card shows besides the order columns"""
+    from_code: str
+    to_code: str
+    bank_name: Optional[str] = None
+    first_name: str = ''
+    last_name: str = ''
+    username: Optional[str] = None
+
+    @classmethod
+    def from_order(cls, order):
+        """From an order loaded with utils.db_utils.order_card_options()"""
+        customer = order.customer
+        return cls(
+            _currency_code(order.from_currency, order.from_currency_id),
+            _currency_code(order.to_currency, order.to_currency_id),
+            order.bank.name if order.bank else None,
+            *_customer_names(customer)
+        )
+
+    def customer_key(self, view):
+        """What of these refs a cached card of `view` depends on besides the order"""
+        return (self.first_name, self.last_name, self.username) if view.needs_customer else None
+
+
+def _currency_code(currency, currency_id):
+    # A deleted currency shows as '#id', as in the exports
+    return currency.code if currency is not None else f"#{currency_id}"
+
+
+def _customer_names(customer):
+    if customer is None:
+        return '', '', None
+    if isinstance(customer, dict):
+        return customer.get('first_name') or '', customer.get('last_name') or '', customer.get('username')
+    return customer.first_name or '', customer.last_name or '', customer.username
+
+
+def render_order(order, view, refs):
+    return view.render({
+        'id': order.id,
+        'emoji': ORDER_STATUS_EMOJI.get(order.status, "❓"),
+        'status_label': ORDER_STATUS_LABELS[order.status],
+        'status_value': order.status.value,
+        'awaiting_payment': order.status == OrderStatus.AWAITING_PAYMENT,
+        'amount_from': order.amount_from,
+        'amount_to': order.amount_to,
+        'rate': order.rate,
+        'created': order.created_at.strftime('%d.%m.%Y %H:%M'),
+        'completed': order.completed_at.strftime('%d.%m.%Y %H:%M') if order.completed_at else '',
+        'details': order.details,
+        'manager_payment_details': order.manager_payment_details,
+        'telegram_id': order.user_id,
+        'from_code': refs.from_code,
+        'to_code': refs.to_code,
+        'bank_name': refs.bank_name,
+        'first_name': refs.first_name,
+        'last_name': refs.last_name,
+        'username': refs.username or 'немає',
+    })
+
+
+class OrderCardCache:
+    """
+    LRU of rendered cards: (order_id, view name) -> (fingerprint, text)
+
+    `customer` is the customer's names for views that show them (see
+    CardRefs.customer_key), so a card is not reused after a rename;
+    None for the other views.
+    """
+
+    def __init__(self, size=ORDER_CARD_CACHE_SIZE):
+        self.size = size
+        self.hits = 0
+        self.misses = 0
+        self._cards = OrderedDict()
+
+    @staticmethod
+    def _fingerprint(order, customer):
+        return order.status, order.updated_at, order.details, order.manager_payment_details, customer
+
+    def get(self, order, view, customer=None):
+        key = (order.id, view.name)
+        entry = self._cards.get(key)
+        if entry is not None and entry[0] == self._fingerprint(order, customer):
+            self._cards.move_to_end(key)
+            self.hits += 1
+            return entry[1]
+        self.misses += 1
+        return None
+
+    def put(self, order, view, text, customer=None):
+        self._cards[(order.id, view.name)] = (self._fingerprint(order, customer), text)
+        while len(self._cards) > self.size:
+            self._cards.popitem(last=False)
+        return text
+
+    def invalidate(self, order_id=None):
+        if order_id is None:
+            self._cards.clear()
+            return
+        for key in [key for key in self._cards if key[0] == order_id]:
+            del self._cards[key]
+
+
+card_cache = OrderCardCache()
+
+async def _get_snapshot(order):
+    snapshot = reference_data.snapshot
+    if snapshot.currency_by_id(order.from_currency_id) is None or snapshot.currency_by_id(order.to_currency_id) is None \
+            or (order.bank_id and snapshot.bank(order.bank_id) is None):
+        # Added by another process since the last refresh
+        await reference_data.refresh()
+        snapshot = reference_data.snapshot
+    return snapshot
+
+
+async def load_card_refs(session, order, customer=True):
+    """Currency codes, bank name and, if asked, the customer's names of an order"""
+    snapshot = await _get_snapshot(order)
+    names = ('', '', None)
+    if customer:
+        profile = profile_cache.get(order.user_id, None)
+        if profile is None:
+            profile = await session.scalar(select(User).where(User.telegram_id == order.user_id))
+        names = _customer_names(profile)
+    bank = snapshot.bank(order.bank_id) if order.bank_id else None
+    return CardRefs(
+        _currency_code(snapshot.currency_by_id(order.from_currency_id), order.from_currency_id),
+        _currency_code(snapshot.currency_by_id(order.to_currency_id), order.to_currency_id),
+        bank.name if bank else None,
+        *names
+    )
+
+
+async def order_card(session, order, view):
+    """Rendered `view` of an order, from the cache when it is still current"""
+    if view.needs_customer:
+        profile = profile_cache.get(order.user_id, None)
+        # Without a cached profile the names have to be read anyway
+        text = card_cache.get(order, view, _customer_names(profile)) if profile is not None else None
+    else:
+        text = card_cache.get(order, view)
+    if text is None:
+        refs = await load_card_refs(session, order, view.needs_customer)
+        text = card_cache.put(order, view, render_order(order, view, refs), refs.customer_key(view))
+    return text
+
+
+def loaded_order_card(order, view):
+    """Same as order_card for an order loaded with its relations"""
+    refs = CardRefs.from_order(order)
+    text = card_cache.get(order, view, refs.customer_key(view))
+    if text is None:
+        text = card_cache.put(order, view, render_order(order, view, refs), refs.customer_key(view))
+    return text
+
+
+def invalidate_order_card(order_id):
+    card_cache.invalidate(order_id)